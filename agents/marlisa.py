@@ -1,12 +1,15 @@
 from common.preprocessing import *
-from common.rl import *
-from sklearn.linear_model import LinearRegression
-from sklearn.decomposition import PCA
-from sklearn.ensemble import GradientBoostingRegressor
-import torch.optim as optim
-from torch.optim import Adam
+from common.lazy import LazyModule
 import json
 
+# torch and sklearn are only imported when an agent is instantiated, so that importing this module only requires numpy
+torch = LazyModule('torch')
+nn = LazyModule('torch.nn')
+optim = LazyModule('torch.optim')
+linear_model = LazyModule('sklearn.linear_model')
+decomposition = LazyModule('sklearn.decomposition')
+rl = LazyModule('common.rl')
+
 class MARLISA:
     def __init__(self, building_ids, 
                  buildings_states_actions, 
@@ -30,12 +33,20 @@ class MARLISA:
                  update_per_step = 1, 
                  iterations_as = 2, 
                  safe_exploration = False, 
+                 normalization_refresh = None, 
+                 replay_buffer_options = None, 
+                 regression_buffer_options = None, 
+                 prefetch = False, 
                  seed = 0):
         
         assert start_training > start_regression, 'start_training must be greater than start_regression'
         
-        with open(buildings_states_actions) as json_file:
-            self.buildings_states_actions = json.load(json_file)
+        # buildings_states_actions is the path to the JSON file with the states and actions of the buildings, or its dict (i.e. CityLearn.buildings_states_actions, for districts kept in memory)
+        if isinstance(buildings_states_actions, dict):
+            self.buildings_states_actions = buildings_states_actions
+        else:
+            with open(buildings_states_actions) as json_file:
+                self.buildings_states_actions = json.load(json_file)
             
         self.building_ids = building_ids
         self.start_training = start_training
@@ -51,6 +62,7 @@ class MARLISA:
         self.deterministic = False
         self.information_sharing = information_sharing
         self.update_per_step = update_per_step
+        self.normalization_refresh = normalization_refresh
         self.iterations_as = iterations_as
         self.safe_exploration = safe_exploration
         self.exploration_period = exploration_period
@@ -83,9 +95,9 @@ class MARLISA:
             self.energy_size_coef[uid] = self.energy_size_coef[uid]/self.total_coef
         
         
-        self.replay_buffer, self.reg_buffer, self.soft_q_net1, self.soft_q_net2, self.target_soft_q_net1, self.target_soft_q_net2, self.policy_net, self.soft_q_optimizer1, self.soft_q_optimizer2, self.policy_optimizer, self.target_entropy, self.alpha, self.log_alpha, self.alpha_optimizer, self.pca, self.encoder, self.encoder_reg, self.state_estimator, self.norm_mean, self.norm_std, self.r_norm_mean, self.r_norm_std, self.log_pi_tracker = {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}
+        self.replay_buffer, self.reg_buffer, self.soft_q_net1, self.soft_q_net2, self.target_soft_q_net1, self.target_soft_q_net2, self.policy_net, self.soft_q_optimizer1, self.soft_q_optimizer2, self.policy_optimizer, self.target_entropy, self.alpha, self.log_alpha, self.alpha_optimizer, self.pca, self.encoder, self.encoder_reg, self.state_estimator, self.norm_mean, self.norm_std, self.r_norm_mean, self.r_norm_std, self.log_pi_tracker, self.pca_transform = {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}
         for uid in building_ids:
-            self.state_estimator[uid] = LinearRegression()
+            self.state_estimator[uid] = linear_model.LinearRegression()
             self.critic1_loss_[uid], self.critic2_loss_[uid], self.actor_loss_[uid], self.alpha_loss_[uid], self.alpha_[uid], self.q_tracker[uid], self.log_pi_tracker[uid] = [], [], [], [], [], [], []
             self.encoder[uid] = []
             state_n = 0
@@ -110,22 +122,14 @@ class MARLISA:
 
             self.encoder[uid] = np.array(self.encoder[uid])
 
-            # If there is no solar PV installed, remove solar radiation variables 
-            if building_info[uid]['solar_power_capacity (kW)'] == 0:
-                for k in range(12,20):
-                    if self.encoder[uid][k] != 0:
-                        self.encoder[uid][k] = -1
-                if self.encoder[uid][24] != 0:
-                    self.encoder[uid][24] = -1
-            if building_info[uid]['Annual_DHW_demand (kWh)'] == 0 and self.encoder[uid][26] != 0:
-                self.encoder[uid][26] = -1
-            if building_info[uid]['Annual_cooling_demand (kWh)'] == 0 and self.encoder[uid][25] != 0:
-                self.encoder[uid][25] = -1
-            if building_info[uid]['Annual_nonshiftable_electrical_demand (kWh)'] == 0 and self.encoder[uid][23] != 0:
-                self.encoder[uid][23] = -1
+            # Remove the states of the devices and demands that the building does not have (i.e. the solar radiation if there is no solar PV installed). They are found by name, so that they can be anywhere in buildings_state_action_space.json
+            for k, s_name in enumerate(self.buildings_states_actions[uid]['states']):
+                if self.encoder[uid][k] != 0 and is_unavailable_state(s_name, building_info[uid]):
+                    self.encoder[uid][k] = -1
 
             self.encoder[uid] = self.encoder[uid][self.encoder[uid]!=0]
             self.encoder[uid][self.encoder[uid]==-1] = remove_feature()
+            self.encoder[uid] = CompiledEncoder(self.encoder[uid])
             
             
             # Defining the encoder that will transform the states used by the regression model to predict the net-electricity consumption
@@ -146,44 +150,37 @@ class MARLISA:
 
             self.encoder_reg[uid] = np.array(self.encoder_reg[uid])
 
-            # If there is no solar PV installed, remove solar radiation variables 
-            if building_info[uid]['solar_power_capacity (kW)'] == 0:
-                for k in range(12,20):
-                    if self.encoder_reg[uid][k] != 0:
-                        self.encoder_reg[uid][k] = -1
-                if self.encoder_reg[uid][24] != 0:
-                    self.encoder_reg[uid][24] = -1
-            if building_info[uid]['Annual_DHW_demand (kWh)'] == 0 and self.encoder_reg[uid][26] != 0:
-                self.encoder_reg[uid][26] = -1
-            if building_info[uid]['Annual_cooling_demand (kWh)'] == 0 and self.encoder_reg[uid][25] != 0:
-                self.encoder_reg[uid][25] = -1
-            if building_info[uid]['Annual_nonshiftable_electrical_demand (kWh)'] == 0 and self.encoder_reg[uid][23] != 0:
-                self.encoder_reg[uid][23] = -1
+            # Remove the states of the devices and demands that the building does not have (i.e. the solar radiation if there is no solar PV installed). They are found by name, so that they can be anywhere in buildings_state_action_space.json
+            for k, s_name in enumerate(self.buildings_states_actions[uid]['states']):
+                if self.encoder_reg[uid][k] != 0 and is_unavailable_state(s_name, building_info[uid]):
+                    self.encoder_reg[uid][k] = -1
 
             self.encoder_reg[uid] = self.encoder_reg[uid][self.encoder_reg[uid]!=0]
             self.encoder_reg[uid][self.encoder_reg[uid]==-1] = remove_feature()
+            self.encoder_reg[uid] = CompiledEncoder(self.encoder_reg[uid])
 
             
             # PCA will reduce the number of dimensions of the state space to 2/3 of its the original size
             if self.information_sharing:
-                state_dim = int((pca_compression)*(2 + len([j for j in np.hstack(self.encoder[uid]*np.ones(len(self.observation_spaces[uid].low))) if j != None])))
+                state_dim = int((pca_compression)*(2 + self.encoder[uid].output_dim))
             else:
-                state_dim = int((pca_compression)*(len([j for j in np.hstack(self.encoder[uid]*np.ones(len(self.observation_spaces[uid].low))) if j != None])))
+                state_dim = int((pca_compression)*(self.encoder[uid].output_dim))
                 
             action_dim = self.action_spaces[uid].shape[0]
             self.alpha[uid] = 0.2
             
-            self.pca[uid] = PCA(n_components = state_dim)
+            self.pca[uid] = decomposition.PCA(n_components = state_dim)
             
-            self.replay_buffer[uid] = ReplayBuffer(int(replay_buffer_capacity))
-            self.reg_buffer[uid] = RegressionBuffer(int(regression_buffer_capacity))
+            # Every replay buffer draws its batches with its own random generator, seeded from the seed of the agent
+            self.replay_buffer[uid] = rl.ReplayBuffer(int(replay_buffer_capacity), prefetch = prefetch, **dict({'seed': (seed, building_ids.index(uid))}, **(replay_buffer_options or {})))
+            self.reg_buffer[uid] = rl.RegressionBuffer(int(regression_buffer_capacity), **(regression_buffer_options or {}))
             
             # init networks
-            self.soft_q_net1[uid] = SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
-            self.soft_q_net2[uid] = SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
+            self.soft_q_net1[uid] = rl.SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
+            self.soft_q_net2[uid] = rl.SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
 
-            self.target_soft_q_net1[uid] = SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
-            self.target_soft_q_net2[uid] = SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
+            self.target_soft_q_net1[uid] = rl.SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
+            self.target_soft_q_net2[uid] = rl.SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
 
             for target_param, param in zip(self.target_soft_q_net1[uid].parameters(), self.soft_q_net1[uid].parameters()):
                 target_param.data.copy_(param.data)
@@ -193,7 +190,7 @@ class MARLISA:
 
 
             # Policy
-            self.policy_net[uid] = PolicyNetwork(state_dim, action_dim, self.action_spaces[uid], self.action_scaling_coef, hidden_dim).to(self.device)
+            self.policy_net[uid] = rl.PolicyNetwork(state_dim, action_dim, self.action_spaces[uid], self.action_scaling_coef, hidden_dim).to(self.device)
             self.soft_q_optimizer1[uid] = optim.Adam(self.soft_q_net1[uid].parameters(), lr=lr)
             self.soft_q_optimizer2[uid] = optim.Adam(self.soft_q_net2[uid].parameters(), lr=lr)
             self.policy_optimizer[uid] = optim.Adam(self.policy_net[uid].parameters(), lr=lr)
@@ -201,6 +198,35 @@ class MARLISA:
             self.log_alpha[uid] = torch.zeros(1, requires_grad=True, device=self.device)
             self.alpha_optimizer[uid] = optim.Adam([self.log_alpha[uid]], lr=lr)
             
+        # Without information sharing, the actions of all the buildings are selected with one forward pass per group of policies with the same shape. With information sharing, the buildings select their actions one after the other.
+        self.batched_policy = rl.BatchedPolicy(building_ids, self.policy_net, self.encoder, self.device)
+            
+            
+    def update_normalization(self, uid):
+        """
+        Computes the mean and standard deviation of the states and rewards stored in the replay buffer of a building, which are used to normalize the states given to its policy and every batch sampled from its replay buffer. The PCA is only fitted the first time, so that the inputs of the networks keep the same meaning when the statistics are refreshed.
+        """
+        
+        n_samples = len(self.replay_buffer[uid])
+        X = self.replay_buffer[uid].get_states()
+        self.norm_mean[uid] = np.mean(X, axis=0)
+        self.norm_std[uid] = np.std(X, axis=0) + 1e-5
+        
+        R = self.replay_buffer[uid].reward[:n_samples]
+        self.r_norm_mean[uid] = np.mean(R)
+        self.r_norm_std[uid] = np.std(R)/self.reward_scaling + 1e-5
+        
+        if self.pca_flag[uid] == 0:
+            self.pca[uid].fit((X - self.norm_mean[uid])/self.norm_std[uid])
+        
+        # The normalization and the projection of the PCA are folded into a single affine map, which gives the same result as pca.transform((s - mean)/std) without the input validation of sklearn at every batch
+        weights = (self.pca[uid].components_/self.norm_std[uid]).T.astype(np.float32)
+        bias = -((self.norm_mean[uid]/self.norm_std[uid] + self.pca[uid].mean_) @ self.pca[uid].components_.T).astype(np.float32)
+        self.replay_buffer[uid].set_transform(lambda s, weights = weights, bias = bias: s @ weights + bias,
+                                              lambda r, mean = self.r_norm_mean[uid], std = self.r_norm_std[uid]: (r - mean)/std)
+        self.pca_transform[uid] = (weights, bias)
+        if not self.information_sharing:
+            self.batched_policy.set_transform(uid, weights, bias)
             
     def select_action(self, states, deterministic=False):
         
@@ -268,8 +294,8 @@ class MARLISA:
                 k += 1
                 
                 if self.time_step > self.start_regression and self.information_sharing:
-                    x_reg = np.hstack(np.concatenate(([j for j in np.hstack(self.encoder_reg[uid]*state) if j != None][:-1], act)))
-                    expected_demand[uid] = self.state_estimator[uid].predict(x_reg.reshape(1,-1))
+                    x_reg = np.hstack(np.concatenate((self.encoder_reg[uid].encode(state)[:-1], act)))
+                    expected_demand[uid] = self.state_estimator[uid].predict(x_reg.reshape(1,-1))[0]
                     _total_demand += expected_demand[uid]
                     
                     coordination_vars[uid][1] = capacity_dispatched
@@ -284,70 +310,60 @@ class MARLISA:
                     coordination_variables[action_order[k]][0] = coordination_vars[uid][0]
                     coordination_variables[action_order[k]][1] = coordination_vars[uid][1]
                     k += 1
+            actions = self.batched_policy.pad(actions)
         else:
             if self.information_sharing:
-                n = 0
-                while n < n_iterations:
-                    capacity_dispatched = 0
-                    for uid, uid_next, state in zip(_building_ids, _building_ids_next, _states):
-                        state_ = np.array([j for j in np.hstack(self.encoder[uid]*state) if j != None])
+                with torch.no_grad():
+                    n = 0
+                    while n < n_iterations:
+                        capacity_dispatched = 0
+                        for uid, uid_next, state in zip(_building_ids, _building_ids_next, _states):
+                            state_ = self.encoder[uid].encode(state)
                         
-                        # Adding shared information to the state
-                        if self.information_sharing:
-                            state_ = np.hstack(np.concatenate((state_, coordination_vars[uid])))
+                            # Adding shared information to the state
+                            if self.information_sharing:
+                                state_ = np.hstack(np.concatenate((state_, coordination_vars[uid])))
                         
-                        state_ = (state_  - self.norm_mean[uid])/self.norm_std[uid]
-                        state_ = self.pca[uid].transform(state_.reshape(1,-1))[0]
-                        state_ = torch.FloatTensor(state_).unsqueeze(0).to(self.device)
+                            # Normalization and PCA, folded into a single affine map (see update_normalization)
+                            weights, bias = self.pca_transform[uid]
+                            state_ = torch.from_numpy((state_ @ weights + bias).astype(np.float32)).unsqueeze(0).to(self.device)
                         
-                        if deterministic is False:
-                            act, _, _ = self.policy_net[uid].sample(state_)
-                        else:
-                            _, _, act = self.policy_net[uid].sample(state_)
+                            if deterministic is False:
+                                act, _, _ = self.policy_net[uid].sample(state_)
+                            else:
+                                _, _, act = self.policy_net[uid].sample(state_)
                             
-                        # Get the actions in the last iterations if sharing information
-                        if n == n_iterations-1:
-                            actions[action_order[k]] = act.detach().cpu().numpy()[0]   
-                            k += 1
+                            # Get the actions in the last iterations if sharing information
+                            if n == n_iterations-1:
+                                actions[action_order[k]] = act.detach().cpu().numpy()[0]   
+                                k += 1
                             
-                        x_reg = np.hstack(np.concatenate(([j for j in np.hstack(self.encoder_reg[uid]*state) if j != None][:-1], act.detach().squeeze(0).cpu().numpy())))
-                        expected_demand[uid] = self.state_estimator[uid].predict(x_reg.reshape(1,-1))
+                            x_reg = np.hstack(np.concatenate((self.encoder_reg[uid].encode(state)[:-1], act.detach().squeeze(0).cpu().numpy())))
+                            expected_demand[uid] = self.state_estimator[uid].predict(x_reg.reshape(1,-1))[0]
                         
-                        if n == n_iterations-1 and uid == _building_ids[-1]:
-                            pass
-                            # _total_demand += expected_demand[uid]
-                        else:
-                            _total_demand += expected_demand[uid] - expected_demand[uid_next]
+                            if n == n_iterations-1 and uid == _building_ids[-1]:
+                                pass
+                                # _total_demand += expected_demand[uid]
+                            else:
+                                _total_demand += expected_demand[uid] - expected_demand[uid_next]
                             
-                        coordination_vars[uid][1] = capacity_dispatched
-                        capacity_dispatched += self.energy_size_coef[uid]
+                            coordination_vars[uid][1] = capacity_dispatched
+                            capacity_dispatched += self.energy_size_coef[uid]
 
-                        if n == n_iterations-1 and uid == _building_ids[-1]:
-                            pass
-                        else:
-                            coordination_vars[uid_next][0] = _total_demand/self.total_coef
-                    n += 1
+                            if n == n_iterations-1 and uid == _building_ids[-1]:
+                                pass
+                            else:
+                                coordination_vars[uid_next][0] = _total_demand/self.total_coef
+                        n += 1
                     
-                k = 0   
-                for uid in _building_ids:
-                    coordination_variables[action_order[k]][0] = coordination_vars[uid][0]
-                    coordination_variables[action_order[k]][1] = coordination_vars[uid][1]
-                    k += 1
+                    k = 0   
+                    for uid in _building_ids:
+                        coordination_variables[action_order[k]][0] = coordination_vars[uid][0]
+                        coordination_variables[action_order[k]][1] = coordination_vars[uid][1]
+                        k += 1
+                actions = self.batched_policy.pad(actions)
             else:
-                for uid, uid_next, state in zip(_building_ids, _building_ids_next, _states):
-                    state_ = np.array([j for j in np.hstack(self.encoder[uid]*state) if j != None])
-                    
-                    state_ = (state_  - self.norm_mean[uid])/self.norm_std[uid]
-                    state_ = self.pca[uid].transform(state_.reshape(1,-1))[0]
-                    state_ = torch.FloatTensor(state_).unsqueeze(0).to(self.device)
-                    
-                    if deterministic is False:
-                        act, _, _ = self.policy_net[uid].sample(state_)
-                    else:
-                        _, _, act = self.policy_net[uid].sample(state_)
-                    
-                    actions[action_order[k]] = act.detach().cpu().numpy()[0]
-                    k += 1
+                actions = self.batched_policy.select_action(states, deterministic)
                     
         return actions, np.array(coordination_variables)
                 
@@ -355,10 +371,13 @@ class MARLISA:
     def add_to_buffer(self, states, actions, rewards, next_states, done, coordination_vars, coordination_vars_next):
         
         for (uid, o, a, r, o2, coord_vars, coord_vars_next) in zip(self.building_ids, states, actions, rewards, next_states, coordination_vars, coordination_vars_next):
+            # The actions may be padded rows of the matrix returned by select_action
+            a = a[:self.action_spaces[uid].shape[0]]
             if self.information_sharing:
                 # Normalize all the states using periodical normalization, one-hot encoding, or -1, 1 scaling. It also removes states that are not necessary (solar radiation if there are no solar PV panels).
-                x_reg = np.hstack(np.concatenate(([j for j in np.hstack(self.encoder_reg[uid]*o) if j != None][:-1], a)))
-                y_reg = [j for j in np.hstack(self.encoder_reg[uid]*o2) if j != None][-1]
+                o_reg, o2_reg = self.encoder_reg[uid].encode(np.array([o, o2]))
+                x_reg = np.hstack(np.concatenate((o_reg[:-1], a)))
+                y_reg = o2_reg[-1]
                 
                 # Push inputs and targets to the regression buffer. The targets are the net electricity consumption.
                 self.reg_buffer[uid].push(x_reg, y_reg)
@@ -366,8 +385,7 @@ class MARLISA:
             # Run once the regression model has been fitted
             if self.regression_flag[uid] > 1:
                 # Normalize all the states using periodical normalization, one-hot encoding, or -1, 1 scaling. It also removes states that are not necessary (solar radiation if there are no solar PV panels).
-                o = np.array([j for j in np.hstack(self.encoder[uid]*o) if j != None])
-                o2 = np.array([j for j in np.hstack(self.encoder[uid]*o2) if j != None])
+                o, o2 = self.encoder[uid].encode(np.array([o, o2]))
                 
                 # Only executed during the random exploration phase. Pushes unnormalized tuples into the replay buffer.
                 
@@ -375,14 +393,7 @@ class MARLISA:
                     o = np.hstack(np.concatenate((o, coord_vars)))
                     o2 = np.hstack(np.concatenate((o2, coord_vars_next)))
     
-                # Executed during the training phase. States and rewards pushed into the replay buffer are normalized and processed using PCA.
-                if self.pca_flag[uid] == 1:
-                    o = (o - self.norm_mean[uid])/self.norm_std[uid]
-                    o = self.pca[uid].transform(o.reshape(1,-1))[0]
-                    o2 = (o2 - self.norm_mean[uid])/self.norm_std[uid]
-                    o2 = self.pca[uid].transform(o2.reshape(1,-1))[0]
-                    r = (r - self.r_norm_mean[uid])/self.r_norm_std[uid]
-                    
+                # The states and rewards are stored unnormalized, and normalized and processed using PCA when they are sampled
                 self.replay_buffer[uid].push(o, a, r, o2, done)
             
             if self.time_step >= self.start_regression and (self.regression_flag[uid] < 2 or self.time_step % self.regression_freq == 0):
@@ -395,44 +406,15 @@ class MARLISA:
 
         if self.time_step >= self.start_training and self.batch_size <= len(self.replay_buffer[self.building_ids[0]]):
             for uid in self.building_ids:
-                # This code only runs once. Once the random exploration phase is over, we normalize all the states and rewards to make them have mean=0 and std=1, and apply PCA. We push the normalized compressed values back into the buffer, replacing the old buffer.
-                if self.pca_flag[uid] == 0:
-                    X = np.array([j[0] for j in self.replay_buffer[uid].buffer])
-                    self.norm_mean[uid] = np.mean(X, axis=0)
-                    self.norm_std[uid] = np.std(X, axis=0) + 1e-5
-                    X = (X - self.norm_mean[uid])/self.norm_std[uid]
-                    
-                    R = np.array([j[2] for j in self.replay_buffer[uid].buffer])
-                    self.r_norm_mean[uid] = np.mean(R)
-                    self.r_norm_std[uid] = np.std(R)/self.reward_scaling + 1e-5
-
-                    self.pca[uid].fit(X)
-                    new_buffer = []
-                    for s, a, r, s2, dones in self.replay_buffer[uid].buffer:
-                        s_buffer = np.hstack(self.pca[uid].transform(((s - self.norm_mean[uid])/self.norm_std[uid]).reshape(1,-1))[0])
-                        s2_buffer = np.hstack(self.pca[uid].transform(((s2 - self.norm_mean[uid])/self.norm_std[uid]).reshape(1,-1))[0])
-                        new_buffer.append((s_buffer, a, (r - self.r_norm_mean[uid])/self.r_norm_std[uid], s2_buffer, dones))
-
-                    self.replay_buffer[uid].buffer = new_buffer
+                # Once the random exploration phase is over, we compute the statistics used to make the states and rewards have mean=0 and std=1, and fit the PCA. They are applied to every batch sampled from the replay buffer. The statistics (but not the PCA) are computed again every normalization_refresh time-steps if given.
+                if self.pca_flag[uid] == 0 or (self.normalization_refresh is not None and self.time_step % self.normalization_refresh == 0):
+                    self.update_normalization(uid)
                     self.pca_flag[uid] = 1
                     
             # for _ in range(1 + max(0, self.time_step - 8760)//5000):
             for _ in range(self.update_per_step):
                 for uid in self.building_ids:
-                    state, action, reward, next_state, done = self.replay_buffer[uid].sample(self.batch_size)
-    
-                    if self.device.type == "cuda":
-                        state      = torch.cuda.FloatTensor(state).to(self.device)
-                        next_state = torch.cuda.FloatTensor(next_state).to(self.device)
-                        action     = torch.cuda.FloatTensor(action).to(self.device)
-                        reward     = torch.cuda.FloatTensor(reward).unsqueeze(1).to(self.device)
-                        done       = torch.cuda.FloatTensor(done).unsqueeze(1).to(self.device)
-                    else:
-                        state      = torch.FloatTensor(state).to(self.device)
-                        next_state = torch.FloatTensor(next_state).to(self.device)
-                        action     = torch.FloatTensor(action).to(self.device)
-                        reward     = torch.FloatTensor(reward).unsqueeze(1).to(self.device)
-                        done       = torch.FloatTensor(done).unsqueeze(1).to(self.device)
+                    state, action, reward, next_state, done = self.replay_buffer[uid].sample_tensors(self.batch_size, self.device)
     
                     with torch.no_grad():
                         # Update Q-values. First, sample an action from the Gaussian policy/distribution for the current (next) state and its associated log probability of occurrence.
@@ -1,9 +1,13 @@
 from common.preprocessing import *
-from common.rl import *
-import torch.optim as optim
-from torch.optim import Adam
+from common.lazy import LazyModule
 import json
 
+# torch is only imported when an agent is instantiated, so that importing this module only requires numpy
+torch = LazyModule('torch')
+nn = LazyModule('torch.nn')
+optim = LazyModule('torch.optim')
+rl = LazyModule('common.rl')
+
 class SAC:
     def __init__(self, building_ids,
                  buildings_states_actions,
@@ -21,10 +25,18 @@ class SAC:
                  action_scaling_coef = 0.5,
                  reward_scaling = 5.,
                  update_per_step = 2,
+                 normalization_refresh = None,
+                 batched_update = False,
+                 replay_buffer_options = None,
+                 prefetch = False,
                  seed = 0):
-                
-        with open(buildings_states_actions) as json_file:
-            self.buildings_states_actions = json.load(json_file)
+        
+        # buildings_states_actions is the path to the JSON file with the states and actions of the buildings, or its dict (i.e. CityLearn.buildings_states_actions, for districts kept in memory)
+        if isinstance(buildings_states_actions, dict):
+            self.buildings_states_actions = buildings_states_actions
+        else:
+            with open(buildings_states_actions) as json_file:
+                self.buildings_states_actions = json.load(json_file)
             
         self.building_ids = building_ids
         self.start_training = start_training
@@ -37,6 +49,8 @@ class SAC:
         np.random.seed(seed)
         self.deterministic = False
         self.update_per_step = update_per_step
+        self.normalization_refresh = normalization_refresh
+        self.batched_update = batched_update
         self.exploration_period = exploration_period
         
         self.action_list_ = []
@@ -83,36 +97,29 @@ class SAC:
 
             self.encoder[uid] = np.array(self.encoder[uid])
 
-            # If there is no solar PV installed, remove solar radiation variables 
-            if building_info[uid]['solar_power_capacity (kW)'] == 0:
-                for k in range(12,20):
-                    if self.encoder[uid][k] != 0:
-                        self.encoder[uid][k] = -1
-                if self.encoder[uid][24] != 0:
-                    self.encoder[uid][24] = -1
-            if building_info[uid]['Annual_DHW_demand (kWh)'] == 0 and self.encoder[uid][26] != 0:
-                self.encoder[uid][26] = -1
-            if building_info[uid]['Annual_cooling_demand (kWh)'] == 0 and self.encoder[uid][25] != 0:
-                self.encoder[uid][25] = -1
-            if building_info[uid]['Annual_nonshiftable_electrical_demand (kWh)'] == 0 and self.encoder[uid][23] != 0:
-                self.encoder[uid][23] = -1
+            # Remove the states of the devices and demands that the building does not have (i.e. the solar radiation if there is no solar PV installed). They are found by name, so that they can be anywhere in buildings_state_action_space.json
+            for k, s_name in enumerate(self.buildings_states_actions[uid]['states']):
+                if self.encoder[uid][k] != 0 and is_unavailable_state(s_name, building_info[uid]):
+                    self.encoder[uid][k] = -1
 
             self.encoder[uid] = self.encoder[uid][self.encoder[uid]!=0]
             self.encoder[uid][self.encoder[uid]==-1] = remove_feature()
+            self.encoder[uid] = CompiledEncoder(self.encoder[uid])
             
-            state_dim = len([j for j in np.hstack(self.encoder[uid]*np.ones(len(self.observation_spaces[uid].low))) if j != None])
+            state_dim = self.encoder[uid].output_dim
                 
             action_dim = self.action_spaces[uid].shape[0]
             self.alpha[uid] = 0.2
             
-            self.replay_buffer[uid] = ReplayBuffer(int(replay_buffer_capacity))
+            # Every replay buffer draws its batches with its own random generator, seeded from the seed of the agent
+            self.replay_buffer[uid] = rl.ReplayBuffer(int(replay_buffer_capacity), prefetch = prefetch, **dict({'seed': (seed, building_ids.index(uid))}, **(replay_buffer_options or {})))
             
             # init networks
-            self.soft_q_net1[uid] = SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
-            self.soft_q_net2[uid] = SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
+            self.soft_q_net1[uid] = rl.SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
+            self.soft_q_net2[uid] = rl.SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
 
-            self.target_soft_q_net1[uid] = SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
-            self.target_soft_q_net2[uid] = SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
+            self.target_soft_q_net1[uid] = rl.SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
+            self.target_soft_q_net2[uid] = rl.SoftQNetwork(state_dim, action_dim, hidden_dim).to(self.device)
 
             for target_param, param in zip(self.target_soft_q_net1[uid].parameters(), self.soft_q_net1[uid].parameters()):
                 target_param.data.copy_(param.data)
@@ -121,39 +128,81 @@ class SAC:
                 target_param.data.copy_(param.data)
 
             # Policy
-            self.policy_net[uid] = PolicyNetwork(state_dim, action_dim, self.action_spaces[uid], self.action_scaling_coef, hidden_dim).to(self.device)
+            self.policy_net[uid] = rl.PolicyNetwork(state_dim, action_dim, self.action_spaces[uid], self.action_scaling_coef, hidden_dim).to(self.device)
             self.soft_q_optimizer1[uid] = optim.Adam(self.soft_q_net1[uid].parameters(), lr=lr)
             self.soft_q_optimizer2[uid] = optim.Adam(self.soft_q_net2[uid].parameters(), lr=lr)
             self.policy_optimizer[uid] = optim.Adam(self.policy_net[uid].parameters(), lr=lr)
             self.target_entropy[uid] = -np.prod(self.action_spaces[uid].shape).item()
             
+        # Buildings whose networks are updated together (see group_networks), and buildings updated on their own
+        self.groups = []
+        self.ungrouped_ids = building_ids
+        if batched_update:
+            self.group_networks(lr)
+            
+        # The actions of all the buildings are selected with one forward pass per group of policies with the same shape, which reuses the groups of the batched updates
+        self.batched_policy = rl.BatchedPolicy(building_ids, self.policy_net, self.encoder, self.device, {tuple(group['uids']): group['policy_net'] for group in self.groups})
+            
+    def group_networks(self, lr):
+        """
+        Groups the buildings whose networks have the same shape (same numbers of states and actions), and stacks the weights of their networks so that the networks of all the buildings of a group are updated together with batched matrix multiplications (see update_group). The networks of every building become views of the stacked weights, so they can still be used on their own. A building whose networks have the same shape as no other one is still updated on its own, which is faster than a group of one network.
+        """
+        
+        uids_by_shape = {}
+        for uid in self.building_ids:
+            uids_by_shape.setdefault((self.encoder[uid].output_dim, self.action_spaces[uid].shape[0]), []).append(uid)
+        
+        self.groups = []
+        self.ungrouped_ids = [uid for uid in self.building_ids if len(uids_by_shape[(self.encoder[uid].output_dim, self.action_spaces[uid].shape[0])]) == 1]
+        for uids in uids_by_shape.values():
+            if len(uids) == 1:
+                continue
+            group = {'uids': uids}
+            for name in ['soft_q_net1', 'soft_q_net2', 'target_soft_q_net1', 'target_soft_q_net2']:
+                group[name] = rl.GroupedSoftQNetwork([getattr(self, name)[uid] for uid in uids])
+            group['policy_net'] = rl.GroupedPolicyNetwork([self.policy_net[uid] for uid in uids])
+            
+            # Adam is applied elementwise, so a single optimizer of the stacked weights makes the same updates as one optimizer per building
+            group['soft_q_optimizer1'] = optim.Adam(group['soft_q_net1'].parameters(), lr=lr)
+            group['soft_q_optimizer2'] = optim.Adam(group['soft_q_net2'].parameters(), lr=lr)
+            group['policy_optimizer'] = optim.Adam(group['policy_net'].parameters(), lr=lr)
+            group['alpha'] = torch.tensor([self.alpha[uid] for uid in uids], device=self.device).view(-1, 1, 1)
+            self.groups.append(group)
+            
+            
+    def update_normalization(self, uid):
+        """
+        Computes the mean and standard deviation of the states and rewards stored in the replay buffer of a building, which are used to normalize the states given to its policy and every batch sampled from its replay buffer.
+        """
+        
+        n_samples = len(self.replay_buffer[uid])
+        X = self.replay_buffer[uid].get_states()
+        self.norm_mean[uid] = np.mean(X, axis=0)
+        self.norm_std[uid] = np.std(X, axis=0) + 1e-5
+
+        R = self.replay_buffer[uid].reward[:n_samples]
+        self.r_norm_mean[uid] = np.mean(R)
+        self.r_norm_std[uid] = np.std(R)/self.reward_scaling + 1e-5
+        
+        self.replay_buffer[uid].set_transform(lambda s, mean = self.norm_mean[uid], std = self.norm_std[uid]: (s - mean)/std,
+                                              lambda r, mean = self.r_norm_mean[uid], std = self.r_norm_std[uid]: (r - mean)/std)
+        self.batched_policy.set_transform(uid, np.diag(1/self.norm_std[uid]), -self.norm_mean[uid]/self.norm_std[uid])
             
     def select_action(self, states):
+        """
+        Returns:
+            actions (np.ndarray): float32 matrix (n_buildings, max_action_dim) of the actions of every building, padded with zeros
+            coordination_vars (None): SAC does not share information between the buildings
+        """
         
         self.time_step += 1
         explore = self.time_step <= self.exploration_period
-        actions = []
-        k = 0
         
         deterministic = (self.time_step > 3*8760)
         
-        for uid, state in zip(self.building_ids, states):
-            if explore:
-                actions.append(self.action_scaling_coef*self.action_spaces[uid].sample())
-            else:
-                state_ = np.array([j for j in np.hstack(self.encoder[uid]*state) if j != None])
-
-                state_ = (state_  - self.norm_mean[uid])/self.norm_std[uid]
-                state_ = torch.FloatTensor(state_).unsqueeze(0).to(self.device)
-
-                if deterministic is False:
-                    act, _, _ = self.policy_net[uid].sample(state_)
-                else:
-                    _, _, act = self.policy_net[uid].sample(state_)
-
-                actions.append(act.detach().cpu().numpy()[0])
-                    
-        return np.array(actions), None
+        if explore:
+            return self.batched_policy.pad([self.action_scaling_coef*self.action_spaces[uid].sample() for uid in self.building_ids]), None
+        return self.batched_policy.select_action(states, deterministic), None
                 
         
     def add_to_buffer(self, states, actions, rewards, next_states, done, coordination_vars, coordination_vars_next):
@@ -162,52 +211,24 @@ class SAC:
             # Run once the regression model has been fitted
             # Normalize all the states using periodical normalization, one-hot encoding, or -1, 1 scaling. It also removes states that are not necessary (solar radiation if there are no solar PV panels).
             
-            o = np.array([j for j in np.hstack(self.encoder[uid]*o) if j != None])
-            o2 = np.array([j for j in np.hstack(self.encoder[uid]*o2) if j != None])
+            o, o2 = self.encoder[uid].encode(np.array([o, o2]))
             
-            if self.norm_flag[uid] > 0:
-                o = (o - self.norm_mean[uid])/self.norm_std[uid]
-                o2 = (o2 - self.norm_mean[uid])/self.norm_std[uid]
-                r = (r - self.r_norm_mean[uid])/self.r_norm_std[uid]
-
-            self.replay_buffer[uid].push(o, a, r, o2, done)
+            # The states and rewards are stored unnormalized, and normalized when they are sampled. The actions may be padded rows of the matrix returned by select_action.
+            self.replay_buffer[uid].push(o, a[:self.action_spaces[uid].shape[0]], r, o2, done)
             
         if self.time_step >= self.start_training and self.batch_size <= len(self.replay_buffer[self.building_ids[0]]): 
             for uid in self.building_ids:
-                if self.norm_flag[uid] == 0:
-                    X = np.array([j[0] for j in self.replay_buffer[uid].buffer])
-                    self.norm_mean[uid] = np.mean(X, axis=0)
-                    self.norm_std[uid] = np.std(X, axis=0) + 1e-5
-
-                    R = np.array([j[2] for j in self.replay_buffer[uid].buffer])
-                    self.r_norm_mean[uid] = np.mean(R)
-                    self.r_norm_std[uid] = np.std(R)/self.reward_scaling + 1e-5
-
-                    new_buffer = []
-                    for s, a, r, s2, dones in self.replay_buffer[uid].buffer:
-                        s_buffer = np.hstack(((s - self.norm_mean[uid])/self.norm_std[uid]).reshape(1,-1)[0])
-                        s2_buffer = np.hstack(((s2 - self.norm_mean[uid])/self.norm_std[uid]).reshape(1,-1)[0])
-                        new_buffer.append((s_buffer, a, (r - self.r_norm_mean[uid])/self.r_norm_std[uid], s2_buffer, dones))
-
-                    self.replay_buffer[uid].buffer = new_buffer
+                # The statistics are computed once the random exploration phase is over, and then every normalization_refresh time-steps if given
+                if self.norm_flag[uid] == 0 or (self.normalization_refresh is not None and self.time_step % self.normalization_refresh == 0):
+                    self.update_normalization(uid)
                     self.norm_flag[uid] = 1
                     
             for _ in range(self.update_per_step):
-                for uid in self.building_ids:
-                    state, action, reward, next_state, done = self.replay_buffer[uid].sample(self.batch_size)
-
-                    if self.device.type == "cuda":
-                        state      = torch.cuda.FloatTensor(state).to(self.device)
-                        next_state = torch.cuda.FloatTensor(next_state).to(self.device)
-                        action     = torch.cuda.FloatTensor(action).to(self.device)
-                        reward     = torch.cuda.FloatTensor(reward).unsqueeze(1).to(self.device)
-                        done       = torch.cuda.FloatTensor(done).unsqueeze(1).to(self.device)
-                    else:
-                        state      = torch.FloatTensor(state).to(self.device)
-                        next_state = torch.FloatTensor(next_state).to(self.device)
-                        action     = torch.FloatTensor(action).to(self.device)
-                        reward     = torch.FloatTensor(reward).unsqueeze(1).to(self.device)
-                        done       = torch.FloatTensor(done).unsqueeze(1).to(self.device)
+                for group in self.groups:
+                    self.update_group(group)
+                    
+                for uid in self.ungrouped_ids:
+                    state, action, reward, next_state, done = self.replay_buffer[uid].sample_tensors(self.batch_size, self.device)
 
                     with torch.no_grad():
                         # Update Q-values. First, sample an action from the Gaussian policy/distribution for the current (next) state and its associated log probability of occurrence.
@@ -260,4 +281,54 @@ class SAC:
                     for target_param, param in zip(self.target_soft_q_net2[uid].parameters(), self.soft_q_net2[uid].parameters()):
                         target_param.data.copy_(
                             target_param.data * (1.0 - self.tau) + param.data * self.tau
-                        )
\ No newline at end of file
+                        )
+                        
+    def update_group(self, group):
+        """
+        Same update of the critics, policy and target networks as in add_to_buffer, made at once for all the buildings of a group (see group_networks). The losses are the sums of the losses of the buildings, so that the gradients of the weights of every building are those of its own loss.
+        """
+        
+        batches = [self.replay_buffer[uid].sample_tensors(self.batch_size, self.device) for uid in group['uids']]
+        state, action, reward, next_state, done = (torch.stack(tensors) for tensors in zip(*batches))
+        n_buildings = len(group['uids'])
+        
+        with torch.no_grad():
+            new_next_actions, new_log_pi, _ = group['policy_net'].sample(next_state)
+            target_q_values = torch.min(
+                            group['target_soft_q_net1'](next_state, new_next_actions),
+                            group['target_soft_q_net2'](next_state, new_next_actions),
+                        ) - group['alpha'] * new_log_pi
+            q_target = reward + (1 - done) * self.discount * target_q_values
+        
+        # Every building has the same batch size, so the mean over all the buildings times their number is the sum of the mean losses of the buildings
+        q1_loss = self.soft_q_criterion(group['soft_q_net1'](state, action), q_target)*n_buildings
+        q2_loss = self.soft_q_criterion(group['soft_q_net2'](state, action), q_target)*n_buildings
+        
+        group['soft_q_optimizer1'].zero_grad()
+        q1_loss.backward()
+        group['soft_q_optimizer1'].step()
+        
+        group['soft_q_optimizer2'].zero_grad()
+        q2_loss.backward()
+        group['soft_q_optimizer2'].step()
+        
+        new_actions, log_pi, _ = group['policy_net'].sample(state)
+        q_new_actions = torch.min(
+            group['soft_q_net1'](state, new_actions),
+            group['soft_q_net2'](state, new_actions)
+        )
+        policy_loss = (group['alpha']*log_pi - q_new_actions).mean()*n_buildings
+        
+        group['policy_optimizer'].zero_grad()
+        policy_loss.backward()
+        group['policy_optimizer'].step()
+        
+        for target_param, param in zip(group['target_soft_q_net1'].parameters(), group['soft_q_net1'].parameters()):
+            target_param.data.copy_(
+                target_param.data * (1.0 - self.tau) + param.data * self.tau
+            )
+        
+        for target_param, param in zip(group['target_soft_q_net2'].parameters(), group['soft_q_net2'].parameters()):
+            target_param.data.copy_(
+                target_param.data * (1.0 - self.tau) + param.data * self.tau
+            )
@@ -0,0 +1,98 @@
+"""
+Allocation benchmark of the CityLearn step. It compares step(), which returns new arrays of states and a new list of rewards at every time-step, with step_into(), which writes them into buffers allocated once. The memory allocated by Python is traced with tracemalloc.
+
+tracemalloc only keeps the blocks that are still alive, so the memory allocated within every time-step is measured as the peak of the traced memory during the time-step above the memory traced at its beginning (every block allocated during the time-step, unless it is freed before the next one is allocated), and the blocks allocated are counted by line by comparing the snapshots taken before and after some of the time-steps. A block that replaces one allocated at the same line in the previous time-step cancels out in the snapshots, but its bytes are still counted in allocated_bytes_per_step.
+
+    python benchmarks/allocations.py --steps 1000
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+from citylearn import CityLearn
+
+def make_env(climate_zone, observation_mode):
+    data_path = ROOT / 'data' / ('Climate_Zone_' + str(climate_zone))
+    return CityLearn(data_path, 'building_attributes.json', 'weather_data.csv', 'solar_generation_1kW.csv', ['Building_' + str(i) for i in range(1, 10)],
+                     carbon_intensity = 'carbon_intensity.csv', buildings_states_actions = str(ROOT / 'buildings_state_action_space.json'),
+                     central_agent = False, save_memory = True, observation_mode = observation_mode)
+
+def measure(env, step, n_steps, n_warmup, n_snapshots):
+    # The first time-steps are not traced, so that lazily allocated objects are not counted
+    for _ in range(n_warmup):
+        step()
+
+    # Memory allocated within every time-step, from the peak of the traced memory during the time-step
+    tracemalloc.start()
+    current_before = tracemalloc.get_traced_memory()[0]
+    allocated = np.zeros(n_steps)
+    t = time.perf_counter()
+    for i in range(n_steps):
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        step()
+        allocated[i] = tracemalloc.get_traced_memory()[1] - start
+    elapsed = time.perf_counter() - t
+    retained = tracemalloc.get_traced_memory()[0] - current_before
+
+    # Blocks allocated within every time-step, counted by line. The objects returned by step are kept alive so that they are counted, and only the lines with more blocks after the time-step than before are added, so that the blocks freed at other lines are not subtracted.
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    outputs, blocks, size, lines = [], 0, 0, {}
+    for _ in range(n_snapshots):
+        before = tracemalloc.take_snapshot().filter_traces(filters)
+        outputs.append(step())
+        after = tracemalloc.take_snapshot().filter_traces(filters)
+        for stat in after.compare_to(before, 'lineno'):
+            if stat.count_diff > 0:
+                blocks += stat.count_diff
+                size += stat.size_diff
+                line = str(stat.traceback[0])
+                lines[line] = lines.get(line, 0) + stat.count_diff/n_snapshots
+    tracemalloc.stop()
+
+    return {'allocated_bytes_per_step': allocated.mean(),
+            'max_allocated_bytes_per_step': allocated.max(),
+            'allocated_blocks_per_step': blocks/n_snapshots,
+            'allocated_block_bytes_per_step': size/n_snapshots,
+            'allocating_lines': dict(sorted(lines.items(), key = lambda item: -item[1])[:10]),
+            'retained_bytes_per_step': retained/n_steps,
+            'steps_per_second (traced)': n_steps/elapsed}
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[1])
+    parser.add_argument('--climate-zone', type = int, default = 5, help = 'climate zone whose buildings are simulated')
+    parser.add_argument('--steps', type = int, default = 1000, help = 'number of time-steps traced')
+    parser.add_argument('--warmup', type = int, default = 24, help = 'number of time-steps simulated before tracing')
+    parser.add_argument('--snapshots', type = int, default = 20, help = 'number of time-steps whose allocated blocks are counted from snapshots')
+    parser.add_argument('--output', type = str, default = None, help = 'JSON file where the results are written')
+    args = parser.parse_args()
+
+    results = {}
+
+    env = make_env(args.climate_zone, 'object')
+    env.reset()
+    _, action_spaces = env.get_state_action_spaces()
+    actions = [np.zeros(action_space.shape, dtype = np.float32) for action_space in action_spaces]
+    results['step'] = measure(env, lambda: env.step(actions), args.steps, args.warmup, args.snapshots)
+
+    env = make_env(args.climate_zone, 'padded')
+    obs = np.zeros(env.observation_mask.shape, dtype = np.float32)
+    rewards = np.zeros(env.n_buildings, dtype = np.float32)
+    padded_actions = np.zeros(env.action_mask.shape, dtype = np.float32)
+    env.reset_into(obs)
+    results['step_into'] = measure(env, lambda: env.step_into(padded_actions, obs, rewards), args.steps, args.warmup, args.snapshots)
+
+    print(json.dumps(results, indent = 4))
+    if args.output is not None:
+        with open(args.output, 'w') as json_file:
+            json.dump(results, json_file, indent = 4)
+
+if __name__ == '__main__':
+    main()
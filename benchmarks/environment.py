@@ -0,0 +1,213 @@
+"""
+Benchmark suite of the CityLearn environment. For every climate zone, type of agent (central or decentralized), value of save_memory and simulation length, it times building_loader, CityLearn.__init__, reset(), step(), get_building_information() and cost() (the first call of cost() also simulates the rule-based controller used as a baseline), and reports the step throughput, the percentiles of the latency of every call and the peak memory. Every configuration is run in its own process so that the memory measurements are independent.
+
+The results are written as JSON, and can be compared with the results of a previous run. Any time or memory which is larger than in the baseline by more than the threshold is reported as a regression, as well as any configuration which fails or is missing from the baseline, and the script then exits with an error.
+
+Only the climate zone 5 is run by default: the building_attributes.json of the climate zones 1 to 4 is not valid JSON, so they cannot be loaded until it is fixed.
+
+    python benchmarks/environment.py --output results.json
+    python benchmarks/environment.py --climate-zones 5 --years 1 --baseline results.json --threshold 0.1
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+# Metrics for which a larger value is an improvement. For all the other ones (times and memory), a larger value is a regression.
+HIGHER_IS_BETTER = ['steps_per_second']
+
+def _latency(times_ns):
+    times = np.array(times_ns)/1e6
+    return {'calls': len(times), 'mean_ms': times.mean(), 'p50_ms': np.percentile(times, 50), 'p90_ms': np.percentile(times, 90), 'p99_ms': np.percentile(times, 99), 'max_ms': times.max()}
+
+def _time_calls(function, n_calls):
+    times_ns = []
+    for _ in range(n_calls):
+        t = time.perf_counter_ns()
+        function()
+        times_ns.append(time.perf_counter_ns() - t)
+    return _latency(times_ns)
+
+def make_params(climate_zone, central_agent, n_years, buildings_states_actions):
+    data_path = ROOT / 'data' / ('Climate_Zone_' + str(climate_zone))
+
+    # Only the climate zone 5 provides the carbon intensity of the grid, which is then used for all the climate zones
+    carbon_intensity = 'carbon_intensity.csv' if (data_path / 'carbon_intensity.csv').exists() else '../Climate_Zone_5/carbon_intensity.csv'
+    return {'data_path': data_path,
+            'building_attributes': 'building_attributes.json',
+            'weather_file': 'weather_data.csv',
+            'solar_profile': 'solar_generation_1kW.csv',
+            'carbon_intensity': carbon_intensity,
+            'building_ids': ['Building_' + str(i) for i in range(1, 10)],
+            'buildings_states_actions': buildings_states_actions,
+            'simulation_period': (0, 8760*n_years - 1),
+            'cost_function': ['ramping', '1-load_factor', 'average_daily_peak', 'peak_demand', 'net_electricity_consumption', 'carbon_emissions'],
+            'central_agent': central_agent}
+
+def run_config(config, max_steps, n_calls):
+    from citylearn import CityLearn, RBC_Agent, building_loader
+
+    result = {'config': config}
+
+    # The states and actions of the central agent are written to a temporary file
+    with tempfile.TemporaryDirectory() as output_path:
+        buildings_states_actions = str(ROOT / 'buildings_state_action_space.json')
+        if config['central_agent']:
+            # The central agent does not take the state nor the actions of the batteries
+            with open(buildings_states_actions) as json_file:
+                states_actions = json.load(json_file)
+            for uid in states_actions:
+                states_actions[uid]['states']['electrical_storage_soc'] = False
+                states_actions[uid]['actions']['electrical_storage'] = False
+            buildings_states_actions = str(Path(output_path) / 'buildings_state_action_space.json')
+            with open(buildings_states_actions, 'w') as json_file:
+                json.dump(states_actions, json_file)
+
+        params = make_params(config['climate_zone'], config['central_agent'], config['years'], buildings_states_actions)
+
+        # building_loader is timed on its own with the same arguments as in CityLearn.__init__
+        with open(buildings_states_actions) as json_file:
+            states_actions = json.load(json_file)
+        data_path = params['data_path']
+        loader = lambda: building_loader(data_path, data_path / params['building_attributes'], data_path / params['weather_file'], data_path / params['solar_profile'], data_path / params['carbon_intensity'], params['building_ids'], states_actions, save_memory = config['save_memory'])
+        result['building_loader'] = _time_calls(loader, 1)
+
+        t = time.perf_counter_ns()
+        env = CityLearn(**params, save_memory = config['save_memory'])
+        result['init'] = _latency([time.perf_counter_ns() - t])
+        result['reset'] = _time_calls(env.reset, n_calls)
+        result['get_building_information'] = _time_calls(env.get_building_information, n_calls)
+
+        # The actions of the rule-based controller are used, so that the storage devices are charged and discharged as in a real episode
+        observation_spaces, action_spaces = env.get_state_action_spaces()
+        agent = RBC_Agent([env.action_space] if config['central_agent'] else action_spaces)
+        state = env.reset()
+        n_steps = env.episode_time_steps[1] - env.episode_time_steps[0] + 1
+        if max_steps is not None:
+            n_steps = min(n_steps, max_steps)
+
+        # The states of the first building come first in the states of the central agent as well
+        hour_index = [state_name for state_name, value in env.buildings_states_actions[env.building_ids[0]]['states'].items() if value].index('hour')
+        times_ns = np.zeros(n_steps, dtype=np.int64)
+        for i in range(n_steps):
+            hour = state[hour_index] if config['central_agent'] else state[0][hour_index]
+            actions = agent.select_action([hour])
+            actions = actions[0] if config['central_agent'] else actions
+            t = time.perf_counter_ns()
+            state, _, done, _ = env.step(actions)
+            times_ns[i] = time.perf_counter_ns() - t
+            if done:
+                times_ns = times_ns[:i + 1]
+                break
+        result['step'] = _latency(times_ns)
+        result['step']['steps_per_second'] = len(times_ns)/(times_ns.sum()/1e9)
+
+        # The first call of cost() simulates the rule-based controller over the whole episode, and the following calls reuse its costs
+        result['cost_with_baseline'] = _time_calls(env.cost, 1)
+        result['cost'] = _time_calls(env.cost, n_calls)
+        result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+    return result
+
+def config_name(config):
+    return 'zone{climate_zone}-{agent}-save_memory_{save_memory}-{years}y'.format(agent = 'central' if config['central_agent'] else 'decentralized', **config)
+
+def _flatten(result):
+    # Numerical metrics of a result, keyed by 'section.metric'
+    metrics = {}
+    for section, values in result.items():
+        if isinstance(values, dict) and section != 'config':
+            for metric, value in values.items():
+                if metric != 'calls':
+                    metrics[section + '.' + metric] = value
+        elif isinstance(values, (int, float)):
+            metrics[section] = values
+    return metrics
+
+def compare(results, baseline, threshold):
+    """
+    Args:
+        results (dict): results of every configuration, keyed by config_name
+        baseline (dict): results of a previous run, in the same format
+        threshold (float): relative change (i.e. 0.1 for 10%) above which a metric is a regression
+    Returns:
+        regressions (list): dicts with the configuration, metric, baseline value, new value and relative change of every regression, or with the configuration and the error of every configuration which failed or is missing from the baseline
+    """
+
+    regressions = []
+    for name, result in results.items():
+        if 'error' in result:
+            regressions.append({'config': name, 'error': result['error']})
+            continue
+        if name not in baseline:
+            regressions.append({'config': name, 'error': 'missing from the baseline'})
+            continue
+        if 'error' in baseline[name]:
+            continue
+        new_metrics, old_metrics = _flatten(result), _flatten(baseline[name])
+        for metric, new_value in new_metrics.items():
+            old_value = old_metrics.get(metric)
+            if old_value is None or old_value <= 0:
+                continue
+            change = (new_value - old_value)/old_value
+            if metric.split('.')[-1] in HIGHER_IS_BETTER:
+                change = -change
+            if change > threshold:
+                regressions.append({'config': name, 'metric': metric, 'baseline': old_value, 'new': new_value, 'change': change})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[1])
+    parser.add_argument('--climate-zones', type = int, nargs = '+', default = [5], help = 'climate zones (only 5 by default, since the building attributes of the zones 1 to 4 are not valid JSON)')
+    parser.add_argument('--agents', type = str, nargs = '+', default = ['decentralized', 'central'], choices = ['decentralized', 'central'])
+    parser.add_argument('--save-memory', type = int, nargs = '+', default = [1, 0], help = 'values of save_memory (1 or 0)')
+    parser.add_argument('--years', type = int, nargs = '+', default = [1, 4], help = 'lengths of the simulation periods in years')
+    parser.add_argument('--steps', type = int, default = None, help = 'maximum number of time-steps timed. The whole simulation period by default')
+    parser.add_argument('--calls', type = int, default = 10, help = 'number of calls timed for reset(), get_building_information() and cost()')
+    parser.add_argument('--output', type = str, default = None, help = 'JSON file where the results are written')
+    parser.add_argument('--baseline', type = str, default = None, help = 'JSON file with the results of a previous run, with which the results are compared')
+    parser.add_argument('--threshold', type = float, default = 0.1, help = 'relative increase of a time or memory above which it is reported as a regression')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for climate_zone, agent, save_memory, years in itertools.product(args.climate_zones, args.agents, args.save_memory, args.years):
+        config = {'climate_zone': climate_zone, 'central_agent': agent == 'central', 'save_memory': bool(save_memory), 'years': years}
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(run_config, (config, args.steps, args.calls))
+            except Exception as e:
+                result = {'config': config, 'error': repr(e)}
+        results[config_name(config)] = result
+        if 'error' in result:
+            print(config_name(config), 'ERROR', result['error'])
+        else:
+            print(config_name(config), json.dumps({key: value for key, value in _flatten(result).items() if key.endswith('mean_ms') or key.endswith('per_second') or key.endswith('_mb')}))
+
+    if args.output is not None:
+        with open(args.output, 'w') as json_file:
+            json.dump(results, json_file, indent = 4)
+
+    if args.baseline is not None:
+        with open(args.baseline) as json_file:
+            baseline = json.load(json_file)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            if 'error' in regression:
+                print('REGRESSION {config}: {error}'.format(**regression))
+            else:
+                print('REGRESSION {config} {metric}: {baseline:.6g} -> {new:.6g} (+{change:.1%})'.format(**regression))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
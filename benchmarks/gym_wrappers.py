@@ -0,0 +1,89 @@
+"""
+Check of the gym.Env adapter of CityLearn (CityLearn.as_gym()) with the wrappers of gym. The environment is run through gym.wrappers.TimeLimit, and the script checks that the adapter is an instance of gym.Env, that reset() and step() follow the API of gym >= 0.26 through the wrapper, that TimeLimit truncates the episode after max_episode_steps, that the end of the episode is reported as terminated, and that reset(seed=...) draws the same random episode for the same seed.
+
+The script exits with an error if any check fails.
+
+    python benchmarks/gym_wrappers.py --max-episode-steps 10
+"""
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+def make_env():
+    from citylearn import CityLearn
+    data_path = ROOT / 'data' / 'Climate_Zone_5'
+    return CityLearn(data_path, 'building_attributes.json', 'weather_data.csv', 'solar_generation_1kW.csv', ['Building_' + str(i) for i in range(1, 10)],
+                     carbon_intensity = 'carbon_intensity.csv', buildings_states_actions = str(ROOT / 'buildings_state_action_space.json'), central_agent = False)
+
+def check(max_episode_steps, episode_length):
+    """
+    Args:
+        max_episode_steps (int): number of time-steps after which TimeLimit truncates the episode
+        episode_length (int): number of hours of the episode run until its end, which must be shorter than max_episode_steps
+    Returns:
+        failures (list): description of every check that failed
+    """
+
+    import gym
+    import numpy as np
+
+    env = make_env()
+    actions = [np.zeros(space.shape) for space in env.action_spaces]
+    failures = []
+
+    if not isinstance(env.as_gym(), gym.Env):
+        failures.append('as_gym() is not an instance of gym.Env')
+
+    # Truncation by the wrapper, before the end of the episode
+    wrapped = gym.wrappers.TimeLimit(env.as_gym(), max_episode_steps = max_episode_steps)
+    result = wrapped.reset(seed = 0, options = {'start': 0})
+    if not (isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], dict)):
+        failures.append('reset() does not return (states, info)')
+    for i in range(max_episode_steps):
+        result = wrapped.step(actions)
+        if len(result) != 5:
+            failures.append('step() returns {} values instead of 5'.format(len(result)))
+            break
+        _, _, terminated, truncated, _ = result
+        if terminated or truncated != (i == max_episode_steps - 1):
+            failures.append('time-step {}: terminated={}, truncated={} with TimeLimit({})'.format(i, terminated, truncated, max_episode_steps))
+            break
+
+    # End of the episode, before the limit of the wrapper
+    wrapped = gym.wrappers.TimeLimit(env.as_gym(), max_episode_steps = max_episode_steps)
+    wrapped.reset(options = {'start': 0, 'length': episode_length})
+    for i in range(max_episode_steps):
+        _, _, terminated, truncated, _ = wrapped.step(actions)
+        if terminated or truncated:
+            break
+    if not terminated or truncated or i + 1 != env.episode_time_steps[1] - env.episode_time_steps[0]:
+        failures.append('an episode of {} hours ended after {} time-steps with terminated={}, truncated={}'.format(episode_length, i + 1, terminated, truncated))
+
+    # Random episodes drawn with the same seed
+    periods = []
+    for _ in range(2):
+        wrapped.reset(seed = 1, options = {'length': episode_length})
+        periods.append(env.episode_period)
+    if periods[0] != periods[1]:
+        failures.append('reset(seed=1) drew the episodes {} and {}'.format(*periods))
+
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[1])
+    parser.add_argument('--max-episode-steps', type = int, default = 10, help = 'max_episode_steps of TimeLimit')
+    parser.add_argument('--episode-length', type = int, default = 6, help = 'length in hours of the episode run until its end, shorter than --max-episode-steps')
+    args = parser.parse_args()
+
+    failures = check(args.max_episode_steps, args.episode_length)
+    for failure in failures:
+        print('FAILED', failure)
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+if __name__ == '__main__':
+    main()
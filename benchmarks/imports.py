@@ -0,0 +1,101 @@
+"""
+Cold start benchmark of CityLearn. Every module is imported in a new Python process, and the benchmark reports the time of the import, the time of the whole process (including the start of the interpreter) and which of the heavy optional dependencies (pandas, gym, torch and sklearn) were imported. With --env, the process also builds a CityLearn environment from the binary cache of the data, which must not import pandas nor gym.
+
+The script exits with an error if the median import time of any module is above the target, or if any forbidden dependency is imported.
+
+    python benchmarks/imports.py --target-ms 300
+    python benchmarks/imports.py --modules citylearn agents.sac --repeats 20 --output imports.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+
+HEAVY_DEPENDENCIES = ['pandas', 'gym', 'torch', 'sklearn']
+
+# Run in a new process for every measurement. The import of the module is timed within the process, and the environment is then built from the data of the climate zone 5.
+CHILD = '''
+import sys, time, json
+sys.path.insert(0, {root!r})
+t = time.perf_counter()
+import {module}
+import_ms = (time.perf_counter() - t)*1000
+env_ms = None
+if {env!r}:
+    from pathlib import Path
+    from citylearn import CityLearn
+    data_path = Path({root!r}) / 'data' / 'Climate_Zone_5'
+    t = time.perf_counter()
+    CityLearn(data_path, 'building_attributes.json', 'weather_data.csv', 'solar_generation_1kW.csv', ['Building_' + str(i) for i in range(1, 10)], carbon_intensity = 'carbon_intensity.csv', buildings_states_actions = str(Path({root!r}) / 'buildings_state_action_space.json'))
+    env_ms = (time.perf_counter() - t)*1000
+print(json.dumps({{'import_ms': import_ms, 'env_ms': env_ms, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+def run_child(module, env):
+    code = CHILD.format(root = str(ROOT), module = module, env = env, heavy = HEAVY_DEPENDENCIES)
+    t = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, check = True).stdout
+    result = json.loads(output.strip().split('\n')[-1])
+    result['process_ms'] = (time.perf_counter() - t)*1000
+    return result
+
+def benchmark(module, repeats, env):
+    """
+    Args:
+        module (str): name of the module imported
+        repeats (int): number of processes started
+        env (bool): whether every process also builds an environment from the data cache
+    Returns:
+        result (dict): median and maximum import and process times, time to build the environment and the heavy dependencies imported by any of the processes
+    """
+
+    runs = [run_child(module, env) for _ in range(repeats)]
+    result = {}
+    for metric in ['import_ms', 'process_ms'] + (['env_ms'] if env else []):
+        times = np.array([run[metric] for run in runs])
+        result[metric] = {'median': float(np.median(times)), 'max': float(times.max())}
+    result['loaded'] = sorted(set(name for run in runs for name in run['loaded']))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[1])
+    parser.add_argument('--modules', type = str, nargs = '+', default = ['energy_models', 'citylearn', 'agents.sac', 'agents.marlisa'])
+    parser.add_argument('--repeats', type = int, default = 10, help = 'number of processes started for every module')
+    parser.add_argument('--target-ms', type = float, default = 500., help = 'maximum median import time of every module (ms)')
+    parser.add_argument('--forbid', type = str, nargs = '*', default = HEAVY_DEPENDENCIES, help = 'dependencies that must not be imported')
+    parser.add_argument('--env', action = 'store_true', help = 'also build an environment from the binary cache of the data in every process')
+    parser.add_argument('--output', type = str, default = None, help = 'JSON file where the results are written')
+    args = parser.parse_args()
+
+    # A first process builds the environment, so that the binary cache of the data is written before it is timed
+    if args.env:
+        run_child('citylearn', True)
+
+    results, failures = {}, []
+    for module in args.modules:
+        result = benchmark(module, args.repeats, args.env)
+        results[module] = result
+        print(module, json.dumps(result))
+        if result['import_ms']['median'] > args.target_ms:
+            failures.append('{}: median import time {:.1f} ms > {:.1f} ms'.format(module, result['import_ms']['median'], args.target_ms))
+        forbidden = [name for name in result['loaded'] if name in args.forbid]
+        if forbidden:
+            failures.append('{}: imports {}'.format(module, ', '.join(forbidden)))
+
+    if args.output is not None:
+        with open(args.output, 'w') as json_file:
+            json.dump(results, json_file, indent = 4)
+
+    for failure in failures:
+        print('FAILED', failure)
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
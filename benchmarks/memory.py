@@ -0,0 +1,232 @@
+"""
+Memory benchmark of CityLearn and of the replay buffers of the agents. For every number of buildings, simulation length and value of save_memory, a whole episode is simulated (with the actions of the rule-based controller) in its own process, and the benchmark reports:
+    - the peak and retained memory allocated by Python (tracemalloc), and the resident set size (RSS) of the process
+    - the memory held by every structure: the data of the buildings (sim_results), the histories kept by the buildings and their devices in energy_models.py (lists, which grow at every time-step with save_memory=False) and their arrays (the COPs of the heat pumps, and the histories, which are converted into arrays at the end of every episode), the district results of CityLearn and its other arrays, and the replay buffers of an agent if one is run (--agent), with the storage options of the buffers given as JSON
+    - the lines of code where most of the retained memory was allocated
+The results can be checked against budgets, given as a JSON file with the maximum value (in MB) of any metric, either for all the configurations ("default") or for a given one:
+    {"default": {"peak_traced_mb": 500}, "9b-4y-save_memory_False": {"device_histories_mb": 200}}
+The script exits with an error if any budget is exceeded.
+
+    python benchmarks/memory.py --buildings 3 9 --years 1 4 --output memory.json --budgets budgets.json
+    python benchmarks/memory.py --buildings 9 --years 1 --agent sac --replay-buffer-options '{"state_dtype": "float16", "share_next_state": true}'
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import resource
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+MB = 1024**2
+
+def _rss_mb():
+    # Current resident set size, read from /proc on Linux
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*resource.getpagesize()/MB
+    except OSError:
+        return float('nan')
+
+def deep_size(obj, seen):
+    """
+    Size in bytes of obj and of all the objects it contains (lists, tuples, dicts and the data of numpy arrays). Objects already in seen (i.e. the weather data shared by all the buildings) are not counted again.
+    """
+
+    import numpy as np
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, np.ndarray):
+        if obj.base is not None:
+            size += deep_size(obj.base, seen)
+    elif isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+def structure_sizes(env):
+    # Memory (MB) held by the structures of the environment
+    import numpy as np
+    seen = set()
+    sizes = {'sim_results_mb': 0, 'device_histories_mb': 0, 'device_arrays_mb': 0}
+    for building in env.buildings.values():
+        sizes['sim_results_mb'] += deep_size(building.sim_results, seen)
+        for device in [building, building.dhw_storage, building.cooling_storage, building.electrical_storage, building.dhw_heating_device, building.cooling_device]:
+            for name, value in vars(device).items():
+                if isinstance(value, list):
+                    sizes['device_histories_mb'] += deep_size(value, seen)
+                elif isinstance(value, np.ndarray):
+                    sizes['device_arrays_mb'] += deep_size(value, seen)
+
+    sizes['district_results_mb'] = deep_size(env._district_results, seen) + sum(deep_size(value, seen) for value in vars(env).values() if isinstance(value, list))
+    sizes['env_arrays_mb'] = sum(deep_size(value, seen) for value in vars(env).values() if isinstance(value, np.ndarray))
+    return {name: size/MB for name, size in sizes.items()}
+
+def buffer_sizes(agent):
+    # Memory (MB) held by the replay buffers of the agent, and by the buffers of the regression models of MARLISA. Arrays memory-mapped onto files are not counted, as their data is not held in memory
+    seen = set()
+    sizes = {'replay_buffers_mb': sum(deep_size(vars(replay_buffer), seen) for replay_buffer in agent.replay_buffer.values())}
+    if hasattr(agent, 'reg_buffer'):
+        sizes['regression_buffers_mb'] = sum(deep_size(vars(reg_buffer), seen) for reg_buffer in agent.reg_buffer.values())
+    return {name: size/MB for name, size in sizes.items()}
+
+def make_env(n_buildings, n_years, save_memory, seed, output_path):
+    from citylearn import CityLearn
+    from district_generator import generate_district, write_district
+
+    data_path = ROOT / 'data' / 'Climate_Zone_5'
+    buildings_states_actions = ROOT / 'buildings_state_action_space.json'
+
+    # Up to 9 buildings, the buildings of the climate zone 5 are used. Larger districts are generated by sampling them.
+    if n_buildings <= 9:
+        params = {'data_path': data_path,
+                  'building_attributes': 'building_attributes.json',
+                  'weather_file': 'weather_data.csv',
+                  'solar_profile': 'solar_generation_1kW.csv',
+                  'carbon_intensity': 'carbon_intensity.csv',
+                  'building_ids': ['Building_' + str(i) for i in range(1, n_buildings + 1)],
+                  'buildings_states_actions': str(buildings_states_actions)}
+    else:
+        district = generate_district(data_path, n_buildings, buildings_states_actions = buildings_states_actions, seed = seed)
+        params = write_district(district, output_path, data_path)
+    params['simulation_period'] = (0, 8760*n_years - 1)
+    return CityLearn(**params, central_agent = False, save_memory = save_memory)
+
+def run_config(config, agent_name, agent_steps, buffer_options, n_top, seed):
+    from citylearn import RBC_Agent
+
+    # The agent is imported before tracing, so that the memory allocated by the import of torch is not counted
+    if agent_name == 'sac':
+        from agents.sac import SAC as Agent
+    elif agent_name == 'marlisa':
+        from agents.marlisa import MARLISA as Agent
+
+    result = {'config': config}
+    tracemalloc.start()
+    rss_before = _rss_mb()
+    with tempfile.TemporaryDirectory() as output_path:
+        env = make_env(config['buildings'], config['years'], config['save_memory'], seed, output_path)
+    result['after_init'] = {'traced_mb': tracemalloc.get_traced_memory()[0]/MB, 'rss_mb': _rss_mb() - rss_before}
+
+    observation_spaces, action_spaces = env.get_state_action_spaces()
+    rbc = RBC_Agent(action_spaces)
+    hour_index = [state_name for state_name, value in env.buildings_states_actions[env.building_ids[0]]['states'].items() if value].index('hour')
+    state = env.reset()
+    snapshot_before = tracemalloc.take_snapshot()
+    traced_before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    done = False
+    while not done:
+        state, _, done, _ = env.step(rbc.select_action([state[0][hour_index]]))
+    env.cost()
+    traced, peak = tracemalloc.get_traced_memory()
+    result['episode'] = {'steps': len(env.net_electric_consumption), 'retained_traced_mb': (traced - traced_before)/MB, 'peak_traced_mb': peak/MB}
+
+    # The structures of the environment are measured at the end of the episode, before they are reset
+    result['structures'] = structure_sizes(env)
+
+    if agent_name is not None:
+        # Only random exploration is run, so that the replay buffers are filled without training the networks
+        params = {'building_ids': env.building_ids, 'buildings_states_actions': env.buildings_states_actions_filename, 'building_info': env.get_building_information(),
+                  'observation_spaces': observation_spaces, 'action_spaces': action_spaces, 'start_training': agent_steps + 1, 'exploration_period': agent_steps + 1,
+                  'replay_buffer_options': buffer_options['replay']}
+        if agent_name == 'marlisa':
+            params.update({'start_regression': 1, 'information_sharing': False, 'regression_buffer_options': buffer_options['regression']})
+        agent = Agent(**params)
+        state = env.reset()
+        actions, coordination_vars = agent.select_action(state)
+        for _ in range(agent_steps):
+            next_state, rewards, done, _ = env.step(actions)
+            actions_next, coordination_vars_next = agent.select_action(next_state)
+            agent.add_to_buffer(state, actions, rewards, next_state, done, coordination_vars, coordination_vars_next)
+            state, actions, coordination_vars = next_state, actions_next, coordination_vars_next
+            if done:
+                state = env.reset()
+        result['structures'].update(buffer_sizes(agent))
+
+    traced, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    result['total'] = {'traced_mb': traced/MB, 'peak_traced_mb': peak/MB, 'rss_mb': _rss_mb(), 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024}
+    result['top_allocations'] = [{'line': str(stat.traceback[0]), 'size_mb': stat.size_diff/MB, 'blocks': stat.count_diff} for stat in snapshot.compare_to(snapshot_before.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]), 'lineno')[:n_top]]
+    tracemalloc.stop()
+    return result
+
+def config_name(config):
+    return '{buildings}b-{years}y-save_memory_{save_memory}'.format(**config)
+
+def _flatten(result):
+    # Metrics of a result, keyed by their name in the budgets
+    metrics = {}
+    for section in ['after_init', 'episode', 'total', 'structures']:
+        for metric, value in result.get(section, {}).items():
+            metrics[metric if section in ['total', 'structures'] else section + '.' + metric] = value
+    return metrics
+
+def check_budgets(results, budgets):
+    """
+    Args:
+        results (dict): results of every configuration, keyed by config_name
+        budgets (dict): maximum value of any metric for all the configurations ('default') or for a given configuration
+    Returns:
+        violations (list): dicts with the configuration, metric, value and budget of every budget exceeded
+    """
+
+    violations = []
+    for name, result in results.items():
+        metrics = _flatten(result)
+        limits = dict(budgets.get('default', {}), **budgets.get(name, {}))
+        for metric, limit in limits.items():
+            if metric in metrics and metrics[metric] > limit:
+                violations.append({'config': name, 'metric': metric, 'value': metrics[metric], 'budget': limit})
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[1])
+    parser.add_argument('--buildings', type = int, nargs = '+', default = [3, 9], help = 'numbers of buildings. Districts with more than 9 buildings are generated with district_generator.py')
+    parser.add_argument('--years', type = int, nargs = '+', default = [1, 4], help = 'lengths of the simulation periods in years')
+    parser.add_argument('--save-memory', type = int, nargs = '+', default = [1, 0], help = 'values of save_memory (1 or 0)')
+    parser.add_argument('--agent', type = str, default = None, choices = ['sac', 'marlisa'], help = 'agent whose replay buffers are measured after the episode')
+    parser.add_argument('--agent-steps', type = int, default = 8760, help = 'time-steps of random exploration used to fill the replay buffers of the agent')
+    parser.add_argument('--replay-buffer-options', type = json.loads, default = {}, help = 'JSON keyword arguments of the replay buffers, i.e. \'{"state_dtype": "float16", "share_next_state": true, "path": "/tmp"}\'')
+    parser.add_argument('--regression-buffer-options', type = json.loads, default = {}, help = 'JSON keyword arguments of the regression buffers of MARLISA, i.e. \'{"dtype": "float16"}\'')
+    parser.add_argument('--top', type = int, default = 10, help = 'number of lines of code reported with the largest retained allocations')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', type = str, default = None, help = 'JSON file where the results are written')
+    parser.add_argument('--budgets', type = str, default = None, help = 'JSON file with the memory budgets (MB)')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for n_buildings, years, save_memory in itertools.product(args.buildings, args.years, args.save_memory):
+        config = {'buildings': n_buildings, 'years': years, 'save_memory': bool(save_memory)}
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(run_config, (config, args.agent, args.agent_steps, {'replay': args.replay_buffer_options, 'regression': args.regression_buffer_options}, args.top, args.seed))
+            except Exception as e:
+                result = {'config': config, 'error': repr(e)}
+        results[config_name(config)] = result
+        print(config_name(config), json.dumps(result.get('error', _flatten(result))))
+
+    if args.output is not None:
+        with open(args.output, 'w') as json_file:
+            json.dump(results, json_file, indent = 4)
+
+    if args.budgets is not None:
+        with open(args.budgets) as json_file:
+            budgets = json.load(json_file)
+        violations = check_budgets(results, budgets)
+        for violation in violations:
+            print('OVER BUDGET {config} {metric}: {value:.1f} MB > {budget:.1f} MB'.format(**violation))
+        if violations:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
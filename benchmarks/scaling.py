@@ -0,0 +1,92 @@
+"""
+Scaling benchmark of CityLearn with synthetic districts of increasing size. For every number of buildings, it reports the time needed to construct the environment, the step throughput and the memory used. Every district is simulated in its own process so that the memory measurements are independent. The districts are written to a temporary folder and loaded from it, or with --in-memory given to CityLearn without writing them (see district_generator.load_district).
+
+    python benchmarks/scaling.py --sizes 10 100 1000 10000 --output scaling.json
+    python benchmarks/scaling.py --sizes 1000 --in-memory
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+def _rss_mb():
+    # Current resident set size, read from /proc on Linux
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*resource.getpagesize()/1024**2
+    except OSError:
+        return float('nan')
+
+def run_size(n_buildings, data_path, n_hours, n_steps, seed, in_memory):
+    import numpy as np
+    from citylearn import CityLearn
+    from district_generator import generate_district, write_district, load_district
+
+    result = {'n_buildings': n_buildings}
+    with tempfile.TemporaryDirectory() as output_path:
+        t = time.perf_counter()
+        district = generate_district(data_path, n_buildings, buildings_states_actions = ROOT / 'buildings_state_action_space.json', n_hours = n_hours, seed = seed)
+        params = load_district(district, data_path) if in_memory else write_district(district, output_path, data_path)
+        result['generation_time (s)'] = time.perf_counter() - t
+        del district
+
+        rss_before = _rss_mb()
+        t = time.perf_counter()
+        env = CityLearn(**params, central_agent = False, save_memory = True)
+        result['construction_time (s)'] = time.perf_counter() - t
+        result['rss_env (MB)'] = _rss_mb() - rss_before
+
+    _, action_spaces = env.get_state_action_spaces()
+    actions = [np.zeros(action_space.shape) for action_space in action_spaces]
+
+    t = time.perf_counter()
+    env.reset()
+    result['reset_time (s)'] = time.perf_counter() - t
+
+    n_steps = min(n_steps, env.episode_time_steps[1] - env.episode_time_steps[0])
+    t = time.perf_counter()
+    for _ in range(n_steps):
+        env.step(actions)
+    elapsed = time.perf_counter() - t
+    result['steps_per_second'] = n_steps/elapsed
+    result['building_steps_per_second'] = n_steps*n_buildings/elapsed
+    result['peak_rss (MB)'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[1])
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10, 100, 1000, 10000], help = 'numbers of buildings of the synthetic districts')
+    parser.add_argument('--climate-zone', type = int, default = 5, help = 'climate zone whose buildings are sampled')
+    parser.add_argument('--hours', type = int, default = 8760, help = 'number of hours of data of every building')
+    parser.add_argument('--steps', type = int, default = 168, help = 'number of time-steps used to measure the throughput')
+    parser.add_argument('--timeout', type = float, default = 3600, help = 'maximum number of seconds for every district size')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--in-memory', action = 'store_true', help = 'give the districts to CityLearn in memory instead of writing them to a temporary folder')
+    parser.add_argument('--output', type = str, default = None, help = 'JSON file where the results are written')
+    args = parser.parse_args()
+
+    data_path = ROOT / 'data' / ('Climate_Zone_' + str(args.climate_zone))
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for n_buildings in args.sizes:
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply_async(run_size, (n_buildings, data_path, args.hours, args.steps, args.seed, args.in_memory)).get(timeout = args.timeout)
+            except Exception as e:
+                result = {'n_buildings': n_buildings, 'error': repr(e)}
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output is not None:
+        with open(args.output, 'w') as json_file:
+            json.dump(results, json_file, indent = 4)
+
+if __name__ == '__main__':
+    main()
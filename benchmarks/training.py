@@ -0,0 +1,193 @@
+"""
+Training throughput benchmark of the SAC and MARLISA agents, on CPU. For every agent, number of buildings, batch size, update_per_step, (for SAC) batched_update and (for MARLISA) iterations_as and information_sharing, the agent is run with CityLearn as in main.py and the benchmark reports:
+    - the latency of select_action, during the random exploration and with the policy networks
+    - the time of add_to_buffer, split into the one-off pass that computes the normalization statistics of the replay buffer (and fits the PCA of MARLISA) when the training starts, the calls that fit the regression models of MARLISA (state_estimator.fit) and the other calls
+    - the gradient updates per second (one update of the critics and the policy of one building) and the time per update and building
+    - the time of the replay buffer sampling
+The short exploration phase used by the benchmark (--explore-steps) only makes sure that the replay buffer contains enough samples to start training. Every configuration is run in its own process.
+
+    python benchmarks/training.py --buildings 1 3 9 --batch-sizes 256 --output agents.json
+    python benchmarks/training.py --agents sac --buildings 9 --batched-update 0 1
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+def _stats(times_ns):
+    import numpy as np
+    times = np.array(times_ns, dtype=np.float64)/1e6
+    if len(times) == 0:
+        return {'calls': 0}
+    return {'calls': len(times), 'mean_ms': times.mean(), 'p50_ms': np.percentile(times, 50), 'p90_ms': np.percentile(times, 90), 'max_ms': times.max(), 'total_ms': times.sum()}
+
+def make_env(n_buildings, climate_zone, seed):
+    from citylearn import CityLearn
+    from district_generator import generate_district, load_district
+
+    data_path = ROOT / 'data' / ('Climate_Zone_' + str(climate_zone))
+    buildings_states_actions = ROOT / 'buildings_state_action_space.json'
+
+    # Up to 9 buildings, the buildings of the climate zone are used. Larger districts are generated by sampling them, and kept in memory.
+    if n_buildings <= 9:
+        params = {'data_path': data_path,
+                  'building_attributes': 'building_attributes.json',
+                  'weather_file': 'weather_data.csv',
+                  'solar_profile': 'solar_generation_1kW.csv',
+                  'carbon_intensity': 'carbon_intensity.csv',
+                  'building_ids': ['Building_' + str(i) for i in range(1, n_buildings + 1)],
+                  'buildings_states_actions': str(buildings_states_actions)}
+    else:
+        district = generate_district(data_path, n_buildings, buildings_states_actions = buildings_states_actions, n_hours = 8760, seed = seed)
+        params = load_district(district, data_path)
+    params['simulation_period'] = (0, 8759)
+    return CityLearn(**params, central_agent = False, save_memory = True)
+
+def make_agent(config, env, explore_steps):
+    observation_spaces, action_spaces = env.get_state_action_spaces()
+    params = {'building_ids': env.building_ids,
+              'buildings_states_actions': env.buildings_states_actions,
+              'building_info': env.get_building_information(),
+              'observation_spaces': observation_spaces,
+              'action_spaces': action_spaces,
+              'hidden_dim': [256, 256],
+              'batch_size': config['batch_size'],
+              'start_training': explore_steps,
+              'exploration_period': explore_steps,
+              'update_per_step': config['update_per_step']}
+
+    if config['agent'] == 'sac':
+        from agents.sac import SAC
+        return SAC(**params, batched_update = config['batched_update'])
+
+    # MARLISA only pushes samples into the replay buffer once its regression model has been fitted, half-way through the exploration
+    from agents.marlisa import MARLISA
+    return MARLISA(**params, start_regression = (explore_steps - config['batch_size'])//2, information_sharing = config['information_sharing'], iterations_as = config['iterations_as'], pca_compression = .95)
+
+def run_config(config, explore_steps, train_steps, regression_freq, n_threads, seed):
+    # The agents use the GPU if there is one, so it is hidden before torch is imported
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    import numpy as np
+    import torch
+    from profiler import Profiler
+    torch.set_num_threads(n_threads)
+
+    result = {'config': config}
+    env = make_env(config['buildings'], 5, seed)
+    agent = make_agent(config, env, explore_steps)
+    if regression_freq is not None:
+        agent.regression_freq = regression_freq
+
+    # The sampling of the replay buffers (including the conversion of the batches into tensors) and the fits of the regression models and PCA are timed with timed wrappers of their methods
+    profiler = Profiler()
+    for uid in env.building_ids:
+        profiler.wrap(agent.replay_buffer[uid], 'sample_tensors', 'sample')
+        if config['agent'] == 'marlisa':
+            profiler.wrap(agent.state_estimator[uid], 'fit', 'state_estimator.fit')
+            profiler.wrap(agent.pca[uid], 'fit', 'pca.fit')
+    flag = agent.norm_flag if config['agent'] == 'sac' else agent.pca_flag
+
+    select_explore_ns, select_policy_ns, add_one_off_ns, add_fit_ns, add_train_ns, add_explore_ns = [], [], [], [], [], []
+    sample_ns_train = 0
+    state = env.reset()
+    t = time.perf_counter_ns()
+    actions, coordination_vars = agent.select_action(state)
+    select_explore_ns.append(time.perf_counter_ns() - t)
+    for i in range(explore_steps + train_steps):
+        next_state, rewards, done, _ = env.step(actions)
+        explore = agent.time_step + 1 <= agent.exploration_period
+        t = time.perf_counter_ns()
+        actions_next, coordination_vars_next = agent.select_action(next_state)
+        (select_explore_ns if explore else select_policy_ns).append(time.perf_counter_ns() - t)
+
+        normalized = sum(flag.values())
+        n_fits = profiler.calls.get('state_estimator.fit', 0)
+        sample_ns = profiler.total_ns.get('sample', 0)
+        t = time.perf_counter_ns()
+        agent.add_to_buffer(state, actions, rewards, next_state, done, coordination_vars, coordination_vars_next)
+        elapsed = time.perf_counter_ns() - t
+        if sum(flag.values()) > normalized:
+            add_one_off_ns.append(elapsed)
+        elif profiler.calls.get('state_estimator.fit', 0) > n_fits:
+            add_fit_ns.append(elapsed)
+        elif profiler.total_ns.get('sample', 0) > sample_ns:
+            add_train_ns.append(elapsed)
+            sample_ns_train += profiler.total_ns['sample'] - sample_ns
+        else:
+            add_explore_ns.append(elapsed)
+
+        coordination_vars = coordination_vars_next
+        state, actions = next_state, actions_next
+        if done:
+            state = env.reset()
+
+    n_updates = len(add_train_ns)*config['update_per_step']*config['buildings']
+    result['select_action_explore'] = _stats(select_explore_ns)
+    result['select_action_policy'] = _stats(select_policy_ns)
+    result['add_to_buffer_explore'] = _stats(add_explore_ns)
+    result['add_to_buffer_one_off_normalization'] = _stats(add_one_off_ns)
+    result['add_to_buffer_regression_fit'] = _stats(add_fit_ns)
+    result['add_to_buffer_train'] = _stats(add_train_ns)
+    result['updates'] = {'updates': n_updates}
+    if n_updates > 0:
+        update_ns = sum(add_train_ns) - sample_ns_train
+        result['updates']['updates_per_second'] = n_updates/(update_ns/1e9)
+        result['updates']['ms_per_update'] = update_ns/1e6/n_updates
+        result['updates']['ms_per_building_per_step'] = update_ns/1e6/len(add_train_ns)/config['buildings']
+    summary = profiler.summary()
+    for name in ['sample', 'state_estimator.fit', 'pca.fit']:
+        if name in summary:
+            result[name] = summary[name]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[1])
+    parser.add_argument('--agents', type = str, nargs = '+', default = ['sac', 'marlisa'], choices = ['sac', 'marlisa'])
+    parser.add_argument('--buildings', type = int, nargs = '+', default = [1, 3, 9], help = 'numbers of buildings. Districts with more than 9 buildings are generated with district_generator.py')
+    parser.add_argument('--batch-sizes', type = int, nargs = '+', default = [256])
+    parser.add_argument('--update-per-step', type = int, nargs = '+', default = [1, 2])
+    parser.add_argument('--batched-update', type = int, nargs = '+', default = [0], help = 'values of batched_update of SAC (1 or 0)')
+    parser.add_argument('--iterations-as', type = int, nargs = '+', default = [2], help = 'iterations of the action selection of MARLISA')
+    parser.add_argument('--information-sharing', type = int, nargs = '+', default = [1, 0], help = 'values of information_sharing of MARLISA (1 or 0)')
+    parser.add_argument('--explore-steps', type = int, default = None, help = 'time-steps of random exploration before the training starts. batch size + 100 by default')
+    parser.add_argument('--train-steps', type = int, default = 200, help = 'time-steps timed while training')
+    parser.add_argument('--regression-freq', type = int, default = 100, help = 'time-steps between the fits of the regression models of MARLISA (2500 in the agent)')
+    parser.add_argument('--threads', type = int, default = 1, help = 'number of threads used by torch')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', type = str, default = None, help = 'JSON file where the results are written')
+    args = parser.parse_args()
+
+    configs = []
+    for agent, n_buildings, batch_size, update_per_step in itertools.product(args.agents, args.buildings, args.batch_sizes, args.update_per_step):
+        if agent == 'sac':
+            for batched_update in args.batched_update:
+                configs.append({'agent': agent, 'buildings': n_buildings, 'batch_size': batch_size, 'update_per_step': update_per_step, 'batched_update': bool(batched_update)})
+        else:
+            for iterations_as, information_sharing in itertools.product(args.iterations_as, args.information_sharing):
+                configs.append({'agent': agent, 'buildings': n_buildings, 'batch_size': batch_size, 'update_per_step': update_per_step, 'iterations_as': iterations_as, 'information_sharing': bool(information_sharing)})
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for config in configs:
+        explore_steps = args.explore_steps if args.explore_steps is not None else config['batch_size'] + 100
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(run_config, (config, explore_steps, args.train_steps, args.regression_freq, args.threads, args.seed))
+            except Exception as e:
+                result = {'config': config, 'error': repr(e)}
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output is not None:
+        with open(args.output, 'w') as json_file:
+            json.dump(results, json_file, indent = 4)
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,60 @@
-import gym
-from gym.utils import seeding
 import numpy as np
-import pandas as pd
+import copy
+import inspect
 import json
-from gym import spaces
-from energy_models import Battery, HeatPump, ElectricHeater, EnergyStorage, Building
-from reward_function import reward_function_sa, reward_function_ma
+import os
+import re
+from collections.abc import Mapping
+from energy_models import Battery, HeatPump, ElectricHeater, EnergyStorage, Building, box
+from reward_function import reward_function_sa, reward_function_ma, get_reward
+from profiler import Profiler
 from pathlib import Path
-gym.logger.set_level(40)
+
+# States that are specific to every building and read from its data. All the other states read from the data (calendar, weather and carbon intensity) are the same for all the buildings.
+BUILDING_STATES = ['t_in', 'avg_unmet_setpoint', 'rh_in', 'non_shiftable_load', 'solar_gen']
+
+# Periods of the calendar states that can be encoded as the sine and cosine of their phase (i.e. hour_sin, month_cos)
+CYCLICAL_STATES = {'hour': 24, 'month': 12}
+
+# States that depend on the actions taken and are computed at every time-step
+DYNAMIC_STATES = ['net_electricity_consumption', 'cooling_storage_soc', 'dhw_storage_soc', 'electrical_storage_soc']
+
+# Actions of every building, in the order in which they are taken
+ACTIONS = ['cooling_storage', 'dhw_storage', 'electrical_storage']
+
+# Series of every building returned by CityLearn.get_forecast()
+FORECAST_SERIES = ['non_shiftable_load', 'solar_gen', 'dhw_demand', 'cooling_demand', 'carbon_intensity']
+
+# Control variables which are used to display the results and the behavior of the buildings at the district level
+DISTRICT_RESULTS = ['carbon_emissions', 'net_electric_consumption', 'net_electric_consumption_no_storage', 'net_electric_consumption_no_pv_no_storage', 'electric_consumption_electric_storage', 'electric_consumption_dhw_storage', 'electric_consumption_cooling_storage', 'electric_consumption_dhw', 'electric_consumption_cooling', 'electric_consumption_appliances', 'electric_generation']
+
+def district_result(name):
+    # The district results are written into float64 arrays allocated at the beginning of every episode, so that the simulation does not allocate memory at every time-step. They are returned as read-only views up to the last time-step simulated.
+    def get_result(self):
+        result = self._district_results[name][:self._n_recorded_steps]
+        result.flags.writeable = False
+        return result
+    return property(get_result)
+
+class _LazyBuildingInformation(Mapping):
+    # Building information given to reward_function_ma. It is only computed by CityLearn.get_building_information() the first time it is read, since the correlations among all the buildings grow with the square of the number of buildings and the default rewards do not use them.
+    def __init__(self, env):
+        self._env = env
+        self._building_info = None
+        
+    def _get(self):
+        if self._building_info is None:
+            self._building_info = self._env.get_building_information()
+        return self._building_info
+    
+    def __getitem__(self, uid):
+        return self._get()[uid]
+    
+    def __iter__(self):
+        return iter(self._get())
+    
+    def __len__(self):
+        return len(self._get())
 
 # Reference Rule-based controller. Used as a baseline to calculate the costs in CityLearn
 # It requires, at least, the hour of the day as input state
@@ -39,7 +86,81 @@ class RBC_Agent:
         
         return np.array(a, dtype='object')
 
-def auto_size(buildings):
+def parse_derived_state(state_name):
+    """
+    Derived states are computed from the states read from the data when the data is loaded:
+        <hour|month>_sin, <hour|month>_cos: cyclical encoding of the calendar state
+        <state>_lag_<k>h: value of the state k hours before
+        <state>_rolling_mean_<k>h, <state>_rolling_max_<k>h: mean and maximum of the state over the last k hours, including the current time-step
+        <state>_daily_cumulative: sum of the state since the beginning of the day, including the current time-step
+    Returns:
+        (base_state, feature, hours) if state_name is a derived state, None otherwise
+    """
+    
+    for base_state in CYCLICAL_STATES:
+        if state_name in [base_state + '_sin', base_state + '_cos']:
+            return base_state, state_name[-3:], None
+        
+    match = re.fullmatch(r'(.+)_(lag|rolling_mean|rolling_max)_(\d+)h', state_name)
+    if match is not None:
+        return match.group(1), match.group(2), int(match.group(3))
+    
+    if state_name.endswith('_daily_cumulative'):
+        return state_name[:-len('_daily_cumulative')], 'daily_cumulative', None
+    
+    return None
+
+def is_building_state(state_name):
+    # Derived states are specific to every building if the state they are computed from is
+    derived_state = parse_derived_state(state_name)
+    return (state_name if derived_state is None else derived_state[0]) in BUILDING_STATES
+
+def derived_states(sim_results, state_names, time_resolution = 1):
+    """
+    Computes the derived states over the whole series of a building at once, so that they are then served like the states read from the data. Before the beginning of the data, the first value of every series is repeated.
+    Args:
+        sim_results (dict): series of the building, read from the data
+        state_names (list): names of the states, of which only the derived ones are computed
+        time_resolution (float): hours per time-step, used to convert the windows in hours into time-steps
+    Returns:
+        results (dict): series of every derived state
+    """
+    
+    results = {}
+    for state_name in state_names:
+        derived_state = parse_derived_state(state_name)
+        if derived_state is None:
+            continue
+        base_state, feature, hours = derived_state
+        assert base_state in sim_results, 'Unknown state ' + base_state + ' in the derived state ' + state_name
+        x = np.array(sim_results[base_state], dtype=float)
+        
+        if feature in ['sin', 'cos']:
+            phase = 2*np.pi*x/CYCLICAL_STATES[base_state]
+            y = np.sin(phase) if feature == 'sin' else np.cos(phase)
+            
+        elif feature == 'daily_cumulative':
+            # A new day starts whenever the hour of the day does not increase
+            hour = np.array(sim_results['hour'])
+            day_start = np.flatnonzero(np.r_[True, hour[1:] <= hour[:-1]])
+            cumulative = np.cumsum(x)
+            y = cumulative - np.repeat(np.r_[0., cumulative[day_start[1:] - 1]], np.diff(np.r_[day_start, len(x)]))
+            
+        else:
+            steps = int(round(hours/time_resolution))
+            assert steps >= 1 and abs(steps*time_resolution - hours) < 1e-9, 'The window of the derived state ' + state_name + ' must be a multiple of time_resolution'
+            padded = np.concatenate([np.full(steps, x[0]), x])
+            if feature == 'lag':
+                y = padded[:len(x)]
+            else:
+                windows = np.lib.stride_tricks.sliding_window_view(padded[1:], steps)
+                y = windows.mean(axis=1) if feature == 'rolling_mean' else windows.max(axis=1)
+                
+        results[state_name] = list(y)
+        
+    return results
+
+def auto_size(buildings, time_resolution = 1):
     for building in buildings.values():
         
         # Autosize guarantees that the DHW device is large enough to always satisfy the maximum DHW demand
@@ -60,9 +181,9 @@ def auto_size(buildings):
 
             building.cooling_device.nominal_power = (np.array(building.sim_results['cooling_demand'])/building.cooling_device.cop_cooling).max()
         
-        # Defining the capacity of the storage devices as a number of times the maximum demand
-        building.dhw_storage.capacity = max(building.sim_results['dhw_demand'])*building.dhw_storage.capacity
-        building.cooling_storage.capacity = max(building.sim_results['cooling_demand'])*building.cooling_storage.capacity
+        # Defining the capacity of the storage devices as a number of times the maximum hourly demand
+        building.dhw_storage.capacity = max(building.sim_results['dhw_demand'])/time_resolution*building.dhw_storage.capacity
+        building.cooling_storage.capacity = max(building.sim_results['cooling_demand'])/time_resolution*building.cooling_storage.capacity
         
         # Done in order to avoid dividing by 0 if the capacity is 0
         if building.dhw_storage.capacity <= 0.00001:
@@ -71,11 +192,125 @@ def auto_size(buildings):
             building.cooling_storage.capacity = 0.00001
         
         
-def building_loader(data_path, building_attributes, weather_file, solar_profile, carbon_intensity, building_ids, buildings_states_actions, save_memory = True):
-    with open(building_attributes) as json_file:
-        data = json.load(json_file)
+def read_data(csv_path, cache = True):
+    """
+    Reads a data file into a numpy array for every column. pandas is only imported to parse the CSV file, whose columns are then saved into a binary cache (__cache__/<file name>.npz, next to the CSV file) which is read instead as long as the CSV file is not modified.
+    Args:
+        csv_path (Path): CSV file
+        cache (bool): whether the binary cache is read and written
+    Returns:
+        data (dict): column name -> numpy array
+    """
+    
+    csv_path = Path(csv_path)
+    stat = csv_path.stat()
+    cache_path = csv_path.parent / '__cache__' / (csv_path.name + '.npz')
+    if cache:
+        try:
+            with np.load(cache_path, allow_pickle = False) as cached:
+                if cached['source'].tolist() == [stat.st_size, stat.st_mtime_ns]:
+                    return {str(column): cached['column_' + str(i)] for i, column in enumerate(cached['columns'])}
+        except Exception:
+            # Missing, outdated or unreadable cache
+            pass
+    
+    import pandas as pd
+    with open(csv_path) as csv_file:
+        data_frame = pd.read_csv(csv_file)
+    # Text columns (i.e. dates) are read as strings, so that they can be saved into the cache without pickling them
+    data = {column: data_frame[column].to_numpy() for column in data_frame.columns}
+    data = {column: values.astype(str) if values.dtype == object else values for column, values in data.items()}
+    
+    if cache:
+        # The cache is written into a temporary file that is then renamed, so that processes loading the same data at the same time never read an incomplete cache. It is not written if the folder of the data is read-only.
+        tmp_path = cache_path.with_name(cache_path.name + '.' + str(os.getpid()) + '.tmp')
+        try:
+            cache_path.parent.mkdir(exist_ok = True)
+            with open(tmp_path, 'wb') as cache_file:
+                np.savez(cache_file, columns = np.array(list(data)), source = np.array([stat.st_size, stat.st_mtime_ns]), **{'column_' + str(i): values for i, values in enumerate(data.values())})
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return data
+        
+def resample(data, factor, sum_columns = (), first_columns = ()):
+    """
+    Aggregates every factor consecutive rows of a time series into one. Incomplete blocks at the end of the data are dropped.
+    Args:
+        data (dict): column name -> numpy array with one row per time-step of the original data
+        factor (int): number of rows aggregated into one time-step of the simulation
+        sum_columns (list): extensive variables (i.e. energy), which are summed
+        first_columns (list): calendar variables, which take the value of the first row of the block
+    All the other columns are intensive variables (i.e. temperature or carbon intensity), which are averaged
+    """
+    
+    if factor == 1:
+        return data
+    
+    n_rows = len(next(iter(data.values())))//factor*factor
+    blocks = {column: np.asarray(values)[:n_rows].reshape(-1, factor) for column, values in data.items()}
+    return {column: values.sum(axis=1) if column in sum_columns else values[:, 0] if column in first_columns else values.mean(axis=1) for column, values in blocks.items()}
+    
+def building_loader(data_path, building_attributes, weather_file, solar_profile, carbon_intensity, building_ids, buildings_states_actions, save_memory = True, time_resolution = 1, data_resolution = 1, data_cache = True, files = None):
+    # With files, the data is already in memory (i.e. a synthetic district, see district_generator.load_district) and every file is looked up by its name instead of being read
+    if files is None:
+        with open(building_attributes) as json_file:
+            data = json.load(json_file)
+        read = lambda path: read_data(path, data_cache)
+    else:
+        data = files[Path(building_attributes).name]
+        read = lambda path: files[Path(path).name]
+        
+    # Number of rows of the data files that make a time-step of the simulation
+    factor = int(round(time_resolution/data_resolution))
+    assert factor >= 1 and abs(factor*data_resolution - time_resolution) < 1e-9, 'time_resolution must be a multiple of data_resolution'
+    
+    # Hourly losses of the storage devices are converted to losses per time-step, and power limits (kW) to energy limits per time-step (kWh)
+    loss_per_step = lambda loss_coef: 1 - (1 - loss_coef)**time_resolution
+    energy_per_step = lambda nominal_power: nominal_power if nominal_power in [None, 'autosize'] else nominal_power*time_resolution
+
+    # The weather, solar generation profile and carbon intensity are shared by all the buildings, so they are read only once
+    weather_data = resample(read(weather_file), factor)
+    
+    weather_results = {}
+    weather_results['t_out'] = list(weather_data['Outdoor Drybulb Temperature [C]'])
+    weather_results['rh_out'] = list(weather_data['Outdoor Relative Humidity [%]'])
+    weather_results['diffuse_solar_rad'] = list(weather_data['Diffuse Solar Radiation [W/m2]'])
+    weather_results['direct_solar_rad'] = list(weather_data['Direct Solar Radiation [W/m2]'])
+    
+    # Reading weather forecasts
+    weather_results['t_out_pred_6h'] = list(weather_data['6h Prediction Outdoor Drybulb Temperature [C]'])
+    weather_results['t_out_pred_12h'] = list(weather_data['12h Prediction Outdoor Drybulb Temperature [C]'])
+    weather_results['t_out_pred_24h'] = list(weather_data['24h Prediction Outdoor Drybulb Temperature [C]'])
+    
+    weather_results['rh_out_pred_6h'] = list(weather_data['6h Prediction Outdoor Relative Humidity [%]'])
+    weather_results['rh_out_pred_12h'] = list(weather_data['12h Prediction Outdoor Relative Humidity [%]'])
+    weather_results['rh_out_pred_24h'] = list(weather_data['24h Prediction Outdoor Relative Humidity [%]'])
+    
+    weather_results['diffuse_solar_rad_pred_6h'] = list(weather_data['6h Prediction Diffuse Solar Radiation [W/m2]'])
+    weather_results['diffuse_solar_rad_pred_12h'] = list(weather_data['12h Prediction Diffuse Solar Radiation [W/m2]'])
+    weather_results['diffuse_solar_rad_pred_24h'] = list(weather_data['24h Prediction Diffuse Solar Radiation [W/m2]'])
+    
+    weather_results['direct_solar_rad_pred_6h'] = list(weather_data['6h Prediction Direct Solar Radiation [W/m2]'])
+    weather_results['direct_solar_rad_pred_12h'] = list(weather_data['12h Prediction Direct Solar Radiation [W/m2]'])
+    weather_results['direct_solar_rad_pred_24h'] = list(weather_data['24h Prediction Direct Solar Radiation [W/m2]'])
+    
+    carbon_data = read(carbon_intensity)
+    weather_results['carbon_intensity'] = list(resample({'kg_CO2/kWh': carbon_data['kg_CO2/kWh']}, factor)['kg_CO2/kWh'])
+    
+    solar_data = read(solar_profile)
+        
+    # The inverter power (W) is converted into the energy generated in every row of the data (kWh) before aggregating it
+    solar_data = resample({'Hourly Data: AC inverter power (W)': solar_data['Hourly Data: AC inverter power (W)']*data_resolution}, factor, sum_columns = ['Hourly Data: AC inverter power (W)'])
+
+    # Derived states enabled by any of the buildings are computed for all of them, so that the states shared by all the buildings can be read from any of them
+    derived_state_names = []
+    for uid in building_ids:
+        for state_name, value in buildings_states_actions[uid]['states'].items():
+            if value and parse_derived_state(state_name) is not None and state_name not in derived_state_names:
+                derived_state_names.append(state_name)
 
-    buildings, observation_spaces, action_spaces = {},[],[]
+    buildings = {}
     s_low_central_agent, s_high_central_agent, appended_states = [], [], []
     a_low_central_agent, a_high_central_agent, appended_actions = [], [], []
     for uid, attributes in zip(data, data.values()):
@@ -83,33 +318,32 @@ def building_loader(data_path, building_attributes, weather_file, solar_profile,
             
             battery = Battery(capacity = attributes['Battery']['capacity'],
                                          capacity_loss_coef = attributes['Battery']['capacity_loss_coefficient'],
-                                         loss_coef = attributes['Battery']['loss_coefficient'],
+                                         loss_coef = loss_per_step(attributes['Battery']['loss_coefficient']),
                                          efficiency = attributes['Battery']['efficiency'],
-                                         nominal_power = attributes['Battery']['nominal_power'],
+                                         nominal_power = energy_per_step(attributes['Battery']['nominal_power']),
                                          power_efficiency_curve = attributes['Battery']['power_efficiency_curve'],
                                          capacity_power_curve = attributes['Battery']['capacity_power_curve'],                              
                                          save_memory = save_memory)        
             
-            heat_pump = HeatPump(nominal_power = attributes['Heat_Pump']['nominal_power'], 
+            heat_pump = HeatPump(nominal_power = energy_per_step(attributes['Heat_Pump']['nominal_power']), 
                                  eta_tech = attributes['Heat_Pump']['technical_efficiency'], 
                                  t_target_heating = attributes['Heat_Pump']['t_target_heating'], 
                                  t_target_cooling = attributes['Heat_Pump']['t_target_cooling'], save_memory = save_memory)
 
-            electric_heater = ElectricHeater(nominal_power = attributes['Electric_Water_Heater']['nominal_power'], 
+            electric_heater = ElectricHeater(nominal_power = energy_per_step(attributes['Electric_Water_Heater']['nominal_power']), 
                                              efficiency = attributes['Electric_Water_Heater']['efficiency'], save_memory = save_memory)
 
             chilled_water_tank = EnergyStorage(capacity = attributes['Chilled_Water_Tank']['capacity'],
-                                               loss_coef = attributes['Chilled_Water_Tank']['loss_coefficient'], save_memory = save_memory)
+                                               loss_coef = loss_per_step(attributes['Chilled_Water_Tank']['loss_coefficient']), save_memory = save_memory)
 
             dhw_tank = EnergyStorage(capacity = attributes['DHW_Tank']['capacity'],
-                                     loss_coef = attributes['DHW_Tank']['loss_coefficient'], save_memory = save_memory)
+                                     loss_coef = loss_per_step(attributes['DHW_Tank']['loss_coefficient']), save_memory = save_memory)
 
             building = Building(buildingId = uid, dhw_storage = dhw_tank, cooling_storage = chilled_water_tank, electrical_storage = battery, dhw_heating_device = electric_heater, cooling_device = heat_pump, save_memory = save_memory)
 
             data_file = str(uid) + '.csv'
             simulation_data = data_path / data_file
-            with open(simulation_data) as csv_file:
-                data = pd.read_csv(csv_file)
+            data = resample(read(simulation_data), factor, sum_columns = ['Cooling Load [kWh]', 'DHW Heating [kWh]', 'Equipment Electric Power [kWh]'], first_columns = ['Month', 'Day Type', 'Hour', 'Daylight Savings Status'])
 
             building.sim_results['cooling_demand'] = list(data['Cooling Load [kWh]'])
             building.sim_results['dhw_demand'] = list(data['DHW Heating [kWh]'])
@@ -122,45 +356,16 @@ def building_loader(data_path, building_attributes, weather_file, solar_profile,
             building.sim_results['avg_unmet_setpoint'] = list(data['Average Unmet Cooling Setpoint Difference [C]'])
             building.sim_results['rh_in'] = list(data['Indoor Relative Humidity [%]'])
             
-            with open(weather_file) as csv_file:
-                weather_data = pd.read_csv(csv_file)
-                
-            building.sim_results['t_out'] = list(weather_data['Outdoor Drybulb Temperature [C]'])
-            building.sim_results['rh_out'] = list(weather_data['Outdoor Relative Humidity [%]'])
-            building.sim_results['diffuse_solar_rad'] = list(weather_data['Diffuse Solar Radiation [W/m2]'])
-            building.sim_results['direct_solar_rad'] = list(weather_data['Direct Solar Radiation [W/m2]'])
-            
-            # Reading weather forecasts
-            building.sim_results['t_out_pred_6h'] = list(weather_data['6h Prediction Outdoor Drybulb Temperature [C]'])
-            building.sim_results['t_out_pred_12h'] = list(weather_data['12h Prediction Outdoor Drybulb Temperature [C]'])
-            building.sim_results['t_out_pred_24h'] = list(weather_data['24h Prediction Outdoor Drybulb Temperature [C]'])
-            
-            building.sim_results['rh_out_pred_6h'] = list(weather_data['6h Prediction Outdoor Relative Humidity [%]'])
-            building.sim_results['rh_out_pred_12h'] = list(weather_data['12h Prediction Outdoor Relative Humidity [%]'])
-            building.sim_results['rh_out_pred_24h'] = list(weather_data['24h Prediction Outdoor Relative Humidity [%]'])
-            
-            building.sim_results['diffuse_solar_rad_pred_6h'] = list(weather_data['6h Prediction Diffuse Solar Radiation [W/m2]'])
-            building.sim_results['diffuse_solar_rad_pred_12h'] = list(weather_data['12h Prediction Diffuse Solar Radiation [W/m2]'])
-            building.sim_results['diffuse_solar_rad_pred_24h'] = list(weather_data['24h Prediction Diffuse Solar Radiation [W/m2]'])
-            
-            building.sim_results['direct_solar_rad_pred_6h'] = list(weather_data['6h Prediction Direct Solar Radiation [W/m2]'])
-            building.sim_results['direct_solar_rad_pred_12h'] = list(weather_data['12h Prediction Direct Solar Radiation [W/m2]'])
-            building.sim_results['direct_solar_rad_pred_24h'] = list(weather_data['24h Prediction Direct Solar Radiation [W/m2]'])
+            # The weather variables are the same for all the buildings, and their lists are shared instead of copied
+            building.sim_results.update(weather_results)
             
             # Reading the building attributes
             building.building_type = attributes['Building_Type']
             building.climate_zone = attributes['Climate_Zone']
             building.solar_power_capacity = attributes['Solar_Power_Installed(kW)']
 
-            with open(solar_profile) as csv_file:
-                data = pd.read_csv(csv_file)
-
-            building.sim_results['solar_gen'] = list(attributes['Solar_Power_Installed(kW)']*data['Hourly Data: AC inverter power (W)']/1000)
-            
-            with open(carbon_intensity) as csv_file:
-                data = pd.read_csv(csv_file)
-
-            building.sim_results['carbon_intensity'] = list(data['kg_CO2/kWh'])
+            building.sim_results['solar_gen'] = list(attributes['Solar_Power_Installed(kW)']*solar_data['Hourly Data: AC inverter power (W)']/1000)
+            building.sim_results.update(derived_states(building.sim_results, derived_state_names, time_resolution))
             
             # Finding the max and min possible values of all the states, which can then be used by the RL agent to scale the states and train any function approximators more effectively
             s_low, s_high = [], []
@@ -179,7 +384,7 @@ def building_loader(data_path, building_attributes, weather_file, solar_profile,
                         s_high.append(max(building.sim_results[state_name]))
                         
                         # Create boundaries of the observation space of a centralized agent (if a central agent is being used instead of decentralized ones). We include all the weather variables used as states, and use the list appended_states to make sure we don't include any repeated states (i.e. weather variables measured by different buildings)
-                        if state_name in ['t_in', 'avg_unmet_setpoint', 'rh_in', 'non_shiftable_load', 'solar_gen']:
+                        if is_building_state(state_name):
                             s_low_central_agent.append(min(building.sim_results[state_name]))
                             s_high_central_agent.append(max(building.sim_results[state_name]))
                             
@@ -193,6 +398,7 @@ def building_loader(data_path, building_attributes, weather_file, solar_profile,
                         s_low_central_agent.append(0.0)
                         s_high_central_agent.append(1.0)
             
+            # With time-steps longer than one hour the storage devices can be charged or discharged by several times the maximum hourly demand within a single time-step
             '''The energy storage (tank) capacity indicates how many times bigger the tank is compared to the maximum hourly energy demand of the building (cooling or DHW respectively), which sets a lower bound for the action of 1/tank_capacity, as the energy storage device can't provide the building with more energy than it will ever need for a given hour. The heat pump is sized using approximately the maximum hourly energy demand of the building (after accounting for the COP, see function autosize). Therefore, we make the fair assumption that the action also has an upper bound equal to 1/tank_capacity. This boundaries should speed up the learning process of the agents and make them more stable rather than if we just set them to -1 and 1. I.e. if Chilled_Water_Tank.Capacity is 3 (3 times the max. hourly demand of the building in the entire year), its actions will be bounded between -1/3 and 1/3'''
             a_low, a_high = [], []    
             for action_name, value in zip(buildings_states_actions[uid]['actions'], buildings_states_actions[uid]['actions'].values()):
@@ -201,10 +407,10 @@ def building_loader(data_path, building_attributes, weather_file, solar_profile,
                         
                         # Avoid division by 0
                         if attributes['Chilled_Water_Tank']['capacity'] > 0.000001:                            
-                            a_low.append(max(-1.0/attributes['Chilled_Water_Tank']['capacity'], -1.0))
-                            a_high.append(min(1.0/attributes['Chilled_Water_Tank']['capacity'], 1.0))
-                            a_low_central_agent.append(max(-1.0/attributes['Chilled_Water_Tank']['capacity'], -1.0))
-                            a_high_central_agent.append(min(1.0/attributes['Chilled_Water_Tank']['capacity'], 1.0))
+                            a_low.append(max(-time_resolution/attributes['Chilled_Water_Tank']['capacity'], -1.0))
+                            a_high.append(min(time_resolution/attributes['Chilled_Water_Tank']['capacity'], 1.0))
+                            a_low_central_agent.append(max(-time_resolution/attributes['Chilled_Water_Tank']['capacity'], -1.0))
+                            a_high_central_agent.append(min(time_resolution/attributes['Chilled_Water_Tank']['capacity'], 1.0))
                         else:
                             a_low.append(-1.0)
                             a_high.append(1.0)
@@ -212,10 +418,10 @@ def building_loader(data_path, building_attributes, weather_file, solar_profile,
                             a_high_central_agent.append(1.0)
                     elif action_name =='dhw_storage':
                         if attributes['DHW_Tank']['capacity'] > 0.000001:
-                            a_low.append(max(-1.0/attributes['DHW_Tank']['capacity'], -1.0))
-                            a_high.append(min(1.0/attributes['DHW_Tank']['capacity'], 1.0))
-                            a_low_central_agent.append(max(-1.0/attributes['DHW_Tank']['capacity'], -1.0))
-                            a_high_central_agent.append(min(1.0/attributes['DHW_Tank']['capacity'], 1.0))
+                            a_low.append(max(-time_resolution/attributes['DHW_Tank']['capacity'], -1.0))
+                            a_high.append(min(time_resolution/attributes['DHW_Tank']['capacity'], 1.0))
+                            a_low_central_agent.append(max(-time_resolution/attributes['DHW_Tank']['capacity'], -1.0))
+                            a_high_central_agent.append(min(time_resolution/attributes['DHW_Tank']['capacity'], 1.0))
                         else:
                             a_low.append(-1.0)
                             a_high.append(1.0)
@@ -231,13 +437,11 @@ def building_loader(data_path, building_attributes, weather_file, solar_profile,
             building.set_state_space(np.array(s_high), np.array(s_low))
             building.set_action_space(np.array(a_high), np.array(a_low))
             
-            observation_spaces.append(building.observation_space)
-            action_spaces.append(building.action_space)
-            
             buildings[uid] = building
     
-    observation_space_central_agent = spaces.Box(low=np.float32(np.array(s_low_central_agent)), high=np.float32(np.array(s_high_central_agent)), dtype=np.float32)
-    action_space_central_agent = spaces.Box(low=np.float32(np.array(a_low_central_agent)), high=np.float32(np.array(a_high_central_agent)), dtype=np.float32)
+    # Only the bounds of the spaces of the central agent are returned, the spaces are created when they are first used
+    observation_bounds_central_agent = (np.float32(np.array(s_low_central_agent)), np.float32(np.array(s_high_central_agent)))
+    action_bounds_central_agent = (np.float32(np.array(a_low_central_agent)), np.float32(np.array(a_high_central_agent)))
         
     for building in buildings.values():
 
@@ -245,30 +449,166 @@ def building_loader(data_path, building_attributes, weather_file, solar_profile,
         if isinstance(building.dhw_heating_device, HeatPump):
                 
             # Calculating COPs of the heat pumps for every hour
-            building.dhw_heating_device.cop_heating = building.dhw_heating_device.eta_tech*(building.dhw_heating_device.t_target_heating + 273.15)/(building.dhw_heating_device.t_target_heating - weather_data['Outdoor Drybulb Temperature [C]'])
+            with np.errstate(divide='ignore'):
+                building.dhw_heating_device.cop_heating = building.dhw_heating_device.eta_tech*(building.dhw_heating_device.t_target_heating + 273.15)/(building.dhw_heating_device.t_target_heating - weather_data['Outdoor Drybulb Temperature [C]'])
             building.dhw_heating_device.cop_heating[building.dhw_heating_device.cop_heating < 0] = 20.0
             building.dhw_heating_device.cop_heating[building.dhw_heating_device.cop_heating > 20] = 20.0
-            building.dhw_heating_device.cop_heating = building.dhw_heating_device.cop_heating.to_numpy()
 
-        building.cooling_device.cop_cooling = building.cooling_device.eta_tech*(building.cooling_device.t_target_cooling + 273.15)/(weather_data['Outdoor Drybulb Temperature [C]'] - building.cooling_device.t_target_cooling)
+        with np.errstate(divide='ignore'):
+            building.cooling_device.cop_cooling = building.cooling_device.eta_tech*(building.cooling_device.t_target_cooling + 273.15)/(weather_data['Outdoor Drybulb Temperature [C]'] - building.cooling_device.t_target_cooling)
         building.cooling_device.cop_cooling[building.cooling_device.cop_cooling < 0] = 20.0
         building.cooling_device.cop_cooling[building.cooling_device.cop_cooling > 20] = 20.0
-        building.cooling_device.cop_cooling = building.cooling_device.cop_cooling.to_numpy()
         
         building.reset()
         
-    auto_size(buildings)
+    auto_size(buildings, time_resolution)
 
-    return buildings, observation_spaces, action_spaces, observation_space_central_agent, action_space_central_agent
+    return buildings, observation_bounds_central_agent, action_bounds_central_agent
 
-class CityLearn(gym.Env):  
-    def __init__(self, data_path, building_attributes, weather_file, solar_profile, building_ids, carbon_intensity = None, buildings_states_actions = None, simulation_period = (0,8759), cost_function = ['ramping','1-load_factor','average_daily_peak','peak_demand','net_electricity_consumption'], central_agent = False, save_memory = True, verbose = 0):
-        with open(buildings_states_actions) as json_file:
-            self.buildings_states_actions = json.load(json_file)
+class EnvTemplate:
+    def __init__(self, data_path, building_attributes, weather_file, solar_profile, building_ids, carbon_intensity = None, buildings_states_actions = None, time_resolution = 1, data_resolution = 1, data_cache = True, files = None):
+        """
+        Loads the data of the buildings, sizes their devices and finds the bounds of their states and actions only once. spawn() then creates environments whose buildings share the data of the template (demands, weather, COPs of the heat pumps, bounds and spaces), which is never modified by the simulation, and only allocate their own state. Creating another environment therefore does not depend on the length of the data.
+        Args:
+            Same as CityLearn
+        """
+        
+        if files is None:
+            with open(buildings_states_actions) as json_file:
+                self.buildings_states_actions = json.load(json_file)
+        else:
+            self.buildings_states_actions = files[Path(buildings_states_actions).name]
+        
+        self.params = {'data_path':data_path,
+                       'building_attributes':building_attributes,
+                       'weather_file':weather_file,
+                       'solar_profile':solar_profile,
+                       'building_ids':building_ids,
+                       'carbon_intensity':carbon_intensity,
+                       'buildings_states_actions':buildings_states_actions,
+                       'time_resolution':time_resolution,
+                       'data_resolution':data_resolution,
+                       'data_cache':data_cache,
+                       'files':files}
+        
+        self.buildings, self.observation_bounds, self.action_bounds = building_loader(data_path, data_path / building_attributes, data_path / weather_file, data_path / solar_profile, data_path / carbon_intensity, building_ids, self.buildings_states_actions, time_resolution = time_resolution, data_resolution = data_resolution, data_cache = data_cache, files = files)
+        
+        # Spaces of the central agent, tables of the padded and shared states (see CityLearn._build_state_tables) and statistics of the demands (see CityLearn.get_building_information). They are built by the first environment that uses them and shared by all the others.
+        self.central_spaces = {}
+        self.state_data = None
+        self.demand_statistics = None
+        
+    def copy_buildings(self, save_memory = True):
+        """
+        Returns:
+            buildings (dict): shallow copies of the buildings of the template and of their devices, which are reset so that they get their own state (states of charge and histories) while sharing all the data
+        """
+        
+        buildings = {}
+        for uid, building in self.buildings.items():
+            building = copy.copy(building)
+            devices = []
+            for device_name in ['dhw_storage', 'cooling_storage', 'electrical_storage', 'dhw_heating_device', 'cooling_device']:
+                if getattr(building, device_name) is not None:
+                    setattr(building, device_name, copy.copy(getattr(building, device_name)))
+                    devices.append(getattr(building, device_name))
+            for obj in [building] + devices:
+                obj.save_memory = save_memory
+            building.reset()
+            buildings[uid] = building
+        return buildings
+    
+    def spawn(self, **kwargs):
+        """
+        Args:
+            kwargs: arguments of CityLearn that do not change the data (i.e. simulation_period, central_agent, save_memory, observation_mode or reward)
+        Returns:
+            env (CityLearn): new environment that shares the data of the template
+        """
+        
+        return CityLearn(**self.params, template = self, **kwargs)
+
+_GymCityLearn = None
+
+def _gym_adapter():
+    # The subclass of gym.Env that wraps CityLearn is only created, and gym imported, the first time CityLearn.as_gym() is called
+    global _GymCityLearn
+    if _GymCityLearn is None:
+        import gym
+        
+        class GymCityLearn(gym.Env):
+            metadata = {'render_modes': []}
+            
+            def __init__(self, env):
+                self.env = env
+                self.observation_space = env.observation_space
+                self.action_space = env.action_space
+                self.reward_range = env.reward_range
+                
+            @property
+            def np_random(self):
+                return self.env.np_random
+            
+            def step(self, actions):
+                # The simulation only ends at the end of its period, so the episode is never truncated by the environment itself (i.e. only by gym.wrappers.TimeLimit)
+                states, rewards, terminal, info = self.env.step(actions)
+                return states, rewards, terminal, False, info
+            
+            def reset(self, seed = None, options = None):
+                """
+                Args:
+                    seed (int): seed of the random number generator of the environment (see CityLearn.seed), which is not seeded again if None
+                    options (dict): arguments of CityLearn.reset (start, length, initial_soc and restore_battery)
+                Returns:
+                    states, info (dict): states of the first time-step of the episode and an empty info dict
+                """
+                
+                if seed is not None:
+                    self.env.seed(seed)
+                return self.env.reset(**(options or {})), {}
+            
+            def render(self):
+                return self.env.render()
+            
+            def close(self):
+                return self.env.close()
+            
+            def __getattr__(self, name):
+                # Every other attribute (i.e. cost() or the buildings) is read from the wrapped environment
+                if name == 'env':
+                    raise AttributeError(name)
+                return getattr(self.env, name)
+            
+        _GymCityLearn = GymCityLearn
+    return _GymCityLearn
+
+class CityLearn:
+    # The interface of gym.Env is implemented without inheriting from it, so that gym is only imported when the spaces are first used. as_gym() returns the environment as an instance of gym.Env.
+    metadata = {'render_modes': []}
+    reward_range = (-float('inf'), float('inf'))
+    spec = None
+    
+    carbon_emissions = district_result('carbon_emissions')
+    net_electric_consumption = district_result('net_electric_consumption')
+    net_electric_consumption_no_storage = district_result('net_electric_consumption_no_storage')
+    net_electric_consumption_no_pv_no_storage = district_result('net_electric_consumption_no_pv_no_storage')
+    electric_consumption_electric_storage = district_result('electric_consumption_electric_storage')
+    electric_consumption_dhw_storage = district_result('electric_consumption_dhw_storage')
+    electric_consumption_cooling_storage = district_result('electric_consumption_cooling_storage')
+    electric_consumption_dhw = district_result('electric_consumption_dhw')
+    electric_consumption_cooling = district_result('electric_consumption_cooling')
+    electric_consumption_appliances = district_result('electric_consumption_appliances')
+    electric_generation = district_result('electric_generation')
+    
+    def __init__(self, data_path, building_attributes, weather_file, solar_profile, building_ids, carbon_intensity = None, buildings_states_actions = None, simulation_period = (0,8759), cost_function = ['ramping','1-load_factor','average_daily_peak','peak_demand','net_electricity_consumption'], central_agent = False, save_memory = True, time_resolution = 1, data_resolution = 1, year_order = None, observation_mode = 'object', history_length = None, reward = None, forecast_noise = None, data_cache = True, files = None, template = None, verbose = 0):
+        # The data is loaded by a template, which can also be used to create other environments with the same data without loading it again (see EnvTemplate)
+        if template is None:
+            template = EnvTemplate(data_path, building_attributes, weather_file, solar_profile, building_ids, carbon_intensity = carbon_intensity, buildings_states_actions = buildings_states_actions, time_resolution = time_resolution, data_resolution = data_resolution, data_cache = data_cache, files = files)
+        self.template = template
+        self.buildings_states_actions = template.buildings_states_actions
         
         self.data_path = data_path
         self.buildings_states_actions_filename = buildings_states_actions
-        self.buildings_net_electricity_demand = []
         self.building_attributes = building_attributes
         self.solar_profile = solar_profile
         self.carbon_intensity = carbon_intensity
@@ -279,30 +619,360 @@ class CityLearn(gym.Env):
         self.central_agent = central_agent
         self.loss = []
         self.verbose = verbose
+        self.data_cache = data_cache
         
-        params_loader = {'data_path':data_path,
-                         'building_attributes':self.data_path / self.building_attributes,
-                         'weather_file':self.data_path / self.weather_file,
-                         'solar_profile':self.data_path / self.solar_profile,
-                         'carbon_intensity':self.data_path / self.carbon_intensity,
-                         'building_ids':building_ids,
-                         'buildings_states_actions':self.buildings_states_actions,
-                         'save_memory':save_memory}
+        # Number of hours in a time-step of the simulation and in a row of the data files. The cost functions are evaluated over windows with the same duration regardless of the time resolution.
+        assert abs(round(24/time_resolution)*time_resolution - 24) < 1e-9, 'time_resolution must divide a day into a whole number of time-steps'
+        self.time_resolution = time_resolution
+        self.data_resolution = data_resolution
+        self.steps_per_day = int(round(24/time_resolution))
+        self.steps_per_year = 365*self.steps_per_day
+        self.steps_per_month = int(self.steps_per_year/12)
         
-        self.buildings, self.observation_spaces, self.action_spaces, self.observation_space, self.action_space = building_loader(**params_loader)
+        self.buildings = template.copy_buildings(save_memory)
         
         self.simulation_period = simulation_period
+        self.episode_period = simulation_period
+        self.episode_time_steps = self._to_time_steps(simulation_period)
+        
+        # The simulation period can be longer than the data. The time-steps of the simulation are then mapped onto the loaded data, year by year if a year order is given.
+        self.n_data_time_steps = len(list(self.buildings.values())[0].sim_results['hour'])
+        self.year_order = year_order
+        if year_order is not None:
+            assert self.n_data_time_steps >= self.steps_per_year, 'The data must contain at least one year to map the simulation onto its years'
+            if isinstance(year_order, str):
+                assert year_order == 'shuffle', "The year order must be a list of years of the data or 'shuffle'"
+            else:
+                assert max(year_order) < self.n_data_time_steps//self.steps_per_year, 'The year order can only contain the years available in the data'
+        self.episode_years = None
+        self.data_time_step = None
+        self.initial_soc = None
+        self.cost_rbc_key = None
+        self.cost_rbc_per_year = None
+        self._building_info = None
         self.uid = None
         self.n_buildings = len([i for i in self.buildings])
+        
+        # Net electricity demand of every building, written in place at every time-step
+        self.buildings_net_electricity_demand = np.zeros(self.n_buildings)
+        
+        # In 'object' mode the decentralized states are returned as an array of objects with the states of every building. In 'padded' mode they are returned as a float32 matrix with a row for every building, padded with zeros up to the largest number of states of any building. In 'shared' mode they are returned as a tuple with a vector of the states shared by all the buildings (exogenous) and a matrix with the states of every building (endogenous).
+        assert observation_mode in ['object', 'padded', 'shared'], "observation_mode must be 'object', 'padded' or 'shared'"
+        assert observation_mode == 'object' or not central_agent, "The padded and shared observation modes are only available for decentralized agents"
+        self.observation_mode = observation_mode
+        self._build_observation_tables()
+        
+        # With a history length N, the states are returned as a read-only view (n_buildings, N, max_state_dim) of the padded states of the last N time-steps, the most recent one last. Every state is written twice in a ring buffer of length 2N, at positions i and i + N, so that the last N states are always a contiguous slice of the buffer and no copies are made.
+        assert history_length is None or observation_mode == 'padded', "The history of the states is only available with observation_mode='padded'"
+        self.history_length = history_length
+        if history_length is not None:
+            assert history_length >= 1, 'history_length must be at least 1'
+            self._history = np.zeros((self.n_buildings, 2*history_length, self.observation_mask.shape[1]), dtype=np.float32)
+            self._history_frame = np.zeros(self.observation_mask.shape, dtype=np.float32)
+            self._history_position = None
+        
+        # Batched reward function from reward_function.REWARD_FUNCTIONS (i.e. 'sac', 'marlisa' or 'central'), or a function with the same arguments. If None, the rewards are computed by reward_function_ma and reward_function_sa, which can be customized in reward_function.py
+        self.reward = None if reward is None else get_reward(reward)
+        
+        # The reward functions are called with a batch of one time-step, whose inputs and rewards are written into arrays allocated once. The rewards are written directly by the reward functions that take the argument out.
+        self._reward_inputs = (np.zeros((1, self.n_buildings), dtype=np.float32), np.zeros(1, dtype=np.float32))
+        self._rewards = np.zeros(1 if central_agent else (1, self.n_buildings), dtype=np.float32)
+        self._reward_out = self.reward is None or 'out' in inspect.signature(self.reward).parameters
+        
+        # The reward function must return one reward for every environment with the central agent, and one for every building otherwise
+        if self.reward is not None:
+            reward_shape = np.shape(self.reward(*self._reward_inputs))
+            assert reward_shape == self._rewards.shape, 'The reward function returns rewards with shape ' + str(reward_shape) + ' for a batch of one time-step, but ' + str(self._rewards.shape) + ' is expected ' + ('with a central agent (i.e. reward=\'central\')' if central_agent else 'with decentralized agents (i.e. reward=\'sac\' or \'marlisa\')')
+        
+        # Noise added to the forecasts returned by get_forecast(): None for perfect forecasts, a float for a relative gaussian noise whose standard deviation grows with the square root of the lead time (in hours), or a function (forecast, np_random) -> noisy forecast
+        self.forecast_noise = forecast_noise
+        self._forecast_data = None
+        
+        # Opt-in timing of the phases of the simulation, see enable_profiling()
+        self.profiler = None
+        
+        self.seed()
         self.reset()
         
+    def enable_profiling(self, report_every = None, report = None):
+        """
+        Times every phase of step(), step_into() and step_n() (dispatch of the actions, observation, reward and terminal), reset(), cost() and every method of the buildings and their devices with time.perf_counter_ns. The methods of this instance are replaced by timed wrappers, so an environment which is not profiled runs without any overhead.
+        Args:
+            report_every (int): number of time-steps (simulated by step(), step_into() or step_n()) after which report is called with the summary of the profiler. Never by default
+            report (function): called with the summary dict (see Profiler.summary), prints it by default
+        Returns:
+            profiler (Profiler): accumulates the times and number of calls, returned by profiler.summary()
+        """
+        
+        self.disable_profiling()
+        self.profiler = Profiler(report_every = report_every) if report is None else Profiler(report_every = report_every, report = report)
+        return self.profiler.attach(self)
+    
+    def disable_profiling(self):
+        if self.profiler is not None:
+            self.profiler.detach()
+            self.profiler = None
+    
+    # The spaces are created from the bounds found by building_loader when they are first used, and shared by all the environments created from the same template
+    @property
+    def observation_spaces(self):
+        return [building.observation_space for building in self.buildings.values()]
+    
+    @property
+    def action_spaces(self):
+        return [building.action_space for building in self.buildings.values()]
+    
+    @property
+    def observation_space(self):
+        if 'observation' not in self.template.central_spaces:
+            self.template.central_spaces['observation'] = box(*self.template.observation_bounds)
+        return self.template.central_spaces['observation']
+    
+    @property
+    def action_space(self):
+        if 'action' not in self.template.central_spaces:
+            self.template.central_spaces['action'] = box(*self.template.action_bounds)
+        return self.template.central_spaces['action']
+    
+    @property
+    def unwrapped(self):
+        return self
+    
     def get_state_action_spaces(self):
         return self.observation_spaces, self.action_spaces
+    
+    def as_gym(self):
+        """
+        Returns:
+            env (gym.Env): adapter that is an instance of gym.Env (i.e. for gym wrappers or isinstance checks) and forwards every call and attribute to this environment, with the API of gym >= 0.26: step() returns (states, rewards, terminated, truncated, info) and reset(seed=None, options=None) returns (states, info), where options are the arguments of reset()
+        """
+        
+        return _gym_adapter()(self)
+    
+    def _build_observation_tables(self):
+        """
+        Builds the static tables used to return the states and to take the actions of all the buildings as padded matrices:
+            observation_names, observation_mask: names of the states of every building and whether every position of the padded matrix is used
+            action_names, action_mask: same for the actions. The valid actions of every building come first in every row
+        The states read from the data are copied once into float32 arrays, from which the states of every time-step are gathered with a single np.take.
+        """
+        
+        state_names = {uid: [state_name for state_name, value in self.buildings_states_actions[uid]['states'].items() if value] for uid in self.buildings}
+        action_names = {uid: [action_name for action_name in ACTIONS if self.buildings_states_actions[uid]['actions'][action_name]] for uid in self.buildings}
+        
+        max_state_dim = max(len(names) for names in state_names.values())
+        max_action_dim = max(len(names) for names in action_names.values())
+        self.observation_names = np.full((self.n_buildings, max_state_dim), None, dtype='object')
+        self.observation_mask = np.zeros((self.n_buildings, max_state_dim), dtype=bool)
+        self.action_names = np.full((self.n_buildings, max_action_dim), None, dtype='object')
+        self.action_mask = np.zeros((self.n_buildings, max_action_dim), dtype=bool)
+        for i, uid in enumerate(self.buildings):
+            self.observation_names[i, :len(state_names[uid])] = state_names[uid]
+            self.observation_mask[i, :len(state_names[uid])] = True
+            self.action_names[i, :len(action_names[uid])] = action_names[uid]
+            self.action_mask[i, :len(action_names[uid])] = True
+        
+        # The tables used to gather the states are only built when the padded or shared states are used
+        self._state_source = None
+        if self.observation_mode != 'object':
+            self._build_state_tables()
+        
+    def _build_state_tables(self):
+        """
+        Splits the states of the buildings into:
+            exogenous_names: states that are the same for all the buildings (calendar, weather and carbon intensity), which are stored only once
+            endogenous_names: states of every building, either read from its data or computed at every time-step (net electricity consumption and states of charge). endogenous_mask tells which of them are used by every building
+        """
+        
+        state_names = {uid: [state_name for state_name, value in self.buildings_states_actions[uid]['states'].items() if value] for uid in self.buildings}
+        self.exogenous_names = []
+        building_state_names = []
+        for names in state_names.values():
+            for state_name in names:
+                if is_building_state(state_name):
+                    if state_name not in building_state_names:
+                        building_state_names.append(state_name)
+                elif state_name not in DYNAMIC_STATES and state_name not in self.exogenous_names:
+                    self.exogenous_names.append(state_name)
+        self.endogenous_names = building_state_names + DYNAMIC_STATES
+        self.endogenous_mask = np.array([[state_name in state_names[uid] for state_name in self.endogenous_names] for uid in self.buildings], dtype=bool).reshape(self.n_buildings, len(self.endogenous_names))
+        
+        # The exogenous states are read-only so that they can be returned without being copied. The data of the states is the same for all the environments created from the same template, so it is only copied once.
+        if self.template.state_data is None:
+            first_building = list(self.buildings.values())[0]
+            exogenous_data = np.ascontiguousarray(np.array([first_building.sim_results[state_name] for state_name in self.exogenous_names], dtype=np.float32).T.reshape(self.n_data_time_steps, len(self.exogenous_names)))
+            building_state_data = np.zeros((self.n_data_time_steps, self.n_buildings, len(building_state_names)), dtype=np.float32)
+            for i, building in enumerate(self.buildings.values()):
+                for j, state_name in enumerate(building_state_names):
+                    building_state_data[:, i, j] = building.sim_results[state_name]
+            exogenous_data.flags.writeable = False
+            building_state_data.flags.writeable = False
+            self.template.state_data = (exogenous_data, building_state_data)
+        self._exogenous_data, self._building_state_data = self.template.state_data
+                
+        # The padded states are gathered from a source vector which contains the exogenous states, the endogenous states of all the buildings and a trailing zero for the padding. The endogenous states are updated in place in the source vector.
+        n_exogenous, n_endogenous = len(self.exogenous_names), len(self.endogenous_names)
+        self._state_source = np.zeros(n_exogenous + self.n_buildings*n_endogenous + 1, dtype=np.float32)
+        self._exogenous_state = self._state_source[:n_exogenous]
+        self._endogenous_state = self._state_source[n_exogenous:-1].reshape(self.n_buildings, n_endogenous)
+        self._building_state = self._endogenous_state[:, :self._building_state_data.shape[2]]
+        self._state_source_index = np.full(self.observation_mask.shape, len(self._state_source) - 1, dtype=np.int64)
+        for i, uid in enumerate(self.buildings):
+            for k, state_name in enumerate(state_names[uid]):
+                if state_name in self.endogenous_names:
+                    self._state_source_index[i, k] = n_exogenous + i*n_endogenous + self.endogenous_names.index(state_name)
+                else:
+                    self._state_source_index[i, k] = self.exogenous_names.index(state_name)
+        self._state_source_index = self._state_source_index.ravel()
+        
+    def _update_endogenous_state(self):
+        # The dynamic states are the only ones that are computed building by building
+        if self._state_source is None:
+            self._build_state_tables()
+            
+        n_building_states = self._building_state_data.shape[2]
+        np.copyto(self._building_state, self._building_state_data[self.data_time_step])
+        endogenous_state = self._endogenous_state
+        for i, building in enumerate(self.buildings.values()):
+            endogenous_state[i, n_building_states] = building.current_net_electricity_demand
+            endogenous_state[i, n_building_states + 1] = building.cooling_storage._soc/building.cooling_storage.capacity
+            endogenous_state[i, n_building_states + 2] = building.dhw_storage._soc/building.dhw_storage.capacity
+            endogenous_state[i, n_building_states + 3] = building.electrical_storage._soc/building.electrical_storage.capacity
+            
+    def _get_padded_state(self, out = None):
+        # Returns the states of all the buildings as a float32 matrix (n_buildings, max_state_dim)
+        self._update_endogenous_state()
+        np.copyto(self._exogenous_state, self._exogenous_data[self.data_time_step])
+        
+        if out is None:
+            out = np.empty(self.observation_mask.shape, dtype=np.float32)
+        np.take(self._state_source, self._state_source_index, out=out.reshape(-1))
+        return out
+    
+    def _get_state(self):
+        # States of the decentralized agents in the padded and shared modes
+        if self.history_length is not None:
+            return self._push_history(self._get_padded_state(out = self._history_frame))
+        return self._get_padded_state() if self.observation_mode == 'padded' else self._get_shared_state()
+    
+    def _push_history(self, state):
+        # After a reset, the history is filled with the initial states
+        if self._history_position is None:
+            self._history[:] = state[:, np.newaxis]
+            self._history_position = 0
+        else:
+            position = self._history_position
+            self._history[:, position] = state
+            self._history[:, position + self.history_length] = state
+            self._history_position = (position + 1) % self.history_length
+        return self.get_history()
+    
+    def get_history(self):
+        """
+        Returns the padded states of the last history_length time-steps as a read-only view (n_buildings, history_length, max_state_dim), the most recent one last. The view is overwritten by the next time-steps, so it must be copied to be kept.
+        """
+        
+        assert self.history_length is not None, 'The history of the states is only kept if history_length is given'
+        history = self._history[:, self._history_position:self._history_position + self.history_length]
+        history.flags.writeable = False
+        return history
+    
+    def _get_shared_state(self):
+        # Returns the exogenous states, as a read-only view of the data, and a copy of the endogenous states of all the buildings
+        self._update_endogenous_state()
+        return self._exogenous_data[self.data_time_step], self._endogenous_state.copy()
+    
+    def broadcast_state(self, exogenous, endogenous, layout = 'object'):
+        """
+        Broadcasts states returned with observation_mode='shared' to the layout of the other observation modes.
+        Args:
+            exogenous (np.array): exogenous states (len(exogenous_names),), or a batch of them (..., len(exogenous_names))
+            endogenous (np.array): endogenous states (n_buildings, len(endogenous_names)), or a batch of them (..., n_buildings, len(endogenous_names))
+            layout (str): 'object' returns an array of objects with the states of every building, as with observation_mode='object'. 'padded' returns a float32 matrix (..., n_buildings, max_state_dim), as with observation_mode='padded', and also works with batches
+        Returns:
+            states (np.array)
+        """
+        
+        if self._state_source is None:
+            self._build_state_tables()
+        
+        exogenous, endogenous = np.asarray(exogenous, dtype=np.float32), np.asarray(endogenous, dtype=np.float32)
+        batch_shape = exogenous.shape[:-1]
+        source = np.concatenate([exogenous, endogenous.reshape(batch_shape + (-1,)), np.zeros(batch_shape + (1,), dtype=np.float32)], axis=-1)
+        states = np.take(source, self._state_source_index, axis=-1).reshape(batch_shape + self.observation_mask.shape)
+        if layout == 'padded':
+            return states
+        
+        assert layout == 'object' and batch_shape == (), "Only single states can be broadcast to the object layout"
+        object_states = np.empty(self.n_buildings, dtype='object')
+        for i in range(self.n_buildings):
+            object_states[i] = states[i][self.observation_mask[i]]
+        return object_states
+    
+    def _to_time_steps(self, period):
+        # Converts a period given in hours (first hour, last hour) into the first and last time-steps of the simulation
+        return (int(period[0]//self.time_resolution), int((period[1] + 1)//self.time_resolution) - 1)
             
     def next_hour(self):
         self.time_step = next(self.hour)
+        data_time_step = self.episode_data_time_steps[self.time_step - self.episode_time_steps[0]]
+        
+        # The devices keep track of their own time-steps, which only need to be realigned when the simulation jumps to another part of the data
+        realign_devices = self.data_time_step is not None and data_time_step != self.data_time_step + 1
+        self.data_time_step = data_time_step
         for building in self.buildings.values():
-            building.time_step = self.time_step
+            building.time_step = data_time_step
+            if realign_devices:
+                for device in [building.dhw_storage, building.cooling_storage, building.electrical_storage, building.dhw_heating_device, building.cooling_device]:
+                    if device is not None:
+                        device.time_step = data_time_step
+    
+    def _get_data_time_steps(self, time_steps):
+        """
+        Maps time-steps of the simulation onto time-steps of the loaded data. Without a year order, the simulation wraps around the data. With a year order, every simulated year is mapped onto the year of the data given by self.episode_years.
+        """
+        
+        if self.year_order is None:
+            return time_steps % self.n_data_time_steps
+        
+        # Time-steps after the end of the episode (i.e. forecasts) are mapped onto the last year of the episode
+        years = np.minimum(time_steps//self.steps_per_year, len(self.episode_years) - 1)
+        return np.array(self.episode_years)[years]*self.steps_per_year + time_steps % self.steps_per_year
+    
+    def get_forecast(self, horizon = 24):
+        """
+        Returns the data of all the buildings over the next time-steps, for controllers that plan ahead (i.e. MPC).
+        Args:
+            horizon (int): number of time-steps of the forecast
+        Returns:
+            forecast (np.array): read-only float32 array (n_buildings, horizon, len(FORECAST_SERIES)) with the series in FORECAST_SERIES. The first time-step is the one in which the next actions are taken. Without forecast_noise it is a view of the data, which is only copied when the forecast crosses the boundary between two years of the data given by year_order
+        """
+        
+        # The data of all the buildings is stored once, followed by its first time-steps so that the forecasts can wrap around the end of the data without being copied
+        if self._forecast_data is None or self._forecast_data.shape[1] < self.n_data_time_steps + horizon:
+            buildings = list(self.buildings.values())
+            forecast_data = np.array([[building.sim_results[series] for series in FORECAST_SERIES] for building in buildings], dtype=np.float32).transpose(0, 2, 1)
+            self._forecast_data = np.concatenate([forecast_data, forecast_data[:, np.arange(horizon) % self.n_data_time_steps]], axis=1)
+            self._forecast_data.flags.writeable = False
+            
+        data_time_steps = self._get_data_time_steps(np.arange(self.time_step, self.time_step + horizon))
+        if self.year_order is None or np.all(np.diff(data_time_steps) == 1):
+            forecast = self._forecast_data[:, self.data_time_step:self.data_time_step + horizon]
+        else:
+            forecast = self._forecast_data[:, data_time_steps]
+            forecast.flags.writeable = False
+            
+        if self.forecast_noise is None:
+            return forecast
+        
+        # The noise is only generated for the forecasts that are requested
+        if callable(self.forecast_noise):
+            forecast = self.forecast_noise(forecast, self.np_random)
+        else:
+            lead_time = np.arange(horizon)*self.time_resolution
+            forecast = forecast*(1 + self.forecast_noise*np.sqrt(lead_time)[np.newaxis, :, np.newaxis]*self.np_random.standard_normal(forecast.shape)).astype(np.float32)
+        forecast.flags.writeable = False
+        return forecast
             
     def get_building_information(self):
         
@@ -310,31 +980,40 @@ class CityLearn(gym.Env):
         # Annual DHW demand, Annual Cooling Demand, Annual Electricity Demand
         building_info = {}
         n_years = (self.simulation_period[1] - self.simulation_period[0] + 1)/8760
-        for uid, building in self.buildings.items():
+        
+        # Total demands of every building and correlation matrices among all the buildings, computed at once for every demand. They only depend on the data, so they are computed once for all the environments created from the same template.
+        if self.template.demand_statistics is None:
+            totals, correlations = {}, {}
+            for demand in ['dhw_demand', 'cooling_demand', 'non_shiftable_load']:
+                totals[demand] = [sum(building.sim_results[demand]) for building in self.buildings.values()]
+                correlations[demand] = np.corrcoef(np.array([building.sim_results[demand] for building in self.buildings.values()]))
+            self.template.demand_statistics = (totals, correlations)
+        totals, correlations = self.template.demand_statistics
+            
+        for i, (uid, building) in enumerate(self.buildings.items()):
             building_info[uid] = {}
             building_info[uid]['building_type'] = building.building_type
             building_info[uid]['climate_zone'] = building.climate_zone
             building_info[uid]['solar_power_capacity (kW)'] = round(building.solar_power_capacity, 3)
-            building_info[uid]['Annual_DHW_demand (kWh)'] = round(sum(building.sim_results['dhw_demand'])/n_years, 3)
-            building_info[uid]['Annual_cooling_demand (kWh)'] = round(sum(building.sim_results['cooling_demand'])/n_years, 3)
-            building_info[uid]['Annual_nonshiftable_electrical_demand (kWh)'] = round(sum(building.sim_results['non_shiftable_load'])/n_years, 3)
+            building_info[uid]['Annual_DHW_demand (kWh)'] = round(totals['dhw_demand'][i]/n_years, 3)
+            building_info[uid]['Annual_cooling_demand (kWh)'] = round(totals['cooling_demand'][i]/n_years, 3)
+            building_info[uid]['Annual_nonshiftable_electrical_demand (kWh)'] = round(totals['non_shiftable_load'][i]/n_years, 3)
             
             building_info[uid]['Correlations_DHW'] = {}
             building_info[uid]['Correlations_cooling_demand'] = {}
             building_info[uid]['Correlations_non_shiftable_load'] = {}
             
-            for uid_corr, building_corr in self.buildings.items():
+            for j, uid_corr in enumerate(self.buildings):
                 if uid_corr != uid:
-                    building_info[uid]['Correlations_DHW'][uid_corr] = round((np.corrcoef(np.array(building.sim_results['dhw_demand']), np.array(building_corr.sim_results['dhw_demand'])))[0][1], 3)
-                    building_info[uid]['Correlations_cooling_demand'][uid_corr] = round((np.corrcoef(np.array(building.sim_results['cooling_demand']), np.array(building_corr.sim_results['cooling_demand'])))[0][1], 3)
-                    building_info[uid]['Correlations_non_shiftable_load'][uid_corr] = round((np.corrcoef(np.array(building.sim_results['non_shiftable_load']), np.array(building_corr.sim_results['non_shiftable_load'])))[0][1], 3)
+                    building_info[uid]['Correlations_DHW'][uid_corr] = round(correlations['dhw_demand'][i][j], 3)
+                    building_info[uid]['Correlations_cooling_demand'][uid_corr] = round(correlations['cooling_demand'][i][j], 3)
+                    building_info[uid]['Correlations_non_shiftable_load'][uid_corr] = round(correlations['non_shiftable_load'][i][j], 3)
         
         return building_info
         
-    def step(self, actions):
-                
-        self.buildings_net_electricity_demand = []
-        self.current_carbon_intensity = list(self.buildings.values())[0].sim_results['carbon_intensity'][self.time_step]
+    def _simulate_step(self, actions):
+        # Takes the actions of all the buildings, records the results of the district and advances the simulation to the next time-step
+        self.current_carbon_intensity = list(self.buildings.values())[0].sim_results['carbon_intensity'][self.data_time_step]
         electric_demand = 0
         elec_consumption_electrical_storage = 0
         elec_consumption_dhw_storage = 0
@@ -346,7 +1025,7 @@ class CityLearn(gym.Env):
         
         if self.central_agent:
             # If the agent is centralized, all the actions for all the buildings are provided as an ordered list of numbers. The order corresponds to the order of the buildings as they appear on the file building_attributes.json, and only considering the buildings selected for the simulation by the user (building_ids).
-            for uid, building in self.buildings.items():
+            for j, (uid, building) in enumerate(self.buildings.items()):
             
                 if self.buildings_states_actions[uid]['actions']['cooling_storage']:
                     # Cooling
@@ -381,7 +1060,7 @@ class CityLearn(gym.Env):
 
                 # Electricity consumed by every building
                 building.current_net_electricity_demand = building_electric_demand
-                self.buildings_net_electricity_demand.append(-building_electric_demand) # >0 if solar generation > electricity consumption
+                self.buildings_net_electricity_demand[j] = -building_electric_demand # >0 if solar generation > electricity consumption
 
                 # Total electricity consumption
                 electric_demand += building_electric_demand
@@ -391,10 +1070,14 @@ class CityLearn(gym.Env):
         else:
             
             assert len(actions) == self.n_buildings, "The length of the list of actions should match the length of the list of buildings."
+            
+            # The actions can also be given as a matrix (n_buildings, max_action_dim) whose valid actions (see action_mask) come first in every row
+            padded_actions = getattr(actions, 'ndim', 1) == 2
+            assert not padded_actions or actions.shape == self.action_mask.shape, "The matrix of actions must have the same shape as the action_mask"
 
-            for a, (uid, building) in zip(actions, self.buildings.items()):
+            for j, (a, (uid, building)) in enumerate(zip(actions, self.buildings.items())):
 
-                assert sum(self.buildings_states_actions[uid]['actions'].values()) == len(a), "The number of input actions for building "+str(uid)+" must match the number of actions defined in the list of building attributes."
+                assert padded_actions or sum(self.buildings_states_actions[uid]['actions'].values()) == len(a), "The number of input actions for building "+str(uid)+" must match the number of actions defined in the list of building attributes."
                 
                 
                 # Getting input actions and stablishing associations between the components of the action array and their corresponding actions.
@@ -480,99 +1163,268 @@ class CityLearn(gym.Env):
 
                 # Electricity consumed by every building
                 building.current_net_electricity_demand = building_electric_demand
-                self.buildings_net_electricity_demand.append(-building_electric_demand)    
+                self.buildings_net_electricity_demand[j] = -building_electric_demand
 
                 # Total electricity consumption
                 electric_demand += building_electric_demand
+                
+        # Control variables which are used to display the results and the behavior of the buildings at the district level.
+        i, results = self.time_step - self.episode_time_steps[0], self._district_results
+        results['carbon_emissions'][i] = max(0, electric_demand)*self.current_carbon_intensity
+        results['net_electric_consumption'][i] = electric_demand
+        results['electric_consumption_electric_storage'][i] = elec_consumption_electrical_storage
+        results['electric_consumption_dhw_storage'][i] = elec_consumption_dhw_storage
+        results['electric_consumption_cooling_storage'][i] = elec_consumption_cooling_storage
+        results['electric_consumption_dhw'][i] = elec_consumption_dhw_total
+        results['electric_consumption_cooling'][i] = elec_consumption_cooling_total
+        results['electric_consumption_appliances'][i] = elec_consumption_appliances
+        results['electric_generation'][i] = elec_generation
+        results['net_electric_consumption_no_storage'][i] = electric_demand-elec_consumption_cooling_storage-elec_consumption_dhw_storage-elec_consumption_electrical_storage
+        results['net_electric_consumption_no_pv_no_storage'][i] = electric_demand + elec_generation - elec_consumption_cooling_storage - elec_consumption_dhw_storage-elec_consumption_electrical_storage
+        self._n_recorded_steps = i + 1
             
         self.next_hour()
         
-        if self.central_agent:
-            s, s_appended = [], []
-            for uid, building in self.buildings.items():
+    def _get_central_state(self):
+        s, s_appended = [], []
+        for uid, building in self.buildings.items():
                 
-                # If the agent is centralized, we append the states avoiding repetition. I.e. if multiple buildings share the outdoor temperature as a state, we only append it once to the states of the central agent. The variable s_appended is used for this purpose.
-                for state_name, value in self.buildings_states_actions[uid]['states'].items():
-                    if value == True:
-                        if state_name not in s_appended:
-                            if state_name in ['t_in', 'avg_unmet_setpoint', 'rh_in', 'non_shiftable_load', 'solar_gen']:
-                                s.append(building.sim_results[state_name][self.time_step])
-                            elif state_name == 'net_electricity_consumption':
-                                s.append(building.current_net_electricity_demand)
-                            elif state_name != 'cooling_storage_soc' and state_name != 'dhw_storage_soc':
-                                s.append(building.sim_results[state_name][self.time_step])
-                                s_appended.append(state_name)
-                            elif state_name == 'cooling_storage_soc':
-                                s.append(building.cooling_storage._soc/building.cooling_storage.capacity)
-                            elif state_name == 'dhw_storage_soc':
-                                s.append(building.dhw_storage._soc/building.dhw_storage.capacity)
-            self.state = np.array(s)
-            rewards = reward_function_sa(self.buildings_net_electricity_demand)
-            self.cumulated_reward_episode += rewards
-            
-        else:
-            # If the controllers are decentralized, we append all the states to each associated agent's list of states.
-            self.state = []
-            for uid, building in self.buildings.items():
-                s = []
-                for state_name, value in self.buildings_states_actions[uid]['states'].items():
-                    if value == True:
-                        if state_name == 'net_electricity_consumption':
+            # If the agent is centralized, we append the states avoiding repetition. I.e. if multiple buildings share the outdoor temperature as a state, we only append it once to the states of the central agent. The variable s_appended is used for this purpose.
+            for state_name, value in self.buildings_states_actions[uid]['states'].items():
+                if value == True:
+                    if state_name not in s_appended:
+                        if is_building_state(state_name):
+                            s.append(building.sim_results[state_name][self.data_time_step])
+                        elif state_name == 'net_electricity_consumption':
                             s.append(building.current_net_electricity_demand)
-                        elif (state_name != 'cooling_storage_soc') and (state_name != 'dhw_storage_soc') and (state_name != 'electrical_storage_soc'):
-                            s.append(building.sim_results[state_name][self.time_step])
+                        elif state_name != 'cooling_storage_soc' and state_name != 'dhw_storage_soc':
+                            s.append(building.sim_results[state_name][self.data_time_step])
+                            s_appended.append(state_name)
                         elif state_name == 'cooling_storage_soc':
                             s.append(building.cooling_storage._soc/building.cooling_storage.capacity)
                         elif state_name == 'dhw_storage_soc':
                             s.append(building.dhw_storage._soc/building.dhw_storage.capacity)
-                        elif state_name == 'electrical_storage_soc':
-                            s.append(building.electrical_storage._soc/building.electrical_storage.capacity)
+        return np.array(s)
+    
+    def _get_object_state(self):
+        # If the controllers are decentralized, we append all the states to each associated agent's list of states.
+        state = []
+        for uid, building in self.buildings.items():
+            s = []
+            for state_name, value in self.buildings_states_actions[uid]['states'].items():
+                if value == True:
+                    if state_name == 'net_electricity_consumption':
+                        s.append(building.current_net_electricity_demand)
+                    elif (state_name != 'cooling_storage_soc') and (state_name != 'dhw_storage_soc') and (state_name != 'electrical_storage_soc'):
+                        s.append(building.sim_results[state_name][self.data_time_step])
+                    elif state_name == 'cooling_storage_soc':
+                        s.append(building.cooling_storage._soc/building.cooling_storage.capacity)
+                    elif state_name == 'dhw_storage_soc':
+                        s.append(building.dhw_storage._soc/building.dhw_storage.capacity)
+                    elif state_name == 'electrical_storage_soc':
+                        s.append(building.electrical_storage._soc/building.electrical_storage.capacity)
 
-                self.state.append(np.array(s))
-            self.state = np.array(self.state, dtype='object')
-            
+            state.append(np.array(s))
+        return np.array(state, dtype='object')
+    
+    def step(self, actions):
+        
+        self._simulate_step(actions)
+        
+        if self.central_agent:
+            self.state = self._get_central_state()
+            rewards = self._get_rewards()
+            self.cumulated_reward_episode += rewards
             
+        elif self.observation_mode != 'object':
+            # The rewards are returned as a float32 array, as the states
+            self.state = self._get_state()
+            rewards = self._get_rewards(out = np.empty(self.n_buildings, dtype=np.float32))
+            self.cumulated_reward_episode += rewards.sum()
             
-            rewards = self.reward_function.get_rewards(self.buildings_net_electricity_demand, self.current_carbon_intensity)
+        else:
+            self.state = self._get_object_state()
+            rewards = self._get_rewards()
             self.cumulated_reward_episode += sum(rewards)
             
-        # Control variables which are used to display the results and the behavior of the buildings at the district level.
-        self.carbon_emissions.append(np.float32(max(0, electric_demand)*self.current_carbon_intensity))
-        self.net_electric_consumption.append(np.float32(electric_demand))
-        self.electric_consumption_electric_storage.append(np.float32(elec_consumption_electrical_storage))
-        self.electric_consumption_dhw_storage.append(np.float32(elec_consumption_dhw_storage))
-        self.electric_consumption_cooling_storage.append(np.float32(elec_consumption_cooling_storage))
-        self.electric_consumption_dhw.append(np.float32(elec_consumption_dhw_total))
-        self.electric_consumption_cooling.append(np.float32(elec_consumption_cooling_total))
-        self.electric_consumption_appliances.append(np.float32(elec_consumption_appliances))
-        self.electric_generation.append(np.float32(elec_generation))
-        self.net_electric_consumption_no_storage.append(np.float32(electric_demand-elec_consumption_cooling_storage-elec_consumption_dhw_storage-elec_consumption_electrical_storage))
-        self.net_electric_consumption_no_pv_no_storage.append(np.float32(electric_demand + elec_generation - elec_consumption_cooling_storage - elec_consumption_dhw_storage-elec_consumption_electrical_storage))
-        
         terminal = self._terminal()
         return (self._get_ob(), rewards, terminal, {})
     
+    def step_n(self, action_schedule, last_only = False):
+        """
+        Advances the simulation as many time-steps as actions in action_schedule in a single call. If the episode ends before the end of the schedule, the remaining actions are not taken.
+        Args:
+            action_schedule (list or np.array): actions of every time-step (k, ...), each of them in the same format as the actions of step()
+            last_only (bool): if True, only the states and rewards of the last time-step are returned, and the states of the previous time-steps are not computed (with a history_length, they are only pushed into the history)
+        Returns:
+            states: states of every time-step stacked along the first axis (a tuple of stacked exogenous and endogenous states with observation_mode='shared'), or the states of the last time-step if last_only
+            rewards (np.array): rewards of every time-step stacked along the first axis, or the rewards of the last time-step if last_only. float32 with observation_mode='padded' or 'shared', as the rewards returned by step(), float64 otherwise
+            terminal (bool): True if the simulation has ended
+            info (dict): 'n_steps', number of time-steps simulated
+        """
+        
+        assert len(action_schedule) > 0, 'The action schedule must contain the actions of at least one time-step'
+        
+        # With the padded layout, the states and the rewards of every time-step are written directly into arrays allocated once for the whole schedule
+        padded = not last_only and self.observation_mode == 'padded'
+        if padded:
+            state_shape = self.observation_mask.shape if self.history_length is None else (self.n_buildings, self.history_length, self.observation_mask.shape[1])
+            padded_states = np.empty((len(action_schedule),) + state_shape, dtype=np.float32)
+            padded_rewards = np.empty((len(action_schedule), self.n_buildings), dtype=np.float32)
+        
+        states, rewards = [], []
+        for i, actions in enumerate(action_schedule):
+            if last_only and i < len(action_schedule) - 1 and self.time_step + 1 < self.episode_time_steps[1]:
+                self._simulate_step(actions)
+                if self.history_length is not None:
+                    self.state = self._push_history(self._get_padded_state(out = self._history_frame))
+                reward = self._get_rewards()
+                self.cumulated_reward_episode += reward if self.central_agent else sum(reward)
+                continue
+                
+            if padded:
+                self._simulate_step(actions)
+                if self.history_length is None:
+                    self.state = self._get_padded_state(out = padded_states[i])
+                else:
+                    # The history is a view of a buffer overwritten at every time-step
+                    self.state = self._push_history(self._get_padded_state(out = self._history_frame))
+                    padded_states[i] = self.state
+                self.cumulated_reward_episode += self._get_rewards(out = padded_rewards[i]).sum()
+                terminal = self._terminal()
+            else:
+                state, reward, terminal, _ = self.step(actions)
+                states.append(state)
+                rewards.append(reward)
+            if terminal:
+                break
+                
+        info = {'n_steps': i + 1}
+        if padded:
+            return padded_states[:i + 1], padded_rewards[:i + 1], terminal, info
+        if last_only:
+            # In object mode, step() returns the rewards of the decentralized agents as a list, which are copied into an array
+            return states[-1], np.array(rewards[-1]), terminal, info
+        
+        if self.observation_mode == 'shared':
+            states = tuple(np.stack(state) for state in zip(*states))
+        else:
+            states = np.stack(states)
+        return states, np.array(rewards), terminal, info
+    
+    def step_into(self, actions, obs_out, reward_out):
+        """
+        Same as step() for decentralized agents, but the states and the rewards are written into buffers provided by the caller, so that no new arrays are allocated at every time-step.
+        Args:
+            actions (np.array): actions of all the buildings, either as a list with the actions of every building or as a matrix with the same shape as action_mask
+            obs_out (np.array): float32 buffer with the same shape as observation_mask, where the states of all the buildings are written with the padded layout. With a history_length, only the states of the current time-step are written, and the history is returned by get_history()
+            reward_out (np.array): buffer of length n_buildings where the rewards are written
+        Returns:
+            terminal (bool): True if the simulation has ended
+        """
+        
+        assert not self.central_agent, "step_into is only available for decentralized agents"
+        self._simulate_step(actions)
+        if self.history_length is None:
+            self.state = self._get_padded_state(out = obs_out)
+        else:
+            self.state = self._push_history(self._get_padded_state(out = obs_out))
+        self._get_rewards(out = reward_out)
+        self.cumulated_reward_episode += reward_out.sum()
+        
+        return self._terminal()
+    
+    def _get_rewards(self, out = None):
+        # With out, the rewards of the decentralized agents are written into it and no new array is allocated
+        if self.reward is None and (self.central_agent or out is None):
+            if self.central_agent:
+                return reward_function_sa(self.buildings_net_electricity_demand)
+            return self.reward_function.get_rewards(self.buildings_net_electricity_demand, self.current_carbon_intensity)
+        
+        electricity_demand, carbon_intensity = self._reward_inputs
+        np.copyto(electricity_demand, self.buildings_net_electricity_demand)
+        carbon_intensity[0] = self.current_carbon_intensity
+        reward = self.reward_function.get_rewards if self.reward is None else self.reward
+        if self._reward_out:
+            reward(electricity_demand, carbon_intensity, out = self._rewards)
+        else:
+            self._rewards[:] = reward(electricity_demand, carbon_intensity)
+            
+        if out is None:
+            return self._rewards[0].copy()
+        out[...] = self._rewards
+        return out
+    
+    def reset_into(self, obs_out, start = None, length = None, initial_soc = None, restore_battery = False):
+        """
+        Same as reset() for decentralized agents, but the states are written into obs_out (see step_into).
+        """
+        
+        assert not self.central_agent, "reset_into is only available for decentralized agents"
+        self.reset(start = start, length = length, initial_soc = initial_soc, restore_battery = restore_battery)
+        if self.history_length is None:
+            self.state = self._get_padded_state(out = obs_out)
+        else:
+            obs_out[:] = self._history_frame
+        return obs_out
+    
     def reset_baseline_cost(self):
         self.cost_rbc = None
         
-    def reset(self):
+    def reset(self, start = None, length = None, initial_soc = None, restore_battery = False):
+        """
+        Args:
+            start (int): first hour of the episode. If None and length is given, it is drawn uniformly so that the whole episode fits within simulation_period
+            length (int): number of hours in the episode, following the same convention as simulation_period (i.e. the episode runs from start to start + length - 1). If None, the episode runs until the end of simulation_period
+            initial_soc (float or dict): initial state of charge of the storage devices as a fraction of their capacity. A dict with the keys 'cooling_storage', 'dhw_storage' and/or 'electrical_storage' sets each device independently. Empty storage devices by default
+            restore_battery (bool): if True, the batteries start the episode with their nominal capacity and efficiency, so that consecutive episodes (i.e. short random windows) are independent. By default the degradation of the batteries carries over from one episode to the next
+        """
+        
+        # Selecting the window of the loaded data that will be simulated in this episode. The data is not reloaded, only the time-step pointers change.
+        if length is None:
+            if start is None:
+                start = self.simulation_period[0]
+            end = self.simulation_period[1]
+        else:
+            assert 1 < length <= self.simulation_period[1] - self.simulation_period[0] + 1, 'The episode length must be greater than 1 and fit within the simulation_period'
+            if start is None:
+                # The start is drawn in whole time-steps so that the episode is aligned with the data
+                n_starts = int((self.simulation_period[1] - self.simulation_period[0] + 1 - length)//self.time_resolution) + 1
+                start = self.simulation_period[0] + int(self.np_random.integers(0, n_starts))*self.time_resolution
+            end = start + length - 1
+            
+        assert self.simulation_period[0] <= start < end <= self.simulation_period[1], 'The episode must fall within the simulation_period'
+        self.episode_period = (start, end)
+        self.episode_time_steps = self._to_time_steps(self.episode_period)
+        assert self.episode_time_steps[1] > self.episode_time_steps[0], 'The episode must contain at least two time-steps'
+        self.initial_soc = initial_soc
+        self.restore_battery = restore_battery
+        
+        # Data years used for every simulated year, either following the year order (repeated as many times as needed) or shuffling the years of the data
+        if self.year_order is not None:
+            n_years = self.episode_time_steps[1]//self.steps_per_year + 1
+            if isinstance(self.year_order, str):
+                self.episode_years = []
+                while len(self.episode_years) < n_years:
+                    self.episode_years += list(self.np_random.permutation(self.n_data_time_steps//self.steps_per_year))
+            else:
+                self.episode_years = list(self.year_order)*(n_years//len(self.year_order) + 1)
+            self.episode_years = [int(year) for year in self.episode_years[:n_years]]
+        
+        # The same list of time-steps of the data is shared by all the buildings
+        self.episode_data_time_steps = self._get_data_time_steps(np.arange(self.episode_time_steps[0], self.episode_time_steps[1] + 1)).tolist()
+        for building in self.buildings.values():
+            building.data_time_steps = self.episode_data_time_steps
         
         #Initialization of variables
-        self.hour = iter(np.array(range(self.simulation_period[0], self.simulation_period[1] + 1)))
+        self.data_time_step = None
+        self.hour = iter(np.array(range(self.episode_time_steps[0], self.episode_time_steps[1] + 1)))
         self.next_hour()
             
-        self.carbon_emissions = []
-        self.net_electric_consumption = []
-        self.net_electric_consumption_no_storage = []
-        self.net_electric_consumption_no_pv_no_storage = []
-        self.electric_consumption_electric_storage = []
-        self.electric_consumption_dhw_storage = []
-        self.electric_consumption_cooling_storage = []
+        n_steps = self.episode_time_steps[1] - self.episode_time_steps[0]
+        self._district_results = {name: np.zeros(n_steps) for name in DISTRICT_RESULTS}
+        self._n_recorded_steps = 0
         self.electric_consumption_electrical_storage = []
-        self.electric_consumption_dhw = []
-        self.electric_consumption_cooling = []
-        self.electric_consumption_appliances = []
-        self.electric_generation = []
         
         self.cumulated_reward_episode = 0
         self.current_carbon_intensity = 0
@@ -580,41 +1432,54 @@ class CityLearn(gym.Env):
         if self.central_agent:
             s, s_appended = [], []
             for uid, building in self.buildings.items():
-                building.reset()
+                building.reset(restore_battery = self.restore_battery)
+                self._set_initial_soc(building)
                 for state_name, value in self.buildings_states_actions[uid]['states'].items():
                     if state_name not in s_appended:
                         if value == True:
-                            if state_name in ['t_in', 'avg_unmet_setpoint', 'rh_in', 'non_shiftable_load', 'solar_gen']:
-                                s.append(building.sim_results[state_name][self.time_step])
+                            if is_building_state(state_name):
+                                s.append(building.sim_results[state_name][self.data_time_step])
                             elif state_name == 'net_electricity_consumption':
                                 s.append(building.current_net_electricity_demand)
                             elif state_name != 'cooling_storage_soc' and state_name != 'dhw_storage_soc':
-                                s.append(building.sim_results[state_name][self.time_step])
+                                s.append(building.sim_results[state_name][self.data_time_step])
                                 s_appended.append(state_name)
                             elif state_name == 'cooling_storage_soc':
-                                s.append(0.0)
+                                s.append(building.cooling_storage._soc/building.cooling_storage.capacity)
                             elif state_name == 'dhw_storage_soc':
-                                s.append(0.0)
+                                s.append(building.dhw_storage._soc/building.dhw_storage.capacity)
             self.state = np.array(s)
         else:
-            self.reward_function = reward_function_ma(len(self.building_ids), self.get_building_information())
+            # The building information only depends on the loaded data, so it is computed once (when the reward function first reads it) and reused in every episode
+            if self._building_info is None:
+                self._building_info = _LazyBuildingInformation(self)
+            self.reward_function = reward_function_ma(len(self.building_ids), self._building_info)
+            
+            if self.observation_mode != 'object':
+                for building in self.buildings.values():
+                    building.reset(restore_battery = self.restore_battery)
+                    self._set_initial_soc(building)
+                self._history_position = None
+                self.state = self._get_state()
+                return self._get_ob()
             
             self.state = []
             for uid, building in self.buildings.items():
-                building.reset()
+                building.reset(restore_battery = self.restore_battery)
+                self._set_initial_soc(building)
                 s = []
                 for state_name, value in zip(self.buildings_states_actions[uid]['states'], self.buildings_states_actions[uid]['states'].values()):
                     if value == True:
                         if state_name == 'net_electricity_consumption':
                             s.append(building.current_net_electricity_demand)
                         elif (state_name != 'cooling_storage_soc') and (state_name != 'dhw_storage_soc') and (state_name != 'electrical_storage_soc'):
-                            s.append(building.sim_results[state_name][self.time_step])
+                            s.append(building.sim_results[state_name][self.data_time_step])
                         elif state_name == 'cooling_storage_soc':
-                            s.append(0.0)
+                            s.append(building.cooling_storage._soc/building.cooling_storage.capacity)
                         elif state_name == 'dhw_storage_soc':
-                            s.append(0.0)
+                            s.append(building.dhw_storage._soc/building.dhw_storage.capacity)
                         elif state_name == 'electrical_storage_soc':
-                            s.append(0.0)
+                            s.append(building.electrical_storage._soc/building.electrical_storage.capacity)
 
                 self.state.append(np.array(s, dtype=np.float32))
                 
@@ -622,27 +1487,30 @@ class CityLearn(gym.Env):
             
         return self._get_ob()
     
+    def _set_initial_soc(self, building):
+        if self.initial_soc is None:
+            return
+        
+        for device_name in ['cooling_storage', 'dhw_storage', 'electrical_storage']:
+            if isinstance(self.initial_soc, dict):
+                soc = self.initial_soc.get(device_name, 0.0)
+            else:
+                soc = self.initial_soc
+            assert 0.0 <= soc <= 1.0, 'The initial state of charge must be between 0 and 1'
+            
+            device = getattr(building, device_name)
+            if device is not None:
+                device._soc = soc*device.capacity
+    
     def _get_ob(self):            
         return self.state
     
     def _terminal(self):
-        is_terminal = bool(self.time_step >= self.simulation_period[1])
+        is_terminal = bool(self.time_step >= self.episode_time_steps[1])
         if is_terminal:
             for building in self.buildings.values():
                 building.terminate()
                 
-            # When the simulation is over, convert all the control variables to numpy arrays so they are easier to plot.
-            self.carbon_emissions = np.array(self.carbon_emissions)
-            self.net_electric_consumption = np.array(self.net_electric_consumption)
-            self.net_electric_consumption_no_storage = np.array(self.net_electric_consumption_no_storage)
-            self.net_electric_consumption_no_pv_no_storage = np.array(self.net_electric_consumption_no_pv_no_storage)
-            self.electric_consumption_electric_storage = np.array(self.electric_consumption_electric_storage)
-            self.electric_consumption_dhw_storage = np.array(self.electric_consumption_dhw_storage)
-            self.electric_consumption_cooling_storage = np.array(self.electric_consumption_cooling_storage)
-            self.electric_consumption_dhw = np.array(self.electric_consumption_dhw)
-            self.electric_consumption_cooling = np.array(self.electric_consumption_cooling)
-            self.electric_consumption_appliances = np.array(self.electric_consumption_appliances)
-            self.electric_generation = np.array(self.electric_generation)
 #             self.loss.append([i for i in self.get_baseline_cost().values()])
             
             if self.verbose == 1:
@@ -651,33 +1519,49 @@ class CityLearn(gym.Env):
         return is_terminal
     
     def seed(self, seed=None):
-        self.np_random, seed = seeding.np_random(seed)
-        return [seed]
+        # Same generator as gym.utils.seeding.np_random
+        seed_seq = np.random.SeedSequence(seed)
+        self.np_random = np.random.Generator(np.random.PCG64(seed_seq))
+        return [seed_seq.entropy]
+    
+    def render(self):
+        pass
+    
+    def close(self):
+        pass
     
     def get_buildings_net_electric_demand(self):
-        return self.buildings_net_electricity_demand
+        # The net demands are written in place at every time-step, so a copy is returned
+        return self.buildings_net_electricity_demand.copy()
     
-    def cost(self):
+    def _simulate_baseline(self):
         
-        # Running the reference rule-based controller to find the baseline cost
-        if self.cost_rbc is None:
-            env_rbc = CityLearn(self.data_path, self.building_attributes, self.weather_file, self.solar_profile, self.building_ids, carbon_intensity = self.carbon_intensity, buildings_states_actions = self.buildings_states_actions_filename, simulation_period = self.simulation_period, cost_function = self.cost_function, central_agent = False)
+        # Running the reference rule-based controller to find the baseline cost. It is run again if the last episode covered a different period, or different years of the data (i.e. with year_order='shuffle'), than the ones the baseline was computed for.
+        key = (self.episode_period, None if self.episode_years is None else tuple(self.episode_years))
+        if self.cost_rbc is None or self.cost_rbc_key != key:
+            env_rbc = self.template.spawn(simulation_period = self.episode_period, cost_function = self.cost_function, central_agent = False, year_order = self.episode_years)
             _, actions_spaces = env_rbc.get_state_action_spaces()
 
             #Instantiatiing the control agent(s)
             agent_rbc = RBC_Agent(actions_spaces)
 
-            state = env_rbc.reset()
+            state = env_rbc.reset(initial_soc = self.initial_soc)
             done = False
             while not done:
-                action = agent_rbc.select_action([list(env_rbc.buildings.values())[0].sim_results['hour'][env_rbc.time_step]])
+                action = agent_rbc.select_action([list(env_rbc.buildings.values())[0].sim_results['hour'][env_rbc.data_time_step]])
                 next_state, rewards, done, _ = env_rbc.step(action)
                 state = next_state
                 
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
+            if self.episode_period[1] - self.episode_period[0] > 8760:
                 self.cost_rbc, self.cost_rbc_last_yr = env_rbc.get_baseline_cost()
             else:
                 self.cost_rbc = env_rbc.get_baseline_cost()
+            self.cost_rbc_per_year = env_rbc._get_costs_per_year()
+            self.cost_rbc_key = key
+            
+    def cost(self):
+        
+        self._simulate_baseline()
         
         # Compute the costs normalized by the baseline costs
         cost, cost_last_yr, c_score, c_score_last_yr = {}, {}, [], []
@@ -685,26 +1569,26 @@ class CityLearn(gym.Env):
             cost['ramping'] = np.abs((self.net_electric_consumption - np.roll(self.net_electric_consumption,1))[1:]).sum()/self.cost_rbc['ramping']
             c_score.append(cost['ramping'])
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['ramping_last_yr'] = np.abs((self.net_electric_consumption[-8760:] - np.roll(self.net_electric_consumption[-8760:],1))[1:]).sum()/self.cost_rbc_last_yr['ramping_last_yr']
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['ramping_last_yr'] = np.abs((self.net_electric_consumption[-self.steps_per_year:] - np.roll(self.net_electric_consumption[-self.steps_per_year:],1))[1:]).sum()/self.cost_rbc_last_yr['ramping_last_yr']
                 c_score_last_yr.append(cost_last_yr['ramping_last_yr'])
             
         # Finds the load factor for every month (average monthly demand divided by its maximum peak), and averages all the load factors across the 12 months. The metric is one minus the load factor.
         if '1-load_factor' in self.cost_function:
-            cost['1-load_factor'] = np.mean([1-np.mean(self.net_electric_consumption[i:i+int(8760/12)])/ np.max(self.net_electric_consumption[i:i+int(8760/12)]) for i in range(0,len(self.net_electric_consumption), int(8760/12))])/self.cost_rbc['1-load_factor']
+            cost['1-load_factor'] = np.mean([1-np.mean(self.net_electric_consumption[i:i+self.steps_per_month])/ np.max(self.net_electric_consumption[i:i+self.steps_per_month]) for i in range(0,len(self.net_electric_consumption), self.steps_per_month)])/self.cost_rbc['1-load_factor']
             c_score.append(cost['1-load_factor'])
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['1-load_factor_last_yr'] = np.mean([1-np.mean(self.net_electric_consumption[-8760:][i:i+int(8760/12)])/ np.max(self.net_electric_consumption[-8760:][i:i+int(8760/12)]) for i in range(0,len(self.net_electric_consumption[-8760:]), int(8760/12))])/self.cost_rbc_last_yr['1-load_factor_last_yr']
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['1-load_factor_last_yr'] = np.mean([1-np.mean(self.net_electric_consumption[-self.steps_per_year:][i:i+self.steps_per_month])/ np.max(self.net_electric_consumption[-self.steps_per_year:][i:i+self.steps_per_month]) for i in range(0,len(self.net_electric_consumption[-self.steps_per_year:]), self.steps_per_month)])/self.cost_rbc_last_yr['1-load_factor_last_yr']
                 c_score_last_yr.append(cost_last_yr['1-load_factor_last_yr'])
            
         # Average of all the daily peaks of the 365 day of the year. The peaks are calculated using the net energy demand of the whole district of buildings.
         if 'average_daily_peak' in self.cost_function:
-            cost['average_daily_peak'] = np.mean([self.net_electric_consumption[i:i+24].max() for i in range(0,len(self.net_electric_consumption),24)])/self.cost_rbc['average_daily_peak']
+            cost['average_daily_peak'] = np.mean([self.net_electric_consumption[i:i+self.steps_per_day].max() for i in range(0,len(self.net_electric_consumption),self.steps_per_day)])/self.cost_rbc['average_daily_peak']
             c_score.append(cost['average_daily_peak'])
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['average_daily_peak_last_yr'] = np.mean([self.net_electric_consumption[-8760:][i:i+24].max() for i in range(0,len(self.net_electric_consumption[-8760:]),24)])/self.cost_rbc_last_yr['average_daily_peak_last_yr']
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['average_daily_peak_last_yr'] = np.mean([self.net_electric_consumption[-self.steps_per_year:][i:i+self.steps_per_day].max() for i in range(0,len(self.net_electric_consumption[-self.steps_per_year:]),self.steps_per_day)])/self.cost_rbc_last_yr['average_daily_peak_last_yr']
                 c_score_last_yr.append(cost_last_yr['average_daily_peak_last_yr'])
             
         # Peak demand of the district for the whole year period.
@@ -712,30 +1596,30 @@ class CityLearn(gym.Env):
             cost['peak_demand'] = self.net_electric_consumption.max()/self.cost_rbc['peak_demand']
             c_score.append(cost['peak_demand'])
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['peak_demand_last_yr'] = self.net_electric_consumption[-8760:].max()/self.cost_rbc_last_yr['peak_demand_last_yr']
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['peak_demand_last_yr'] = self.net_electric_consumption[-self.steps_per_year:].max()/self.cost_rbc_last_yr['peak_demand_last_yr']
                 c_score_last_yr.append(cost_last_yr['peak_demand_last_yr'])
             
         # Positive net electricity consumption for the whole district. It is clipped at a min. value of 0 because the objective is to minimize the energy consumed in the district, not to profit from the excess generation. (Island operation is therefore incentivized)
         if 'net_electricity_consumption' in self.cost_function:
             cost['net_electricity_consumption'] = self.net_electric_consumption.clip(min=0).sum()/self.cost_rbc['net_electricity_consumption']
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['net_electricity_consumption_last_yr'] = self.net_electric_consumption[-8760:].clip(min=0).sum()/self.cost_rbc_last_yr['net_electricity_consumption_last_yr']
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['net_electricity_consumption_last_yr'] = self.net_electric_consumption[-self.steps_per_year:].clip(min=0).sum()/self.cost_rbc_last_yr['net_electricity_consumption_last_yr']
             
         if 'carbon_emissions' in self.cost_function:
             cost['carbon_emissions'] = self.carbon_emissions.sum()/self.cost_rbc['carbon_emissions']
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['carbon_emissions_last_yr'] = self.carbon_emissions[-8760:].sum()/self.cost_rbc_last_yr['carbon_emissions_last_yr']
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['carbon_emissions_last_yr'] = self.carbon_emissions[-self.steps_per_year:].sum()/self.cost_rbc_last_yr['carbon_emissions_last_yr']
             
         # Not used for the challenge
         if 'quadratic' in self.cost_function:
             cost['quadratic'] = (self.net_electric_consumption.clip(min=0)**2).sum()/self.cost_rbc['quadratic']
             c_score.append(cost['quadratic'])
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['quadratic_last_yr'] = (self.net_electric_consumption[-8760:].clip(min=0)**2).sum()/self.cost_rbc_last_yr['quadratic_last_yr']
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['quadratic_last_yr'] = (self.net_electric_consumption[-self.steps_per_year:].clip(min=0)**2).sum()/self.cost_rbc_last_yr['quadratic_last_yr']
                 c_score_last_yr.append(cost_last_yr['quadratic_last_yr'])
         
         cost['total'] = np.mean([c for c in cost.values()])
@@ -746,12 +1630,57 @@ class CityLearn(gym.Env):
         if c_score_last_yr != []:
             cost_last_yr['coordination_score_last_yr'] = np.mean(c_score_last_yr)
         
-        if self.simulation_period[1] - self.simulation_period[0] > 8760:
+        if self.episode_period[1] - self.episode_period[0] > 8760:
             cost_last_yr['total_last_yr'] = np.mean([c for c in cost_last_yr.values()])
             return cost, cost_last_yr
         
         return cost
     
+    def cost_per_year(self):
+        """
+        Costs of every simulated year of the episode (consecutive periods of 365 days from the start of the episode, the last of which may be incomplete) divided by the costs of the rule-based controller in the same year. With a year_order, the year of the data that every simulated year was mapped onto is given by episode_years.
+        Returns:
+            costs (list of dicts): costs of every simulated year, with the same metrics and scores as cost()
+        """
+        
+        self._simulate_baseline()
+        
+        costs = []
+        for year_cost, year_cost_rbc in zip(self._get_costs_per_year(), self.cost_rbc_per_year):
+            cost = {name: value/year_cost_rbc[name] for name, value in year_cost.items()}
+            c_score = [cost[name] for name in ['ramping','1-load_factor','average_daily_peak','peak_demand','quadratic'] if name in cost]
+            cost['total'] = np.mean([c for c in cost.values()])
+            if c_score != []:
+                cost['coordination_score'] = np.mean(c_score)
+            costs.append(cost)
+            
+        return costs
+    
+    def _get_costs_per_year(self):
+        
+        # Same metrics as get_baseline_cost(), computed independently for every simulated year
+        costs = []
+        for start in range(0, len(self.net_electric_consumption), self.steps_per_year):
+            net_electric_consumption = self.net_electric_consumption[start:start + self.steps_per_year]
+            cost = {}
+            if 'ramping' in self.cost_function:
+                cost['ramping'] = np.abs(np.diff(net_electric_consumption)).sum()
+            if '1-load_factor' in self.cost_function:
+                cost['1-load_factor'] = np.mean([1 - np.mean(net_electric_consumption[i:i+self.steps_per_month])/np.max(net_electric_consumption[i:i+self.steps_per_month]) for i in range(0, len(net_electric_consumption), self.steps_per_month)])
+            if 'average_daily_peak' in self.cost_function:
+                cost['average_daily_peak'] = np.mean([net_electric_consumption[i:i+self.steps_per_day].max() for i in range(0, len(net_electric_consumption), self.steps_per_day)])
+            if 'peak_demand' in self.cost_function:
+                cost['peak_demand'] = net_electric_consumption.max()
+            if 'net_electricity_consumption' in self.cost_function:
+                cost['net_electricity_consumption'] = net_electric_consumption.clip(min=0).sum()
+            if 'carbon_emissions' in self.cost_function:
+                cost['carbon_emissions'] = self.carbon_emissions[start:start + self.steps_per_year].sum()
+            if 'quadratic' in self.cost_function:
+                cost['quadratic'] = (net_electric_consumption.clip(min=0)**2).sum()
+            costs.append(cost)
+            
+        return costs
+    
     def get_baseline_cost(self):
         
         # Computes the costs for the Rule-based controller, which are used to normalized the actual costs.
@@ -759,46 +1688,46 @@ class CityLearn(gym.Env):
         if 'ramping' in self.cost_function:
             cost['ramping'] = np.abs((self.net_electric_consumption - np.roll(self.net_electric_consumption,1))[1:]).sum()
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['ramping_last_yr'] = np.abs((self.net_electric_consumption[-8760:] - np.roll(self.net_electric_consumption[-8760:],1))[1:]).sum()
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['ramping_last_yr'] = np.abs((self.net_electric_consumption[-self.steps_per_year:] - np.roll(self.net_electric_consumption[-self.steps_per_year:],1))[1:]).sum()
             
         if '1-load_factor' in self.cost_function:
-            cost['1-load_factor'] = np.mean([1 - np.mean(self.net_electric_consumption[i:i+int(8760/12)])/ np.max(self.net_electric_consumption[i:i+int(8760/12)]) for i in range(0, len(self.net_electric_consumption), int(8760/12))])
+            cost['1-load_factor'] = np.mean([1 - np.mean(self.net_electric_consumption[i:i+self.steps_per_month])/ np.max(self.net_electric_consumption[i:i+self.steps_per_month]) for i in range(0, len(self.net_electric_consumption), self.steps_per_month)])
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['1-load_factor_last_yr'] = np.mean([1-np.mean(self.net_electric_consumption[-8760:][i:i+int(8760/12)])/ np.max(self.net_electric_consumption[-8760:][i:i+int(8760/12)]) for i in range(0,len(self.net_electric_consumption[-8760:]), int(8760/12))])
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['1-load_factor_last_yr'] = np.mean([1-np.mean(self.net_electric_consumption[-self.steps_per_year:][i:i+self.steps_per_month])/ np.max(self.net_electric_consumption[-self.steps_per_year:][i:i+self.steps_per_month]) for i in range(0,len(self.net_electric_consumption[-self.steps_per_year:]), self.steps_per_month)])
            
         if 'average_daily_peak' in self.cost_function:
-            cost['average_daily_peak'] = np.mean([self.net_electric_consumption[i:i+24].max() for i in range(0, len(self.net_electric_consumption), 24)])
+            cost['average_daily_peak'] = np.mean([self.net_electric_consumption[i:i+self.steps_per_day].max() for i in range(0, len(self.net_electric_consumption), self.steps_per_day)])
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['average_daily_peak_last_yr'] = np.mean([self.net_electric_consumption[-8760:][i:i+24].max() for i in range(0,len(self.net_electric_consumption[-8760:]),24)])
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['average_daily_peak_last_yr'] = np.mean([self.net_electric_consumption[-self.steps_per_year:][i:i+self.steps_per_day].max() for i in range(0,len(self.net_electric_consumption[-self.steps_per_year:]),self.steps_per_day)])
             
         if 'peak_demand' in self.cost_function:
             cost['peak_demand'] = self.net_electric_consumption.max()
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['peak_demand_last_yr'] = self.net_electric_consumption[-8760:].max()
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['peak_demand_last_yr'] = self.net_electric_consumption[-self.steps_per_year:].max()
             
         if 'net_electricity_consumption' in self.cost_function:
             cost['net_electricity_consumption'] = self.net_electric_consumption.clip(min=0).sum()
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['net_electricity_consumption_last_yr'] = self.net_electric_consumption[-8760:].clip(min=0).sum()
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['net_electricity_consumption_last_yr'] = self.net_electric_consumption[-self.steps_per_year:].clip(min=0).sum()
             
         if 'carbon_emissions' in self.cost_function:
             cost['carbon_emissions'] = self.carbon_emissions.sum()
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['carbon_emissions_last_yr'] = self.carbon_emissions[-8760:].sum()
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['carbon_emissions_last_yr'] = self.carbon_emissions[-self.steps_per_year:].sum()
             
         if 'quadratic' in self.cost_function:
             cost['quadratic'] = (self.net_electric_consumption.clip(min=0)**2).sum()
             
-            if self.simulation_period[1] - self.simulation_period[0] > 8760:
-                cost_last_yr['quadratic_last_yr'] = (self.net_electric_consumption[-8760:].clip(min=0)**2).sum()
+            if self.episode_period[1] - self.episode_period[0] > 8760:
+                cost_last_yr['quadratic_last_yr'] = (self.net_electric_consumption[-self.steps_per_year:].clip(min=0)**2).sum()
                 
-        if self.simulation_period[1] - self.simulation_period[0] > 8760:
+        if self.episode_period[1] - self.episode_period[0] > 8760:
             return cost, cost_last_yr
             
         return cost
\ No newline at end of file
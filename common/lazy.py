@@ -0,0 +1,18 @@
+import importlib
+
+class LazyModule:
+    """
+    Stands for a module which is only imported when one of its attributes is first used, so that the modules which refer to it (i.e. the agents, with torch and sklearn) can be imported without importing it.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        
+    def __getattr__(self, attr):
+        # Only called for the attributes that are not set on the instance, which are those of the module
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+        
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self._name)
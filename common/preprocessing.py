@@ -55,4 +55,104 @@ class remove_feature:
     def __mul__(self, x):
         return None
     def __rmul__(self, x):
-        return None
\ No newline at end of file
+        return None
+
+# States that are removed from the encoded states of a building that lacks the device or the demand they describe, given as the key of building_info that is 0 in that case
+UNAVAILABLE_STATES = {'solar_power_capacity (kW)': ['diffuse_solar_rad', 'direct_solar_rad', 'solar_gen'],
+                      'Annual_DHW_demand (kWh)': ['dhw_storage_soc'],
+                      'Annual_cooling_demand (kWh)': ['cooling_storage_soc'],
+                      'Annual_nonshiftable_electrical_demand (kWh)': ['non_shiftable_load']}
+
+def is_unavailable_state(state_name, building_info):
+    """
+    Args:
+        state_name (str): name of the state in buildings_state_action_space.json
+        building_info (dict): information of the building, as returned by CityLearn.get_building_information()
+    Returns:
+        True if the state describes a device or a demand that the building does not have. The predictions and the derived states (i.e. solar_gen_lag_24h) of such a state are unavailable as well
+    """
+    
+    for key, state_names in UNAVAILABLE_STATES.items():
+        if building_info[key] == 0:
+            for name in state_names:
+                if state_name == name or state_name.startswith(name + '_'):
+                    return True
+    return False
+
+class CompiledEncoder:
+    def __init__(self, encoder):
+        """
+        Encoder equivalent to an array of the encoders above (one per state), precomputed as the index of the state read by every encoded feature, the shift and divisor of the normalized features, the periods of the periodic features and the classes of the one-hot features, so that a whole batch of states is encoded in a few numpy operations.
+        Args:
+            encoder (list): encoder of every state (periodic_normalization, onehot_encoding, normalize, no_normalization or remove_feature)
+        """
+        
+        self.features = list(encoder)
+        source, shift, divisor = [], [], []
+        sin_columns, cos_columns, periods, onehot_columns, classes, onehot_starts = [], [], [], [], [], []
+        for i, feature in enumerate(encoder):
+            if isinstance(feature, remove_feature):
+                continue
+            elif isinstance(feature, periodic_normalization):
+                sin_columns.append(len(source))
+                cos_columns.append(len(source) + 1)
+                periods.append(feature.x_max)
+                n_columns = 2
+            elif isinstance(feature, onehot_encoding):
+                onehot_starts.append(len(onehot_columns))
+                onehot_columns += range(len(source), len(source) + len(feature.classes))
+                classes += list(feature.classes)
+                n_columns = len(feature.classes)
+            elif isinstance(feature, normalize):
+                # A constant state (x_min == x_max) is encoded as 0
+                shift.append(feature.x_min)
+                divisor.append(feature.x_max - feature.x_min if feature.x_max != feature.x_min else np.inf)
+                source.append(i)
+                continue
+            else:
+                n_columns = 1
+            
+            source += [i]*n_columns
+            shift += [0.]*n_columns
+            divisor += [1.]*n_columns
+        
+        self.input_dim = len(encoder)
+        self.output_dim = len(source)
+        self.source = np.array(source, dtype=int)
+        self.shift = np.array(shift, dtype=float)
+        self.divisor = np.array(divisor, dtype=float)
+        self.sin_columns = np.array(sin_columns, dtype=int)
+        self.cos_columns = np.array(cos_columns, dtype=int)
+        self.periods = np.array(periods, dtype=float)
+        self.onehot_columns = np.array(onehot_columns, dtype=int)
+        self.classes = np.array(classes, dtype=float)
+        self.onehot_starts = np.array(onehot_starts, dtype=int)
+    
+    @staticmethod
+    def concatenate(encoders):
+        """
+        Returns:
+            encoder (CompiledEncoder): encoder of the concatenated states of several encoders (i.e. of several buildings), whose encoded states are the concatenation of their encoded states
+        """
+        
+        return CompiledEncoder([feature for encoder in encoders for feature in encoder.features])
+    
+    def encode(self, states):
+        """
+        Args:
+            states (np.ndarray): states (input_dim,) or batch of states (batch_size, input_dim)
+        Returns:
+            encoded (np.ndarray): encoded states (output_dim,) or (batch_size, output_dim), equal to np.hstack(encoder*state) without the removed features
+        Raises:
+            ValueError: if a state encoded with onehot_encoding is not one of its classes, which onehot_encoding cannot encode either
+        """
+        
+        x = np.asarray(states, dtype=float)[..., self.source]
+        encoded = (x - self.shift)/self.divisor
+        encoded[..., self.sin_columns] = (np.sin(2 * np.pi * x[..., self.sin_columns] / self.periods) + 1)/2.0
+        encoded[..., self.cos_columns] = (np.cos(2 * np.pi * x[..., self.cos_columns] / self.periods) + 1)/2.0
+        onehot = x[..., self.onehot_columns] == self.classes
+        if len(self.onehot_starts) > 0 and not np.logical_or.reduceat(onehot, self.onehot_starts, axis=-1).all():
+            raise ValueError('A state encoded with onehot_encoding is not one of its classes')
+        encoded[..., self.onehot_columns] = onehot
+        return encoded
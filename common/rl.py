@@ -2,8 +2,11 @@ import torch
 import torch.nn.functional as F
 import torch.nn as nn
 from torch.distributions import Normal
-import random
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import tempfile
 import numpy as np
+from common.preprocessing import CompiledEncoder
 
 class PolicyNetwork(nn.Module):
     def __init__(self, 
@@ -58,54 +61,240 @@ class PolicyNetwork(nn.Module):
         log_prob = normal.log_prob(x_t)
         # Enforcing Action Bound
         log_prob -= torch.log(self.action_scale * (1 - y_t.pow(2)) + self.epsilon)
-        log_prob = log_prob.sum(1, keepdim=True)
+        log_prob = log_prob.sum(-1, keepdim=True)
         mean = torch.tanh(mean) * self.action_scale + self.action_bias
         return action, log_prob, mean
+    
+    def act(self, state, deterministic = False):
+        # Same actions as sample() (or its means if deterministic), without the log-probabilities and the distribution objects, which are only needed for training
+        mean, log_std = self.forward(state)
+        if not deterministic:
+            mean = mean + log_std.exp() * torch.randn_like(mean)
+        return torch.tanh(mean) * self.action_scale + self.action_bias
 
     def to(self, device):
         self.action_scale = self.action_scale.to(device)
         self.action_bias = self.action_bias.to(device)
         return super(PolicyNetwork, self).to(device)
     
+def _zeros(shape, dtype, path = None):
+    # Array of zeros, either in memory or memory-mapped onto a temporary file in the directory path, which is deleted as soon as the array is released
+    if path is None:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(tempfile.TemporaryFile(dir = path), dtype = dtype, mode = 'w+', shape = shape)
+
 class ReplayBuffer:
-    def __init__(self, capacity):
+    def __init__(self, capacity, prefetch = False, state_dtype = np.float32, state_range = (0., 1.), share_next_state = False, path = None, replace = False, seed = None):
+        """
+        Ring buffer of transitions stored in preallocated arrays (state, action, reward, next_state, done), which are allocated when the first transition is pushed.
+        Args:
+            capacity (int): maximum number of transitions. The oldest ones are overwritten once it is full
+            prefetch (bool): if True, sample_tensors() prepares the next batch in a background thread while the current one is used
+            state_dtype (numpy dtype): type in which the states are stored: np.float32, np.float16 (half the memory, with a relative precision of about 1e-3) or np.uint8 (a quarter of the memory, quantized over state_range). The states are always sampled as float32
+            state_range (tuple): lowest and highest values (floats, or arrays with one value per state) of the states stored as np.uint8. Values outside of the range are clipped. The states encoded by the agents are within (0, 1), except the coordination variables of MARLISA
+            share_next_state (bool): if True, the next states are not stored. The transitions are stored as trajectories, and the next state of a transition is the state of the transition pushed after it. It is only kept apart when the following transition starts from another state (i.e. after a reset), or while it has not been pushed yet
+            path (str): directory where the arrays are memory-mapped onto temporary files (deleted when the buffer is released), for capacities which do not fit in memory. In memory by default
+            replace (bool): if True, the transitions of a batch are drawn with replacement, so a batch may contain the same transition more than once. Without replacement by default, as the buffer of lists it replaces
+            seed (int or sequence of ints): seed of the random generator of the buffer, which draws the batches independently of the global numpy random state
+        """
+        
         self.capacity = capacity
-        self.buffer = []
         self.position = 0
+        self.size = 0
+        self.state, self.action, self.reward, self.next_state, self.done = None, None, None, None, None
+        
+        self.state_dtype = np.dtype(state_dtype)
+        self.state_range = state_range
+        self.path = path
+        self.replace = replace
+        self.rng = np.random.default_rng(seed)
+        
+        # With share_next_state, linked[i] tells whether the next state of the transition i is the state of the transition i + 1. Otherwise, it is kept in _next_states, encoded as the states of the buffer
+        self.share_next_state = share_next_state
+        self.linked = None
+        self._next_states = {}
+        
+        # Functions applied to every batch when it is sampled (see set_transform)
+        self.state_transform = None
+        self.reward_transform = None
+        
+        # Protects the rows being written from the background thread that samples the next batch
+        self.lock = threading.Lock()
+        self.prefetch = prefetch
+        self._executor = None
+        self._next_batch = None
+    
+    def _allocate(self, state_dim, action_dim):
+        self.state = _zeros((self.capacity, state_dim), self.state_dtype, self.path)
+        self.action = _zeros((self.capacity, action_dim), np.float32, self.path)
+        self.reward = _zeros(self.capacity, np.float32, self.path)
+        self.done = _zeros(self.capacity, np.float32, self.path)
+        if self.share_next_state:
+            self.linked = np.zeros(self.capacity, dtype=bool)
+        else:
+            self.next_state = _zeros((self.capacity, state_dim), self.state_dtype, self.path)
+        
+        if self.state_dtype == np.uint8:
+            low, high = (np.asarray(value, dtype=np.float32) for value in self.state_range)
+            self._quantization = (low, (high - low)/255)
+    
+    def _encode(self, state):
+        if self.state_dtype == np.uint8:
+            low, step = self._quantization
+            return np.clip(np.rint((np.asarray(state) - low)/step), 0, 255)
+        return state
+    
+    def _decode(self, rows):
+        # float32 array of the states stored in rows, which is a copy unless the states are stored in memory as float32
+        if self.state_dtype == np.uint8:
+            low, step = self._quantization
+            return rows*step + low
+        return np.asarray(rows).astype(np.float32, copy=False)
     
     def push(self, state, action, reward, next_state, done):
-        if len(self.buffer) < self.capacity:
-            self.buffer.append(None)
+        if self.state is None:
+            self._allocate(len(state), len(action))
         
-        self.buffer[self.position] = (state, action, reward, next_state, done)
-        self.position = (self.position + 1) % self.capacity
+        state = np.asarray(self._encode(state), dtype=self.state_dtype)
+        with self.lock:
+            if self.share_next_state:
+                # The next state of the previous transition is dropped if it is the state of this one, as both are stored
+                previous = (self.position - 1) % self.capacity
+                if self.size > 0 and self.capacity > 1 and np.array_equal(self._next_states.get(previous), state):
+                    self.linked[previous] = True
+                    del self._next_states[previous]
+                self.linked[self.position] = False
+                self._next_states[self.position] = np.asarray(self._encode(next_state), dtype=self.state_dtype)
+            else:
+                self.next_state[self.position] = self._encode(next_state)
+            
+            self.state[self.position] = state
+            self.action[self.position] = action
+            self.reward[self.position] = reward
+            self.done[self.position] = done
+            self.position = (self.position + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
     
     def sample(self, batch_size):
-        batch = random.sample(self.buffer, batch_size)
-        state, action, reward, next_state, done = map(np.stack, zip(*batch))
+        with self.lock:
+            index = self.rng.choice(self.size, batch_size, replace = self.replace)
+            state, action, reward, done = self._decode(self.state[index]), np.asarray(self.action[index]), np.asarray(self.reward[index]), np.asarray(self.done[index])
+            if self.share_next_state:
+                next_state = self._decode(self.state[(index + 1) % self.capacity])
+                for i in np.flatnonzero(~self.linked[index]):
+                    next_state[i] = self._decode(self._next_states[index[i]])
+            else:
+                next_state = self._decode(self.next_state[index])
+        
+        if self.state_transform is not None:
+            state = self.state_transform(state).astype(np.float32, copy=False)
+            next_state = self.state_transform(next_state).astype(np.float32, copy=False)
+        if self.reward_transform is not None:
+            reward = self.reward_transform(reward).astype(np.float32, copy=False)
         return state, action, reward, next_state, done
     
+    def get_states(self):
+        """
+        Returns:
+            states (np.ndarray): float32 array (size, state_dim) of the states stored, in the order of the rows of the buffer
+        """
+        
+        if self.state is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._decode(self.state[:self.size])
+    
+    def _sample_tensors(self, batch_size, device):
+        state, action, reward, next_state, done = self.sample(batch_size)
+        return (torch.from_numpy(state).to(device), torch.from_numpy(action).to(device), torch.from_numpy(reward).unsqueeze(1).to(device),
+                torch.from_numpy(next_state).to(device), torch.from_numpy(done).unsqueeze(1).to(device))
+    
+    def sample_tensors(self, batch_size, device):
+        """
+        Returns:
+            state, action, reward, next_state, done (torch.Tensor): batch of transitions on the device, with the rewards and done flags as columns (batch_size, 1). With prefetch, the batch was sampled in the background after the previous call, and may not contain the transitions pushed since then.
+        """
+        
+        if not self.prefetch:
+            return self._sample_tensors(batch_size, device)
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers = 1)
+        if self._next_batch is None or self._next_batch[0] != (batch_size, device):
+            batch = self._sample_tensors(batch_size, device)
+        else:
+            batch = self._next_batch[1].result()
+        self._next_batch = ((batch_size, device), self._executor.submit(self._sample_tensors, batch_size, device))
+        return batch
+    
+    def set_transform(self, state_transform = None, reward_transform = None):
+        """
+        Sets the functions applied to the states and next states, and to the rewards, of every batch when it is sampled (i.e. normalization). The stored transitions are never modified, so the transforms can be changed at any time.
+        Args:
+            state_transform (function): (batch_size, state_dim) array -> (batch_size, any dimension) array
+            reward_transform (function): (batch_size,) array -> (batch_size,) array
+        """
+        
+        self.state_transform = state_transform
+        self.reward_transform = reward_transform
+        
+        # A batch prefetched with the previous transforms is discarded
+        self._next_batch = None
+    
     def __len__(self):
-        return len(self.buffer)
+        return self.size
+    
+    def __getstate__(self):
+        # The lock and the background thread cannot be pickled
+        state = self.__dict__.copy()
+        state.update({'lock': None, '_executor': None, '_next_batch': None})
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
         
 class RegressionBuffer:
-    def __init__(self, capacity):
+    def __init__(self, capacity, dtype = np.float32, path = None):
+        """
+        Ring buffer of the inputs (x) and targets (y) of a regression model, stored in preallocated arrays which are allocated when the first sample is pushed.
+        Args:
+            capacity (int): maximum number of samples. The oldest ones are overwritten once it is full
+            dtype (numpy dtype): type in which the samples are stored: np.float32 or np.float16
+            path (str): directory where the arrays are memory-mapped onto temporary files (deleted when the buffer is released). In memory by default
+        """
+        
         self.capacity = capacity
-        self.x = []
-        self.y = []
+        self.dtype = np.dtype(dtype)
+        self.path = path
         self.position = 0
+        self.size = 0
+        self._x, self._y = None, None
     
     def push(self, variables, targets):
-        if len(self.x) < self.capacity and len(self.x)==len(self.y):
-            self.x.append(None)
-            self.y.append(None)
+        if self._x is None:
+            self._x = _zeros((self.capacity, len(variables)), self.dtype, self.path)
+            self._y = _zeros(self.capacity, self.dtype, self.path)
         
-        self.x[self.position] = variables
-        self.y[self.position] = targets
+        self._x[self.position] = variables
+        self._y[self.position] = targets
         self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+    
+    @property
+    def x(self):
+        # float32 arrays of the samples stored, in the order of the rows of the buffer (which does not matter for the regression)
+        if self._x is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.asarray(self._x[:self.size]).astype(np.float32, copy=False)
+    
+    @property
+    def y(self):
+        if self._y is None:
+            return np.zeros(0, dtype=np.float32)
+        return np.asarray(self._y[:self.size]).astype(np.float32, copy=False)
     
     def __len__(self):
-        return len(self.x)
+        return self.size
     
 class SoftQNetwork(nn.Module):
     def __init__(self, num_inputs, num_actions, hidden_size=[400,300], init_w=3e-3):
@@ -121,8 +310,156 @@ class SoftQNetwork(nn.Module):
         self.linear3.bias.data.uniform_(-init_w, init_w)
         
     def forward(self, state, action):
-        x = torch.cat([state, action], 1)
+        x = torch.cat([state, action], -1)
         x = self.ln1(F.relu(self.linear1(x)))
         x = self.ln2(F.relu(self.linear2(x)))
         x = self.linear3(x)
-        return x
\ No newline at end of file
+        return x
+
+class GroupedLinear(nn.Module):
+    def __init__(self, layers):
+        """
+        Linear layers with the same shape of several networks, applied to the inputs of all the networks (n_networks, batch_size, in_features) with one batched matrix multiplication. The weights are stacked as (n_networks, in_features, out_features), which batched matrix multiplications read faster, and the weights of every layer become (transposed) views of them, so the networks share the values updated through the group.
+        Args:
+            layers (list): nn.Linear layers
+        """
+        
+        super(GroupedLinear, self).__init__()
+        self.weight = nn.Parameter(torch.stack([layer.weight.data.t() for layer in layers]))
+        self.bias = nn.Parameter(torch.stack([layer.bias.data for layer in layers]).unsqueeze(1))
+        for i, layer in enumerate(layers):
+            layer.weight.data = self.weight.data[i].t()
+            layer.bias.data = self.bias.data[i, 0]
+    
+    def forward(self, x):
+        return torch.baddbmm(self.bias, x, self.weight)
+    
+class GroupedLayerNorm(nn.Module):
+    def __init__(self, layers):
+        # Same as GroupedLinear for nn.LayerNorm layers, whose elementwise affine transformations are stacked
+        super(GroupedLayerNorm, self).__init__()
+        self.normalized_shape = layers[0].normalized_shape
+        self.eps = layers[0].eps
+        self.weight = nn.Parameter(torch.stack([layer.weight.data for layer in layers]).unsqueeze(1))
+        self.bias = nn.Parameter(torch.stack([layer.bias.data for layer in layers]).unsqueeze(1))
+        for i, layer in enumerate(layers):
+            layer.weight.data = self.weight.data[i, 0]
+            layer.bias.data = self.bias.data[i, 0]
+    
+    def forward(self, x):
+        return F.layer_norm(x, self.normalized_shape, eps=self.eps)*self.weight + self.bias
+    
+class GroupedSoftQNetwork(SoftQNetwork):
+    def __init__(self, networks):
+        """
+        Soft Q-networks with the same shape (i.e. of several buildings), evaluated together on inputs (n_networks, batch_size, ...) and returning (n_networks, batch_size, 1). The parameters of the networks are views of the parameters of the group.
+        Args:
+            networks (list): SoftQNetwork instances
+        """
+        
+        nn.Module.__init__(self)
+        for name in ['linear1', 'linear2', 'linear3']:
+            setattr(self, name, GroupedLinear([getattr(network, name) for network in networks]))
+        for name in ['ln1', 'ln2']:
+            setattr(self, name, GroupedLayerNorm([getattr(network, name) for network in networks]))
+    
+class GroupedPolicyNetwork(PolicyNetwork):
+    def __init__(self, networks):
+        """
+        Policy networks with the same shape, evaluated and sampled together on states (n_networks, batch_size, num_inputs). The parameters of the networks are views of the parameters of the group.
+        Args:
+            networks (list): PolicyNetwork instances
+        """
+        
+        nn.Module.__init__(self)
+        self.log_std_min = networks[0].log_std_min
+        self.log_std_max = networks[0].log_std_max
+        self.epsilon = networks[0].epsilon
+        for name in ['linear1', 'linear2', 'mean_linear', 'log_std_linear']:
+            setattr(self, name, GroupedLinear([getattr(network, name) for network in networks]))
+        self.action_scale = torch.stack([network.action_scale for network in networks]).unsqueeze(1)
+        self.action_bias = torch.stack([network.action_bias for network in networks]).unsqueeze(1)
+        
+class BatchedPolicy:
+    def __init__(self, building_ids, policies, encoders, device, grouped_policies = None):
+        """
+        Selects the actions of several buildings with one forward pass per group of buildings whose policies and encoders have the same shape. The states of the buildings of a group are encoded with a single encoder (see CompiledEncoder.concatenate), mapped by the affine transform of every building (see set_transform) into preallocated input tensors, and given to a GroupedPolicyNetwork.
+        Args:
+            building_ids (list): buildings, in the order of the states and actions
+            policies (dict): PolicyNetwork of every building
+            encoders (dict): CompiledEncoder of every building
+            device (torch.device): device of the policies
+            grouped_policies (dict): GroupedPolicyNetwork already built for some tuples of buildings (i.e. to update them together), which are reused so that the policies of the buildings keep sharing their weights
+        """
+        
+        self.building_ids = building_ids
+        self.device = device
+        self.action_dims = [policies[uid].mean_linear.out_features for uid in building_ids]
+        
+        uids_by_shape = {}
+        for uid in building_ids:
+            shape = (encoders[uid].output_dim, policies[uid].linear1.in_features, policies[uid].mean_linear.out_features)
+            uids_by_shape.setdefault(shape, []).append(uid)
+        
+        self.groups, self.position = [], {}
+        for (encoded_dim, input_dim, action_dim), uids in uids_by_shape.items():
+            policy = (grouped_policies or {}).get(tuple(uids))
+            if policy is None:
+                policy = GroupedPolicyNetwork([policies[uid] for uid in uids])
+            
+            # On CPU, the input tensor shares the memory of the numpy buffer into which the transformed states are written
+            inputs = np.zeros((len(uids), 1, input_dim), dtype=np.float32)
+            self.groups.append({'uids': uids, 'index': np.array([building_ids.index(uid) for uid in uids]), 'state_dims': [encoders[uid].input_dim for uid in uids], 'action_dim': action_dim,
+                                'encoder': CompiledEncoder.concatenate([encoders[uid] for uid in uids]), 'policy': policy,
+                                'weights': np.zeros((len(uids), encoded_dim, input_dim)), 'bias': np.zeros((len(uids), 1, input_dim)), 'has_transform': np.zeros(len(uids), dtype=bool),
+                                'inputs': inputs, 'input_tensor': torch.from_numpy(inputs).to(device)})
+            for i, uid in enumerate(uids):
+                self.position[uid] = (len(self.groups) - 1, i)
+    
+    def set_transform(self, uid, weights, bias):
+        """
+        Sets the affine transform of the encoded states of a building (i.e. normalization and PCA): encoded_state @ weights + bias. It must be set for every building before the first call to select_action.
+        Args:
+            weights (np.ndarray): (encoded_dim, input_dim) array
+            bias (np.ndarray): (input_dim,) array
+        """
+        
+        group, i = self.position[uid]
+        self.groups[group]['weights'][i] = weights
+        self.groups[group]['bias'][i, 0] = bias
+        self.groups[group]['has_transform'][i] = True
+    
+    def pad(self, actions):
+        """
+        Returns:
+            actions (np.ndarray): float32 matrix (n_buildings, max_action_dim) of the actions of every building, padded with zeros, as taken by CityLearn.step()
+        """
+        
+        padded = np.zeros((len(self.building_ids), max(self.action_dims)), dtype=np.float32)
+        for i, action in enumerate(actions):
+            padded[i, :len(action)] = action
+        return padded
+    
+    def select_action(self, states, deterministic = False):
+        """
+        Args:
+            states (list or np.ndarray): states of every building, or float32 matrix (n_buildings, max_state_dim) of the states of every building padded with zeros, as returned by CityLearn with observation_mode='padded'
+            deterministic (bool): if True, the means of the policies are returned instead of sampled actions
+        Returns:
+            actions (np.ndarray): float32 matrix (n_buildings, max_action_dim) of the actions of every building, padded with zeros
+        """
+        
+        assert not isinstance(states, np.ndarray) or states.dtype == object or states.ndim == 2, 'The padded states must be a matrix (n_buildings, max_state_dim), without history'
+        actions = np.zeros((len(self.building_ids), max(self.action_dims)), dtype=np.float32)
+        with torch.no_grad():
+            for group in self.groups:
+                assert group['has_transform'].all(), 'The transform of every building must be set with set_transform before selecting actions'
+                # Every row of the padded states is cut to the states of its building, which come first
+                encoded = group['encoder'].encode(np.concatenate([states[i][:state_dim] for i, state_dim in zip(group['index'], group['state_dims'])])).reshape(len(group['uids']), 1, -1)
+                np.add(np.matmul(encoded, group['weights']), group['bias'], out=group['inputs'])
+                if self.device.type != 'cpu':
+                    group['input_tensor'].copy_(torch.from_numpy(group['inputs']))
+                
+                action = group['policy'].act(group['input_tensor'], deterministic)
+                actions[group['index'], :group['action_dim']] = action[:, 0].cpu().numpy()
+        return actions
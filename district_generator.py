@@ -0,0 +1,140 @@
+"""
+Generates synthetic districts with any number of buildings by sampling the buildings of an existing district and perturbing their load profiles and attributes. Used to test how CityLearn scales to districts much larger than the ones provided.
+"""
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# Columns of the Building_i.csv files that are scaled and shifted in time. Calendar columns are kept as they are so that all the buildings remain synchronized with the weather data.
+LOAD_COLUMNS = ['Equipment Electric Power [kWh]', 'DHW Heating [kWh]', 'Cooling Load [kWh]']
+INDOOR_COLUMNS = ['Indoor Temperature [C]', 'Average Unmet Cooling Setpoint Difference [C]', 'Indoor Relative Humidity [%]']
+
+def generate_district(data_path, n_buildings, building_attributes = 'building_attributes.json', buildings_states_actions = 'buildings_state_action_space.json', load_scale = (0.5, 2.0), load_noise = 0.05, storage_scale = (0.5, 2.0), solar_scale = (0.0, 2.0), max_time_shift = 3, n_hours = None, seed = 0):
+    """
+    Args:
+        data_path (Path): folder containing the district that is sampled (i.e. data/Climate_Zone_5)
+        n_buildings (int): number of buildings of the synthetic district
+        building_attributes (str): name of the file with the attributes of the buildings, within data_path
+        buildings_states_actions (str): path to the file with the states and actions of the buildings that are sampled
+        load_scale (tuple): range of the factor by which the loads of every building are scaled
+        load_noise (float): standard deviation of the hourly multiplicative noise added to the loads
+        storage_scale (tuple): range of the factor by which the capacities of the storage devices and the battery power are scaled
+        solar_scale (tuple): range of the factor by which the installed PV capacity is scaled (relative to the load scale of the building)
+        max_time_shift (int): maximum number of time-steps by which the loads are shifted forwards or backwards
+        n_hours (int): number of rows of the data that are kept. All of them by default
+        seed (int): seed of the random generator (np.random.default_rng)
+    Returns:
+        district (dict): 'building_attributes' and 'buildings_states_actions' dicts, and 'profiles', a dict with the pd.DataFrame of every building, with the same format as the Building_i.csv files
+    """
+
+    rng = np.random.default_rng(seed)
+    data_path = Path(data_path)
+
+    with open(data_path / building_attributes) as json_file:
+        source_attributes = json.load(json_file)
+    with open(buildings_states_actions) as json_file:
+        source_states_actions = json.load(json_file)
+
+    source_profiles = {}
+    for uid in source_attributes:
+        source_profiles[uid] = pd.read_csv(data_path / (uid + '.csv'), nrows = n_hours)
+
+    source_ids = list(source_attributes)
+    district = {'building_attributes': {}, 'buildings_states_actions': {}, 'profiles': {}}
+    for i in range(n_buildings):
+        uid = 'Building_' + str(i + 1)
+        source_uid = source_ids[rng.integers(len(source_ids))]
+
+        # Loads: scaled, shifted in time and perturbed hour by hour
+        scale = rng.uniform(*load_scale)
+        shift = rng.integers(-max_time_shift, max_time_shift + 1)
+        profile = source_profiles[source_uid].copy()
+        for column in LOAD_COLUMNS + INDOOR_COLUMNS:
+            profile[column] = np.roll(profile[column].values, shift)
+        for column in LOAD_COLUMNS:
+            noise = np.clip(rng.normal(1.0, load_noise, len(profile)), 0.0, None)
+            profile[column] = (profile[column].values*scale*noise).round(4)
+
+        # Attributes: storage devices and PV capacity are resized
+        attributes = json.loads(json.dumps(source_attributes[source_uid]))
+        attributes['File_Name'] = uid + '.csv'
+        attributes['Solar_Power_Installed(kW)'] = round(attributes['Solar_Power_Installed(kW)']*scale*rng.uniform(*solar_scale), 1)
+        attributes['Chilled_Water_Tank']['capacity'] = round(attributes['Chilled_Water_Tank']['capacity']*rng.uniform(*storage_scale), 2)
+        attributes['DHW_Tank']['capacity'] = round(attributes['DHW_Tank']['capacity']*rng.uniform(*storage_scale), 2)
+        battery_scale = scale*rng.uniform(*storage_scale)
+        attributes['Battery']['capacity'] = round(attributes['Battery']['capacity']*battery_scale, 1)
+        attributes['Battery']['nominal_power'] = round(attributes['Battery']['nominal_power']*battery_scale, 1)
+
+        district['building_attributes'][uid] = attributes
+        district['buildings_states_actions'][uid] = source_states_actions[source_uid]
+        district['profiles'][uid] = profile
+
+    return district
+
+def write_district(district, output_path, data_path, weather_file = 'weather_data.csv', solar_profile = 'solar_generation_1kW.csv', carbon_intensity = 'carbon_intensity.csv', building_attributes = 'building_attributes.json', buildings_states_actions = 'buildings_state_action_space.json'):
+    """
+    Writes a district returned by generate_district with the same layout as the folders in data/, so that it can be loaded by CityLearn. The weather, solar profile and carbon intensity files are copied from data_path. The file with the states and actions is written in output_path as well.
+    Returns:
+        params (dict): parameters of CityLearn that load the synthetic district
+    """
+
+    output_path, data_path = Path(output_path), Path(data_path)
+    output_path.mkdir(parents = True, exist_ok = True)
+
+    for uid, profile in district['profiles'].items():
+        profile.to_csv(output_path / (uid + '.csv'), index = False)
+
+    n_rows = len(next(iter(district['profiles'].values())))
+    for file_name in [weather_file, solar_profile, carbon_intensity]:
+        if n_rows == len(pd.read_csv(data_path / file_name, usecols = [0])):
+            shutil.copy(data_path / file_name, output_path / file_name)
+        else:
+            pd.read_csv(data_path / file_name, nrows = n_rows).to_csv(output_path / file_name, index = False)
+
+    with open(output_path / building_attributes, 'w') as json_file:
+        json.dump(district['building_attributes'], json_file, indent = 4)
+    with open(output_path / buildings_states_actions, 'w') as json_file:
+        json.dump(district['buildings_states_actions'], json_file, indent = 4)
+
+    return {'data_path': output_path,
+            'building_attributes': building_attributes,
+            'weather_file': weather_file,
+            'solar_profile': solar_profile,
+            'carbon_intensity': carbon_intensity,
+            'building_ids': list(district['building_attributes']),
+            'buildings_states_actions': str(output_path / buildings_states_actions),
+            'simulation_period': (0, n_rows - 1)}
+
+def load_district(district, data_path, weather_file = 'weather_data.csv', solar_profile = 'solar_generation_1kW.csv', carbon_intensity = 'carbon_intensity.csv', building_attributes = 'building_attributes.json', buildings_states_actions = 'buildings_state_action_space.json', data_cache = True):
+    """
+    Same as write_district, but the district is kept in memory: the files that write_district would write are returned as the argument files of CityLearn and EnvTemplate, which reads them by name instead of from disk. The weather, solar profile and carbon intensity are read from data_path.
+    The states and actions are not written to a file either: the agents (i.e. SAC and MARLISA) take them as the dict CityLearn.buildings_states_actions instead of the path to the file.
+    Returns:
+        params (dict): parameters of CityLearn that load the synthetic district, including files. All of them but simulation_period are also the parameters of EnvTemplate
+    """
+
+    from citylearn import read_data
+
+    data_path = Path(data_path)
+    files = {building_attributes: district['building_attributes'], buildings_states_actions: district['buildings_states_actions']}
+
+    # Same columns as read_data would return for the files written by write_district
+    for uid, profile in district['profiles'].items():
+        columns = {column: profile[column].to_numpy() for column in profile.columns}
+        files[uid + '.csv'] = {column: values.astype(str) if values.dtype == object else values for column, values in columns.items()}
+
+    n_rows = len(next(iter(district['profiles'].values())))
+    for file_name in [weather_file, solar_profile, carbon_intensity]:
+        files[file_name] = {column: values[:n_rows] for column, values in read_data(data_path / file_name, data_cache).items()}
+
+    return {'data_path': data_path,
+            'building_attributes': building_attributes,
+            'weather_file': weather_file,
+            'solar_profile': solar_profile,
+            'carbon_intensity': carbon_intensity,
+            'building_ids': list(district['building_attributes']),
+            'buildings_states_actions': buildings_states_actions,
+            'simulation_period': (0, n_rows - 1),
+            'files': files}
@@ -1,6 +1,12 @@
-from gym import spaces
 import numpy as np
 
+def box(low, high):
+    # gym is only imported when a space is first used, so that the simulation itself only requires numpy
+    import gym
+    from gym import spaces
+    gym.logger.set_level(40)
+    return spaces.Box(low=low, high=high, dtype=np.float32)
+
 class Building:  
     def __init__(self, buildingId, dhw_storage = None, cooling_storage = None, electrical_storage = None, dhw_heating_device = None, cooling_device = None, save_memory = True):
         """
@@ -24,9 +30,14 @@ class Building:
         self.electrical_storage = electrical_storage
         self.dhw_heating_device = dhw_heating_device
         self.cooling_device = cooling_device
-        self.observation_space = None
-        self.action_space = None
+        self._state_bounds = None
+        self._action_bounds = None
+        
+        # Spaces created from the bounds. The dict is shared by the copies of the building made by EnvTemplate, so that every space is only created once.
+        self._spaces = {}
         self.time_step = 0
+        self.episode_start = 0
+        self.data_time_steps = None
         self.sim_results = {}
         self.save_memory = save_memory
         
@@ -72,12 +83,26 @@ class Building:
         self.electrical_storage_soc = []
         
     def set_state_space(self, high_state, low_state):
-        # Setting the state space and the lower and upper bounds of each state-variable
-        self.observation_space = spaces.Box(low=low_state, high=high_state, dtype=np.float32)
+        # Setting the lower and upper bounds of each state-variable. The state space is created from them when it is first used.
+        self._state_bounds = (low_state, high_state)
+        self._spaces.pop('observation', None)
     
     def set_action_space(self, max_action, min_action):
-        # Setting the action space and the lower and upper bounds of each action-variable
-        self.action_space = spaces.Box(low=min_action, high=max_action, dtype=np.float32)
+        # Setting the lower and upper bounds of each action-variable. The action space is created from them when it is first used.
+        self._action_bounds = (min_action, max_action)
+        self._spaces.pop('action', None)
+        
+    @property
+    def observation_space(self):
+        if 'observation' not in self._spaces and self._state_bounds is not None:
+            self._spaces['observation'] = box(*self._state_bounds)
+        return self._spaces.get('observation')
+    
+    @property
+    def action_space(self):
+        if 'action' not in self._spaces and self._action_bounds is not None:
+            self._spaces['action'] = box(*self._action_bounds)
+        return self._spaces.get('action')
         
     def set_storage_electrical(self, action):
         """
@@ -200,7 +225,7 @@ class Building:
     def get_cooling_electric_demand(self):
         return self.cooling_device._electrical_consumption_cooling
     
-    def reset(self):
+    def reset(self, restore_battery = False):
         
         self.current_net_electricity_demand = self.sim_results['non_shiftable_load'][self.time_step] - self.sim_results['solar_gen'][self.time_step]
         
@@ -209,12 +234,21 @@ class Building:
         if self.cooling_storage is not None:
             self.cooling_storage.reset()
         if self.electrical_storage is not None:
-            self.electrical_storage.reset()
+            self.electrical_storage.reset(restore = restore_battery)
         if self.dhw_heating_device is not None:
             self.dhw_heating_device.reset()
-            self.current_net_electricity_demand += self.dhw_heating_device.get_electric_consumption_heating(self.sim_results['dhw_demand'][self.time_step]) 
         if self.cooling_device is not None:
             self.cooling_device.reset()
+            
+        # The devices are aligned with the first time-step of the episode, which is not necessarily the first time-step of the data
+        self.episode_start = self.time_step
+        for device in [self.dhw_storage, self.cooling_storage, self.electrical_storage, self.dhw_heating_device, self.cooling_device]:
+            if device is not None:
+                device.time_step = self.time_step
+        
+        if self.dhw_heating_device is not None:
+            self.current_net_electricity_demand += self.dhw_heating_device.get_electric_consumption_heating(self.sim_results['dhw_demand'][self.time_step]) 
+        if self.cooling_device is not None:
             self.current_net_electricity_demand += self.cooling_device.get_electric_consumption_cooling(self.sim_results['cooling_demand'][self.time_step])
             
         self._electric_consumption_cooling_storage = 0.0
@@ -262,10 +296,16 @@ class Building:
             
         if self.save_memory == False:
             
-            self.cooling_demand_building = np.array(self.sim_results['cooling_demand'][:self.time_step])
-            self.dhw_demand_building = np.array(self.sim_results['dhw_demand'][:self.time_step])
-            self.electric_consumption_appliances = np.array(self.sim_results['non_shiftable_load'][:self.time_step])
-            self.electric_generation = np.array(self.sim_results['solar_gen'][:self.time_step])
+            # Time-steps of the data that have been simulated. They are not contiguous when the simulation period is longer than the data (set by CityLearn)
+            if self.data_time_steps is None:
+                time_steps = np.arange(self.episode_start, self.time_step)
+            else:
+                time_steps = self.data_time_steps[:-1]
+            
+            self.cooling_demand_building = np.array(self.sim_results['cooling_demand'])[time_steps]
+            self.dhw_demand_building = np.array(self.sim_results['dhw_demand'])[time_steps]
+            self.electric_consumption_appliances = np.array(self.sim_results['non_shiftable_load'])[time_steps]
+            self.electric_generation = np.array(self.sim_results['solar_gen'])[time_steps]
             
             elec_consumption_dhw = 0
             elec_consumption_dhw_storage = 0
@@ -384,10 +424,10 @@ class HeatPump:
             _electrical_consumption_cooling (float): electricity consumption for cooling
         """
         
-        self.cooling_supply.append(cooling_supply)
         self._electrical_consumption_cooling = cooling_supply/self.cop_cooling[self.time_step]
         
         if self.save_memory == False:
+            self.cooling_supply.append(cooling_supply)
             self.electrical_consumption_cooling.append(np.float32(self._electrical_consumption_cooling))
             
         return self._electrical_consumption_cooling
@@ -415,10 +455,10 @@ class HeatPump:
             _elec_consumption_heating (float): electricity consumption for heating
         """
         
-        self.heat_supply.append(heat_supply)
         self._electrical_consumption_heating = heat_supply/self.cop_heating[self.time_step]
         
         if self.save_memory == False:
+            self.heat_supply.append(heat_supply)
             self.electrical_consumption_heating.append(np.float32(self._electrical_consumption_heating))
             
         return self._electrical_consumption_heating
@@ -453,8 +493,6 @@ class HeatPump:
         
     def terminate(self):
         if self.save_memory == False:
-            self.cop_heating = self.cop_heating[:self.time_step]
-            self.cop_cooling = self.cop_cooling[:self.time_step]
             self.electrical_consumption_cooling = np.array(self.electrical_consumption_cooling)
             self.electrical_consumption_heating = np.array(self.electrical_consumption_heating)
             self.heat_supply = np.array(self.heat_supply)
@@ -512,10 +550,10 @@ class ElectricHeater:
             _electrical_consumption_heating (float): electricity consumption for heating
         """
         
-        self.heat_supply.append(heat_supply)
         self._electrical_consumption_heating = heat_supply/self.efficiency
         
         if self.save_memory == False:
+            self.heat_supply.append(heat_supply)
             self.electrical_consumption_heating.append(np.float32(self._electrical_consumption_heating))
             
         return self._electrical_consumption_heating
@@ -647,6 +685,7 @@ class Battery:
             self.capacity_power_curve = capacity_power_curve
             
         self.efficiency = efficiency**0.5
+        self.efficiency0 = self.efficiency
         self.loss_coef = loss_coef
         self.max_power = None
         self._eff = []
@@ -736,9 +775,19 @@ class Battery:
             
         return self._energy_balance
     
-    def reset(self):
+    def reset(self, restore = False):
+        """
+        Args:
+            restore (bool): if True, the capacity and the efficiency, which charge() changes with the degradation and the power of the battery, are set back to their nominal values. Otherwise the degradation carries over to the next episode
+        """
+        
         self.soc = []
         self._soc = 0 #State of charge
         self.energy_balance = [] #Positive for energy entering the storage
         self._energy_balance = 0
-        self.time_step = 0
\ No newline at end of file
+        self.time_step = 0
+        
+        if restore:
+            self.capacity = self.c0
+            self.efficiency = self.efficiency0
+            self.max_power = None
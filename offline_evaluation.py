@@ -0,0 +1,257 @@
+"""
+Offline evaluation of fixed schedules of actions (i.e. from logs or from an open-loop planner). The whole trajectory of every schedule is simulated in a single call, with the same physics as CityLearn.step(): the states of charge of the storage devices of all the buildings (and of all the schedules) are updated together in a loop over time, and everything that does not depend on the actions is computed with whole-array operations.
+"""
+import numpy as np
+from energy_models import HeatPump
+from citylearn import ACTIONS, RBC_Agent
+
+def _interpolate(curve_x, curve_y, x):
+    # Piecewise-linear curves of the batteries of all the buildings (n_buildings, n_points), evaluated at x (..., n_buildings) with the same behavior (extrapolation included) as Battery.charge
+    idx = np.maximum(0, np.argmax(x[..., np.newaxis] <= curve_x, axis=-1) - 1)
+    buildings = np.arange(curve_x.shape[0])
+    return curve_y[buildings, idx] + (curve_y[buildings, idx + 1] - curve_y[buildings, idx])*(x - curve_x[buildings, idx])/(curve_x[buildings, idx + 1] - curve_x[buildings, idx])
+
+def _padded_curves(curves):
+    # The curves are padded with -inf to the same number of points, so that the padding is never selected by _interpolate
+    n_points = max(len(curve) for curve in curves)
+    curve_x, curve_y = np.full((len(curves), n_points), -np.inf), np.ones((len(curves), n_points))
+    for i, curve in enumerate(curves):
+        curve = np.array(curve, dtype=np.float64)
+        curve_x[i, :len(curve)], curve_y[i, :len(curve)] = curve[:, 0], curve[:, 1]
+    return curve_x, curve_y
+
+def _charge(soc, energy, capacity, efficiency, loss_coef):
+    # Vectorized EnergyStorage.charge. Returns the new state of charge and the energy balance.
+    soc_init = soc*(1 - loss_coef)
+    charging = energy >= 0
+    new_soc = np.where(charging, soc_init + energy*efficiency, np.maximum(0, soc_init + energy/efficiency))
+    new_soc = np.minimum(new_soc, capacity)
+    energy_balance = np.where(charging, (new_soc - soc_init)/efficiency, (new_soc - soc_init)*efficiency)
+    return new_soc, energy_balance
+
+def district_costs(net_electric_consumption, carbon_emissions, cost_function, steps_per_day, steps_per_month):
+    """
+    Costs of CityLearn.get_baseline_cost() for one or several time series of the district at once.
+    Args:
+        net_electric_consumption (np.array): net electricity consumption of the district (..., T)
+        carbon_emissions (np.array): carbon emissions of the district (..., T)
+    Returns:
+        cost (dict): cost of every time series (...) for every cost function
+    """
+
+    n_steps = net_electric_consumption.shape[-1]
+    days, months = np.arange(0, n_steps, steps_per_day), np.arange(0, n_steps, steps_per_month)
+    cost = {}
+    if 'ramping' in cost_function:
+        cost['ramping'] = np.abs(np.diff(net_electric_consumption, axis=-1)).sum(axis=-1)
+    if '1-load_factor' in cost_function:
+        month_lengths = np.diff(np.append(months, n_steps))
+        cost['1-load_factor'] = np.mean(1 - np.add.reduceat(net_electric_consumption, months, axis=-1)/month_lengths/np.maximum.reduceat(net_electric_consumption, months, axis=-1), axis=-1)
+    if 'average_daily_peak' in cost_function:
+        cost['average_daily_peak'] = np.maximum.reduceat(net_electric_consumption, days, axis=-1).mean(axis=-1)
+    if 'peak_demand' in cost_function:
+        cost['peak_demand'] = net_electric_consumption.max(axis=-1)
+    if 'net_electricity_consumption' in cost_function:
+        cost['net_electricity_consumption'] = net_electric_consumption.clip(min=0).sum(axis=-1)
+    if 'carbon_emissions' in cost_function:
+        cost['carbon_emissions'] = carbon_emissions.sum(axis=-1)
+    if 'quadratic' in cost_function:
+        cost['quadratic'] = (net_electric_consumption.clip(min=0)**2).sum(axis=-1)
+    return cost
+
+class OfflineEvaluator:
+    def __init__(self, env):
+        """
+        Args:
+            env (CityLearn): environment whose buildings, data and cost functions are used. The data is read once, so the same evaluator can be used for any number of schedules
+        """
+
+        self.env = env
+        buildings = list(env.buildings.values())
+        self.n_buildings = len(buildings)
+        data = lambda name: np.array([building.sim_results[name] for building in buildings], dtype=np.float64).T
+
+        # Data of all the buildings (n_data_time_steps, n_buildings)
+        self.cooling_demand = data('cooling_demand')
+        self.dhw_demand = data('dhw_demand')
+        self.non_shiftable_load = data('non_shiftable_load')
+        self.solar_gen = data('solar_gen')
+        self.carbon_intensity = np.array(buildings[0].sim_results['carbon_intensity'], dtype=np.float64)
+        self.hour = np.array(buildings[0].sim_results['hour'])
+
+        # Performance of the heating and cooling devices, which only depends on the outdoor temperature
+        self.cop_cooling = np.array([building.cooling_device.cop_cooling for building in buildings], dtype=np.float64).T
+        self.max_cooling = np.array([building.cooling_device.nominal_power for building in buildings], dtype=np.float64)*self.cop_cooling
+        self.cop_heating = np.empty_like(self.dhw_demand)
+        self.max_heating = np.empty_like(self.dhw_demand)
+        for i, device in enumerate(building.dhw_heating_device for building in buildings):
+            if isinstance(device, HeatPump):
+                self.cop_heating[:, i] = device.cop_heating
+                self.max_heating[:, i] = device.nominal_power*self.cop_cooling[:, i]
+            else:
+                self.cop_heating[:, i] = device.efficiency
+                self.max_heating[:, i] = device.nominal_power*device.efficiency
+
+        # Storage devices
+        storage = lambda name, attribute: np.array([getattr(getattr(building, name), attribute) for building in buildings], dtype=np.float64)
+        self.tanks = {name: {'capacity': storage(name, 'capacity'), 'efficiency': storage(name, 'efficiency'), 'loss_coef': storage(name, 'loss_coef')} for name in ['cooling_storage', 'dhw_storage']}
+        batteries = [building.electrical_storage for building in buildings]
+        assert all(battery.nominal_power is not None for battery in batteries), 'The batteries must have a nominal power'
+        self.battery = {'capacity': storage('electrical_storage', 'c0'), 'efficiency': storage('electrical_storage', 'efficiency0'), 'loss_coef': storage('electrical_storage', 'loss_coef'),
+                        'capacity_loss_coef': storage('electrical_storage', 'capacity_loss_coef'), 'nominal_power': storage('electrical_storage', 'nominal_power'),
+                        'power_efficiency_curve': np.array([battery.power_efficiency_curve is not None for battery in batteries]),
+                        'capacity_power_curve': np.array([battery.capacity_power_curve is not None for battery in batteries])}
+        self.battery['power_efficiency_x'], self.battery['power_efficiency_y'] = _padded_curves([battery.power_efficiency_curve.T if battery.power_efficiency_curve is not None else [[0, 1], [1, 1]] for battery in batteries])
+        self.battery['capacity_power_x'], self.battery['capacity_power_y'] = _padded_curves([battery.capacity_power_curve.T if battery.capacity_power_curve is not None else [[0, 1], [1, 1]] for battery in batteries])
+
+        # Column of every action in the matrices of actions (see CityLearn.action_names), or -1 if the building does not take it
+        self.action_columns = {action_name: np.array([list(names).index(action_name) if action_name in names else -1 for names in env.action_names]) for action_name in ACTIONS}
+        self._baseline_costs = {}
+
+    def _get_actions(self, actions, action_name):
+        columns = self.action_columns[action_name]
+        return np.where(columns >= 0, np.take_along_axis(actions, np.broadcast_to(np.maximum(columns, 0)[:, np.newaxis], actions.shape[:-1] + (1,)), -1)[..., 0], 0.0)
+
+    def evaluate(self, actions, start = None, initial_soc = None, normalize = True):
+        """
+        Args:
+            actions (np.array): actions of every time-step and building (T, n_buildings, max_action_dim), with the same layout as CityLearn.action_mask, or a batch of schedules (..., T, n_buildings, max_action_dim)
+            start (int): first hour of the schedules, in the same units as simulation_period. The first hour of the last episode of the environment by default
+            initial_soc (float or dict): initial state of charge of the storage devices, as in CityLearn.reset(). The batteries start with their nominal capacity and efficiency, as with CityLearn.reset(restore_battery=True)
+            normalize (bool): if True, the costs are also divided by the costs of the rule-based controller over the same period, as in CityLearn.cost()
+        Returns:
+            results (dict):
+                district results (..., T), as the attributes of CityLearn with the same names (i.e. 'net_electric_consumption' or 'carbon_emissions')
+                'buildings': dict of results of every building (..., T, n_buildings): 'net_electric_consumption' (including the battery, as the net electricity consumption used by CityLearn.step()), 'electric_consumption_cooling', 'electric_consumption_cooling_storage', 'electric_consumption_dhw', 'electric_consumption_dhw_storage', 'electrical_storage_electric_consumption', 'cooling_storage_soc', 'dhw_storage_soc' and 'electrical_storage_soc' (kWh)
+                'cost': costs of every schedule (...), as in CityLearn.get_baseline_cost()
+                'cost_normalized': costs divided by the costs of the rule-based controller, as in CityLearn.cost() (if normalize)
+        """
+
+        env = self.env
+        actions = np.asarray(actions, dtype=np.float64)
+        n_steps = actions.shape[-3]
+        batch_shape = actions.shape[:-3]
+        if start is None:
+            start = env.episode_period[0]
+        first_time_step = int(start//env.time_resolution)
+        data_time_steps = env._get_data_time_steps(np.arange(first_time_step, first_time_step + n_steps))
+
+        # Actions of every device (..., T, n_buildings). The devices whose actions are not taken are operated with an action of 0
+        cooling_actions = self._get_actions(actions, 'cooling_storage')
+        dhw_actions = self._get_actions(actions, 'dhw_storage')
+        electrical_actions = self._get_actions(actions, 'electrical_storage')
+        electrical_enabled = self.action_columns['electrical_storage'] >= 0
+
+        # Initial states of charge
+        initial_soc = initial_soc if isinstance(initial_soc, dict) else {name: initial_soc for name in ACTIONS}
+        soc = {name: np.full(batch_shape + (self.n_buildings,), (initial_soc.get(name) or 0)*device['capacity']) for name, device in list(self.tanks.items()) + [('electrical_storage', self.battery)]}
+        battery_capacity = np.broadcast_to(self.battery['capacity'], batch_shape + (self.n_buildings,)).copy()
+        battery_efficiency = np.broadcast_to(self.battery['efficiency'], batch_shape + (self.n_buildings,)).copy()
+
+        results = {name: np.zeros(batch_shape + (n_steps, self.n_buildings)) for name in ['cooling_storage_soc', 'dhw_storage_soc', 'electrical_storage_soc', 'electrical_storage_electric_consumption']}
+        supply = {name: np.zeros(batch_shape + (n_steps, self.n_buildings)) for name in ['cooling_storage', 'dhw_storage']}
+        tanks = [('cooling_storage', cooling_actions, self.cooling_demand, self.max_cooling - self.cooling_demand), ('dhw_storage', dhw_actions, self.dhw_demand, self.max_heating - self.dhw_demand)]
+        battery = self.battery
+        for t, data_time_step in enumerate(data_time_steps):
+
+            # Cooling and DHW storage tanks. They cannot be discharged by more than the demand of the building nor be charged by more than the power available. The heating and cooling devices supply the demand of the building plus the energy balance of the tank
+            for name, tank_actions, demand, power_available in tanks:
+                tank = self.tanks[name]
+                energy = np.maximum(-demand[data_time_step], np.minimum(power_available[data_time_step], tank_actions[..., t, :]*tank['capacity']))
+                soc[name], energy_balance = _charge(soc[name], energy, tank['capacity'], tank['efficiency'], tank['loss_coef'])
+                results[name + '_soc'][..., t, :] = soc[name]
+                supply[name][..., t, :] = np.maximum(0, energy_balance + demand[data_time_step])
+
+            # Batteries, whose maximum power and efficiency depend on their state of charge and on the power, and whose capacity degrades with use
+            energy = electrical_actions[..., t, :]*battery_capacity
+            soc_init = soc['electrical_storage']*(1 - battery['loss_coef'])
+            max_power = battery['nominal_power']*np.where(battery['capacity_power_curve'], _interpolate(battery['capacity_power_x'], battery['capacity_power_y'], soc_init/battery_capacity), 1.0)
+            energy = np.where(energy >= 0, np.minimum(energy, max_power), np.maximum(-max_power, energy))
+            battery_efficiency = np.where(battery['power_efficiency_curve'], _interpolate(battery['power_efficiency_x'], battery['power_efficiency_y'], np.abs(energy)/battery['nominal_power'])**0.5, battery_efficiency)
+            new_soc, energy_balance = _charge(soc['electrical_storage'], energy, battery_capacity, battery_efficiency, battery['loss_coef'])
+            soc['electrical_storage'] = np.where(electrical_enabled, new_soc, soc['electrical_storage'])
+            energy_balance = np.where(electrical_enabled, energy_balance, 0.0)
+            battery_capacity = battery_capacity - battery['capacity_loss_coef']*battery['capacity']*np.abs(energy_balance)/(2*battery_capacity)
+            results['electrical_storage_soc'][..., t, :] = soc['electrical_storage']
+            results['electrical_storage_electric_consumption'][..., t, :] = energy_balance
+
+        # Everything else is computed for the whole trajectory at once
+        cop_cooling, cop_heating = self.cop_cooling[data_time_steps], self.cop_heating[data_time_steps]
+        results['electric_consumption_cooling'] = supply['cooling_storage']/cop_cooling
+        results['electric_consumption_dhw'] = supply['dhw_storage']/cop_heating
+        results['electric_consumption_cooling_storage'] = results['electric_consumption_cooling'] - self.cooling_demand[data_time_steps]/cop_cooling
+        results['electric_consumption_dhw_storage'] = results['electric_consumption_dhw'] - self.dhw_demand[data_time_steps]/cop_heating
+        non_shiftable_load, solar_gen = self.non_shiftable_load[data_time_steps], self.solar_gen[data_time_steps]
+        results['net_electric_consumption'] = np.round(results['electrical_storage_electric_consumption'] + results['electric_consumption_cooling'] + results['electric_consumption_dhw'] + non_shiftable_load - solar_gen, 4)
+
+        # District results. The consumption of the storage devices is only counted for the devices whose actions are taken
+        cooling_enabled, dhw_enabled = self.action_columns['cooling_storage'] >= 0, self.action_columns['dhw_storage'] >= 0
+        electric_demand = results['net_electric_consumption'].sum(axis=-1)
+        elec_consumption_cooling_storage = (results['electric_consumption_cooling_storage']*cooling_enabled).sum(axis=-1)
+        elec_consumption_dhw_storage = (results['electric_consumption_dhw_storage']*dhw_enabled).sum(axis=-1)
+        elec_consumption_electrical_storage = results['electrical_storage_electric_consumption'].sum(axis=-1)
+        elec_generation = solar_gen.sum(axis=-1)
+        district = {'carbon_emissions': np.maximum(0, electric_demand)*self.carbon_intensity[data_time_steps],
+                    'net_electric_consumption': electric_demand,
+                    'electric_consumption_electric_storage': elec_consumption_electrical_storage,
+                    'electric_consumption_dhw_storage': elec_consumption_dhw_storage,
+                    'electric_consumption_cooling_storage': elec_consumption_cooling_storage,
+                    'electric_consumption_dhw': results['electric_consumption_dhw'].sum(axis=-1),
+                    'electric_consumption_cooling': results['electric_consumption_cooling'].sum(axis=-1),
+                    'electric_consumption_appliances': np.broadcast_to(non_shiftable_load.sum(axis=-1), electric_demand.shape),
+                    'electric_generation': np.broadcast_to(elec_generation, electric_demand.shape),
+                    'net_electric_consumption_no_storage': electric_demand - elec_consumption_cooling_storage - elec_consumption_dhw_storage - elec_consumption_electrical_storage,
+                    'net_electric_consumption_no_pv_no_storage': electric_demand + elec_generation - elec_consumption_cooling_storage - elec_consumption_dhw_storage - elec_consumption_electrical_storage}
+
+        output = {name: value.astype(np.float64) for name, value in district.items()}
+        output['buildings'] = {name: value.astype(np.float32) for name, value in results.items()}
+        output['cost'] = self._get_costs(output['net_electric_consumption'], output['carbon_emissions'], n_steps)
+        if normalize:
+            output['cost_normalized'] = self._normalize_costs(output['cost'], start, n_steps, initial_soc)
+        return output
+
+    def _get_costs(self, net_electric_consumption, carbon_emissions, n_steps):
+        env = self.env
+        cost = district_costs(net_electric_consumption, carbon_emissions, env.cost_function, env.steps_per_day, env.steps_per_month)
+
+        # Costs of the last year of the schedules, if they are longer than a year
+        if n_steps*env.time_resolution > 8760:
+            cost_last_yr = district_costs(net_electric_consumption[..., -env.steps_per_year:], carbon_emissions[..., -env.steps_per_year:], env.cost_function, env.steps_per_day, env.steps_per_month)
+            cost.update({name + '_last_yr': value for name, value in cost_last_yr.items()})
+        return cost
+
+    def baseline_actions(self, start, n_steps):
+        # Actions of the reference rule-based controller, which only depend on the hour of the day
+        env = self.env
+        agent = RBC_Agent(env.action_spaces)
+        rbc_actions = np.zeros((25,) + env.action_mask.shape)
+        for hour in range(1, 25):
+            for i, building_actions in enumerate(agent.select_action([hour])):
+                rbc_actions[hour, i, :len(building_actions)] = building_actions
+                
+        first_time_step = int(start//env.time_resolution)
+        return rbc_actions[self.hour[env._get_data_time_steps(np.arange(first_time_step, first_time_step + n_steps))]]
+
+    def _normalize_costs(self, cost, start, n_steps, initial_soc):
+        # The costs of the rule-based controller are computed once for every period and initial state of charge
+        key = (start, n_steps, tuple(sorted(initial_soc.items())))
+        if key not in self._baseline_costs:
+            self._baseline_costs[key] = self.evaluate(self.baseline_actions(start, n_steps), start = start, initial_soc = initial_soc, normalize = False)['cost']
+        baseline = self._baseline_costs[key]
+
+        # Same aggregation as CityLearn.cost()
+        coordination_costs = ['ramping', '1-load_factor', 'average_daily_peak', 'peak_demand', 'quadratic']
+        cost_normalized = {name: cost[name]/baseline[name] for name in cost if not name.endswith('_last_yr')}
+        c_score = [cost_normalized[name] for name in coordination_costs if name in cost_normalized]
+        cost_normalized['total'] = np.mean(list(cost_normalized.values()), axis=0)
+        if c_score != []:
+            cost_normalized['coordination_score'] = np.mean(c_score, axis=0)
+            
+        cost_last_yr = {name: cost[name]/baseline[name] for name in cost if name.endswith('_last_yr')}
+        if cost_last_yr != {}:
+            c_score_last_yr = [cost_last_yr[name + '_last_yr'] for name in coordination_costs if name + '_last_yr' in cost_last_yr]
+            if c_score_last_yr != []:
+                cost_last_yr['coordination_score_last_yr'] = np.mean(c_score_last_yr, axis=0)
+            cost_last_yr['total_last_yr'] = np.mean(list(cost_last_yr.values()), axis=0)
+            cost_normalized.update(cost_last_yr)
+        return cost_normalized
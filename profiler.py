@@ -0,0 +1,115 @@
+"""
+Opt-in timing instrumentation of CityLearn. The profiler replaces the methods of a CityLearn instance and of its buildings and devices by timed wrappers, so the classes are not modified and an environment which is not profiled runs exactly the same code as before.
+
+    profiler = env.enable_profiling(report_every = 1000)
+    ...
+    profiler.summary()
+"""
+from collections import defaultdict
+from time import perf_counter_ns
+
+# Phases of CityLearn.step() (and of step_into() and step_n(), which simulate the time-steps with the same methods), reset() and cost(), and the methods of CityLearn that implement them
+PHASES = {'step': 'step',
+          'step_into': 'step_into',
+          'step_n': 'step_n',
+          'step.dispatch': '_simulate_step',
+          'step.observation': ['_get_state', '_get_object_state', '_get_central_state', '_get_padded_state', '_push_history'],
+          'step.reward': '_get_rewards',
+          'step.terminal': '_terminal',
+          'reset': 'reset',
+          'cost': 'cost'}
+
+# Calls that simulate time-steps, after which the report is made if report_every time-steps have been simulated since the last one
+STEP_PHASES = ['step', 'step_into', 'step_n']
+
+# Devices of every building whose public methods are timed
+DEVICES = ['dhw_storage', 'cooling_storage', 'electrical_storage', 'dhw_heating_device', 'cooling_device']
+
+def print_report(summary):
+    for name, stats in sorted(summary.items(), key = lambda item: -item[1]['self_ms']):
+        print('{:<50} {:>10} calls {:>12.3f} ms {:>12.3f} ms self {:>10.3f} us/call'.format(name, stats['calls'], stats['total_ms'], stats['self_ms'], stats['mean_us']))
+
+class Profiler:
+    def __init__(self, report_every = None, report = print_report):
+        """
+        Args:
+            report_every (int): number of time-steps (simulated by step(), step_into() or step_n()) after which report is called with the summary. Never by default
+            report (function): called with the summary every report_every time-steps
+        """
+
+        self.report_every = report_every
+        self.report = report
+        self.total_ns = defaultdict(int)
+        self.self_ns = defaultdict(int)
+        self.calls = defaultdict(int)
+        self._wrapped = []
+
+        # Time spent in the timed calls made by every call that is being timed, which is not part of its own (self) time
+        self._children_ns = [0]
+        
+        # Number of calls of every phase that are running, so that a call made within a call of the same phase (i.e. _get_padded_state within _get_state, or step within step_n) is not timed twice
+        self._running = defaultdict(int)
+        self._reports = 0
+
+    def wrap(self, obj, method_name, name):
+        # The timed method is set on the instance, where it shadows the method of the class until detach() is called
+        method = getattr(obj, method_name)
+        def timed(*args, **kwargs):
+            if self._running[name] > 0:
+                return method(*args, **kwargs)
+            
+            self._running[name] += 1
+            self._children_ns.append(0)
+            start = perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                self._running[name] -= 1
+                self.total_ns[name] += elapsed
+                self.self_ns[name] += elapsed - self._children_ns.pop()
+                self.calls[name] += 1
+                self._children_ns[-1] += elapsed
+                if name in STEP_PHASES and self.report_every is not None and not any(self._running[step_name] for step_name in STEP_PHASES):
+                    # Every time-step is dispatched once, whichever call simulates it
+                    reports = self.calls['step.dispatch']//self.report_every
+                    if reports > self._reports:
+                        self._reports = reports
+                        self.report(self.summary())
+
+        setattr(obj, method_name, timed)
+        self._wrapped.append((obj, method_name))
+
+    def attach(self, env):
+        for name, method_names in PHASES.items():
+            for method_name in ([method_names] if isinstance(method_names, str) else method_names):
+                self.wrap(env, method_name, name)
+
+        for building in env.buildings.values():
+            for device in [building] + [getattr(building, device_name) for device_name in DEVICES if getattr(building, device_name) is not None]:
+                for method_name, method in vars(type(device)).items():
+                    if callable(method) and not method_name.startswith('_'):
+                        self.wrap(device, method_name, type(device).__name__ + '.' + method_name)
+        return self
+
+    def detach(self):
+        for obj, method_name in self._wrapped:
+            del obj.__dict__[method_name]
+        self._wrapped = []
+
+    def clear(self):
+        self.total_ns.clear()
+        self.self_ns.clear()
+        self.calls.clear()
+        self._reports = 0
+
+    def summary(self):
+        """
+        Returns:
+            summary (dict): for every phase and device method, the number of calls ('calls'), the total time ('total_ms'), the time not spent in other timed calls ('self_ms') and the mean time per call ('mean_us')
+        """
+
+        return {name: {'calls': self.calls[name],
+                       'total_ms': self.total_ns[name]/1e6,
+                       'self_ms': self.self_ns[name]/1e6,
+                       'mean_us': self.total_ns[name]/self.calls[name]/1e3} for name in self.calls}
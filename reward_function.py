@@ -4,36 +4,66 @@ be modified at will. This reward_function takes all the electrical demands and c
 """
 import numpy as np
 
+# Batched reward functions, which can be selected by name with the argument reward of CityLearn. They take the net electricity demand of the buildings of one or several environments (n_envs, n_buildings), which contains negative values when the building consumes more electricity than it generates, and their carbon intensity (n_envs,). They return the rewards of every building (n_envs, n_buildings), or a single reward for every environment (n_envs,) for the central agent. Those with an optional argument out write the rewards into it, so that CityLearn.step_into() does not allocate a new array of rewards at every time-step.
+REWARD_FUNCTIONS = {}
+
+def register_reward(name):
+    # Decorator that adds a batched reward function to REWARD_FUNCTIONS, so that it can be selected by name
+    def register(function):
+        REWARD_FUNCTIONS[name] = function
+        return function
+    return register
+
+def get_reward(reward):
+    # Returns a batched reward function given its name or the function itself
+    if callable(reward):
+        return reward
+    assert reward in REWARD_FUNCTIONS, "Unknown reward function '" + str(reward) + "'. Available reward functions: " + ', '.join(REWARD_FUNCTIONS)
+    return REWARD_FUNCTIONS[reward]
+
+# Reward used in the SAC example. It assumes that the building-agents act independently of each other, without sharing information through the reward.
+@register_reward('sac')
+def sac_reward(electricity_demand, carbon_intensity, out = None):
+    out = np.minimum(electricity_demand, 0, out = out)
+    return np.power(out, 3.0, out = out)
+
+# Reward used in the MARLISA example with information_sharing = True. The reward sent to each agent has an individual and a collective component.
+@register_reward('marlisa')
+def marlisa_reward(electricity_demand, carbon_intensity, out = None):
+    total_electricity_demand = np.maximum(-electricity_demand.sum(axis=-1, keepdims=True), 0)
+    return np.multiply(np.sign(electricity_demand)*0.01*np.abs(electricity_demand)**2, total_electricity_demand, out = out)
+
+# Reward for the centralized agent. All the buildings receive the same reward.
+@register_reward('central')
+def central_reward(electricity_demand, carbon_intensity, out = None):
+    out = np.maximum(-electricity_demand.sum(axis=-1), 0, out = out)
+    return np.power(out, 3.0, out = out)
+
 # Reward used in the CityLearn Challenge. Reward function for the multi-agent (decentralized) agents.
 class reward_function_ma:
     def __init__(self, n_agents, building_info):
         self.n_agents = n_agents
         self.building_info = building_info
 
-    # electricity_demand contains negative values when the building consumes more electricity than it generates
-    def get_rewards(self, electricity_demand, carbon_intensity):
+    # electricity_demand contains negative values when the building consumes more electricity than it generates. If out, a float32 array (1, n_agents), is given, electricity_demand (1, n_agents) and carbon_intensity (1,) must be float32 arrays with a batch of one time-step, and the rewards are written into out instead of being returned as a list
+    def get_rewards(self, electricity_demand, carbon_intensity, out = None):
         
         # You can edit what comes next and customize it for The CityLearn Challenge
-        electricity_demand = np.float32(electricity_demand)
-        total_electricity_demand = 0
-        for e in electricity_demand:
-            total_electricity_demand += -e
-            
-        electricity_demand = np.array(electricity_demand)
+        if out is None:
+            electricity_demand, carbon_intensity = np.float32(electricity_demand)[np.newaxis], np.float32([carbon_intensity])
         
         using_marlisa = False
         # Use this reward function when running the MARLISA example with information_sharing = True. The reward sent to each agent will have an individual and a collective component.
         if using_marlisa:
-            return list(np.sign(electricity_demand)*0.01*(np.array(np.abs(electricity_demand))**2 * max(0, total_electricity_demand)))
+            rewards = marlisa_reward(electricity_demand, carbon_intensity, out = out)
         
         else:
             
             # Use this reward when running the SAC example. It assumes that the building-agents act independently of each other, without sharing information through the reward.
-            reward_ = np.array(electricity_demand)**3.0
-            reward_[reward_>0] = 0
-            return list(reward_)
-    
-      
+            rewards = sac_reward(electricity_demand, carbon_intensity, out = out)
+            
+        return list(rewards[0]) if out is None else out
+        
         
         
         
@@ -46,8 +76,4 @@ class reward_function_ma:
 # Reward function for the centralized agent. To be used only if all the buildings receive the same reward.
 def reward_function_sa(electricity_demand):
 
-    reward_ = -np.array(electricity_demand).sum()
-    reward_ = max(0, reward_)
-    reward_ = reward_**3.0
-    
-    return reward_
\ No newline at end of file
+    return central_reward(np.array(electricity_demand)[np.newaxis], None)[0]
@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+DATA_PATH = ROOT / 'data' / 'Climate_Zone_5'
+BUILDINGS_STATES_ACTIONS = str(ROOT / 'buildings_state_action_space.json')
+
+# Arguments of CityLearn that load the data of the climate zone 5
+DATA_PARAMS = {'data_path': DATA_PATH,
+               'building_attributes': 'building_attributes.json',
+               'weather_file': 'weather_data.csv',
+               'solar_profile': 'solar_generation_1kW.csv',
+               'carbon_intensity': 'carbon_intensity.csv',
+               'buildings_states_actions': BUILDINGS_STATES_ACTIONS}
+
+@pytest.fixture
+def make_env():
+    """
+    Returns a function that creates a CityLearn environment with the first buildings of the climate zone 5 over a short window (one week by default). Any other argument of CityLearn can be given.
+    """
+
+    from citylearn import CityLearn
+    def make(building_ids = ('Building_1', 'Building_2', 'Building_3'), simulation_period = (0, 167), **kwargs):
+        return CityLearn(**DATA_PARAMS, building_ids = list(building_ids), simulation_period = simulation_period, **kwargs)
+    return make
+
+def random_actions(env, n_steps, seed = 0):
+    """
+    Returns:
+        actions (list): random actions of every building for n_steps time-steps, as lists with the actions of every building
+    """
+
+    rng = np.random.default_rng(seed)
+    return [[rng.uniform(space.low, space.high) for space in env.action_spaces] for _ in range(n_steps)]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+gym = pytest.importorskip('gym')
+
+from common.preprocessing import CompiledEncoder, normalize, periodic_normalization, remove_feature
+from common.rl import BatchedPolicy, PolicyNetwork
+
+def _policy():
+    # Two buildings whose policies have the same shape, one of which has a removed state, and a building with a policy of another shape
+    torch.manual_seed(0)
+    building_ids = ['Building_1', 'Building_2', 'Building_3']
+    encoders = {'Building_1': CompiledEncoder([periodic_normalization(24), normalize(0, 10), remove_feature()]),
+                'Building_2': CompiledEncoder([periodic_normalization(24), normalize(-5, 5)]),
+                'Building_3': CompiledEncoder([normalize(0, 1)])}
+    action_dims = {'Building_1': 2, 'Building_2': 2, 'Building_3': 1}
+    policies = {uid: PolicyNetwork(encoders[uid].output_dim, action_dims[uid], gym.spaces.Box(-1, 1, (action_dims[uid],)), 0.5, [8, 8]) for uid in building_ids}
+    batched_policy = BatchedPolicy(building_ids, policies, encoders, torch.device('cpu'))
+    for uid in building_ids:
+        batched_policy.set_transform(uid, 2*np.eye(encoders[uid].output_dim), np.full(encoders[uid].output_dim, -1.))
+    return batched_policy, policies, encoders
+
+def test_batched_actions_match_every_policy():
+    batched_policy, policies, encoders = _policy()
+    states = [np.array([3., 4., 7.]), np.array([13., -2.]), np.array([0.4])]
+    actions = batched_policy.select_action(states, deterministic = True)
+    for i, (uid, state) in enumerate(zip(batched_policy.building_ids, states)):
+        inputs = torch.tensor(2*encoders[uid].encode(state) - 1, dtype=torch.float32)
+        expected = policies[uid].act(inputs, deterministic = True).detach().numpy()
+        assert np.allclose(actions[i, :len(expected)], expected, atol = 1e-6) and np.all(actions[i, len(expected):] == 0)
+
+def test_padded_states_give_the_same_actions():
+    batched_policy, _, _ = _policy()
+    states = [np.array([3., 4., 7.]), np.array([13., -2.]), np.array([0.4])]
+    padded = np.zeros((3, 3), dtype=np.float32)
+    for i, state in enumerate(states):
+        padded[i, :len(state)] = state
+    assert np.array_equal(batched_policy.select_action(padded, deterministic = True), batched_policy.select_action([state.astype(np.float32) for state in states], deterministic = True))
+    with pytest.raises(AssertionError):
+        batched_policy.select_action(padded[:, None], deterministic = True)
+
+def test_actions_require_every_transform():
+    batched_policy, policies, encoders = _policy()
+    batched_policy = BatchedPolicy(batched_policy.building_ids, policies, encoders, torch.device('cpu'))
+    with pytest.raises(AssertionError):
+        batched_policy.select_action([np.zeros(3), np.zeros(2), np.zeros(1)])
@@ -0,0 +1,22 @@
+import numpy as np
+
+from common.preprocessing import is_unavailable_state
+
+def test_lag_state_is_the_shifted_series(make_env):
+    env = make_env()
+    sim_results = env.buildings['Building_1'].sim_results
+    load, lag = np.array(sim_results['non_shiftable_load']), np.array(sim_results['non_shiftable_load_lag_24h'])
+    assert np.array_equal(lag[24:], load[:-24]) and np.all(lag[:24] == load[0])
+
+def test_lag_state_is_observed(make_env):
+    env = make_env()
+    states = env.reset()
+    assert env.buildings_states_actions['Building_1']['states']['non_shiftable_load_lag_24h']
+    assert states[0][-1] == np.float32(env.buildings['Building_1'].sim_results['non_shiftable_load_lag_24h'][env.time_step])
+
+def test_unavailable_states_are_found_by_name():
+    building_info = {'solar_power_capacity (kW)': 0, 'Annual_DHW_demand (kWh)': 0, 'Annual_cooling_demand (kWh)': 1, 'Annual_nonshiftable_electrical_demand (kWh)': 1}
+    for state_name in ['diffuse_solar_rad_pred_6h', 'solar_gen', 'solar_gen_lag_24h', 'dhw_storage_soc']:
+        assert is_unavailable_state(state_name, building_info)
+    for state_name in ['t_out', 'cooling_storage_soc', 'non_shiftable_load_lag_24h', 'hour_sin']:
+        assert not is_unavailable_state(state_name, building_info)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from conftest import BUILDINGS_STATES_ACTIONS, DATA_PATH, random_actions
+from district_generator import generate_district, load_district, write_district
+
+def _district(seed = 0):
+    return generate_district(DATA_PATH, 4, buildings_states_actions = BUILDINGS_STATES_ACTIONS, n_hours = 48, seed = seed)
+
+def test_districts_are_reproducible_with_the_same_seed():
+    districts = [_district(0), _district(0), _district(1)]
+    assert districts[0]['building_attributes'] == districts[1]['building_attributes']
+    assert all(districts[0]['profiles'][uid].equals(districts[1]['profiles'][uid]) for uid in districts[0]['profiles'])
+    assert districts[0]['building_attributes'] != districts[2]['building_attributes']
+
+def test_district_in_memory_matches_the_written_district(tmp_path):
+    from citylearn import CityLearn
+    district = _district()
+    envs = [CityLearn(**write_district(district, tmp_path, DATA_PATH), data_cache = False), CityLearn(**load_district(district, DATA_PATH))]
+    assert envs[0].buildings_states_actions == envs[1].buildings_states_actions
+    states = [env.reset() for env in envs]
+    for action in random_actions(envs[0], 47):
+        (s0, r0, _, _), (s1, r1, _, _) = [env.step(action) for env in envs]
+        assert all(np.array_equal(x, y) for x, y in zip(s0, s1)) and np.array_equal(r0, r1)
+    assert np.array_equal(envs[0].net_electric_consumption, envs[1].net_electric_consumption)
+
+def test_agents_take_the_states_and_actions_of_a_district_in_memory():
+    pytest.importorskip('torch')
+    from citylearn import CityLearn
+    from agents.sac import SAC
+    env = CityLearn(**load_district(_district(), DATA_PATH))
+    observation_spaces, action_spaces = env.get_state_action_spaces()
+    agent = SAC(env.building_ids, env.buildings_states_actions, env.get_building_information(), observation_spaces = observation_spaces, action_spaces = action_spaces, hidden_dim = [8, 8])
+    assert agent.buildings_states_actions is env.buildings_states_actions
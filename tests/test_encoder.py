@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from common.preprocessing import CompiledEncoder, no_normalization, normalize, onehot_encoding, periodic_normalization, remove_feature
+
+def _encoders(env, uid):
+    # Encoders of the states of a building, as built by the SAC agent
+    observation_space = env.observation_spaces[env.building_ids.index(uid)]
+    encoder = []
+    state_names = [s_name for s_name, s in env.buildings_states_actions[uid]['states'].items() if s]
+    for state_n, s_name in enumerate(state_names):
+        if s_name in ['month', 'hour']:
+            encoder.append(periodic_normalization(observation_space.high[state_n]))
+        elif s_name == 'day':
+            encoder.append(onehot_encoding([1,2,3,4,5,6,7,8]))
+        elif s_name == 'daylight_savings_status':
+            encoder.append(onehot_encoding([0,1]))
+        elif s_name == 'net_electricity_consumption':
+            encoder.append(remove_feature())
+        elif s_name == 'carbon_intensity':
+            encoder.append(no_normalization())
+        else:
+            encoder.append(normalize(observation_space.low[state_n], observation_space.high[state_n]))
+    return encoder
+
+def _encode(encoder, state):
+    return np.hstack([feature*x for feature, x in zip(encoder, state) if not isinstance(feature, remove_feature)])
+
+def test_compiled_encoder_matches_the_encoders(make_env):
+    env = make_env()
+    states = [env.reset()]
+    for _ in range(30):
+        states.append(env.step([space.sample() for space in env.action_spaces])[0])
+    for i, uid in enumerate(env.building_ids):
+        encoder = _encoders(env, uid)
+        compiled = CompiledEncoder(encoder)
+        batch = np.array([state[i] for state in states])
+        expected = np.array([_encode(encoder, state) for state in batch])
+        assert compiled.output_dim == expected.shape[1]
+        assert np.allclose(compiled.encode(batch), expected, atol = 1e-12)
+        assert np.allclose(compiled.encode(batch[0]), expected[0], atol = 1e-12)
+
+def test_concatenated_encoders_encode_the_concatenated_states():
+    encoders = [CompiledEncoder([periodic_normalization(24), onehot_encoding([0, 1])]), CompiledEncoder([normalize(0, 2), remove_feature(), onehot_encoding([1, 2, 3])])]
+    states = [np.array([5., 1.]), np.array([1., 7., 3.])]
+    assert np.array_equal(CompiledEncoder.concatenate(encoders).encode(np.concatenate(states)), np.concatenate([encoder.encode(state) for encoder, state in zip(encoders, states)]))
+
+def test_onehot_state_outside_of_its_classes_is_rejected():
+    encoder = [normalize(0, 1), onehot_encoding([1, 2, 3]), onehot_encoding([0, 1])]
+    compiled = CompiledEncoder(encoder)
+    with pytest.raises(IndexError):
+        _encode(encoder, [0.5, 4, 1])
+    with pytest.raises(ValueError):
+        compiled.encode(np.array([0.5, 4, 1]))
+    with pytest.raises(ValueError):
+        compiled.encode(np.array([[0.5, 2, 1], [0.5, 2, 2]]))
+    assert np.array_equal(compiled.encode(np.array([0.5, 3, 0])), [0.5, 0, 0, 1, 1, 0])
@@ -0,0 +1,40 @@
+import numpy as np
+
+from citylearn import EnvTemplate
+from conftest import DATA_PARAMS, random_actions
+
+def _template():
+    return EnvTemplate(**DATA_PARAMS, building_ids = ['Building_1', 'Building_2', 'Building_3'])
+
+def _run(env, actions):
+    env.reset()
+    for action in actions:
+        env.step(action)
+    return env
+
+def test_spawned_environment_matches_a_new_environment(make_env):
+    env = make_env()
+    actions = random_actions(env, 167)
+    spawned = _run(_template().spawn(simulation_period = (0, 167)), actions)
+    _run(env, actions)
+    assert np.array_equal(spawned.net_electric_consumption, env.net_electric_consumption)
+    assert spawned.cost() == env.cost()
+
+def test_spawned_environments_share_the_data_but_not_their_state():
+    template = _template()
+    envs = [template.spawn(simulation_period = (0, 167)), template.spawn(simulation_period = (0, 167), observation_mode = 'padded')]
+    for uid in template.buildings:
+        assert envs[0].buildings[uid].sim_results is envs[1].buildings[uid].sim_results is template.buildings[uid].sim_results
+        assert envs[0].buildings[uid].electrical_storage is not envs[1].buildings[uid].electrical_storage
+    
+    _run(envs[0], random_actions(envs[0], 100))
+    envs[1].reset()
+    for uid, building in envs[1].buildings.items():
+        assert building.electrical_storage._soc == template.buildings[uid].electrical_storage._soc
+        assert building.electrical_storage.capacity == building.electrical_storage.c0
+    assert envs[0].buildings['Building_1'].electrical_storage.capacity < envs[0].buildings['Building_1'].electrical_storage.c0
+    
+    # The results of an environment simulated after another one do not depend on it
+    actions = random_actions(envs[0], 167, seed = 1)
+    results = [_run(env, actions).net_electric_consumption.copy() for env in [template.spawn(simulation_period = (0, 167)), envs[1]]]
+    assert np.array_equal(*results)
@@ -0,0 +1,54 @@
+from conftest import random_actions
+
+def test_random_windows_fit_within_the_simulation_period(make_env):
+    env = make_env(simulation_period = (0, 8759))
+    env.seed(0)
+    for _ in range(20):
+        env.reset(length = 48)
+        start, end = env.episode_period
+        assert 0 <= start and end == start + 47 and end <= 8759
+
+def test_random_windows_are_reproducible_with_the_same_seed(make_env):
+    periods = []
+    for _ in range(2):
+        env = make_env(simulation_period = (0, 8759))
+        env.seed(1)
+        for _ in range(5):
+            env.reset(length = 48)
+            periods.append(env.episode_period)
+    assert periods[:5] == periods[5:]
+
+def test_episode_covers_its_window(make_env):
+    env = make_env(simulation_period = (0, 8759))
+    env.reset(start = 100, length = 24)
+    actions = random_actions(env, 24)
+    for i, action in enumerate(actions):
+        _, _, terminal, _ = env.step(action)
+        if terminal:
+            break
+    assert i + 1 == 23 and len(env.net_electric_consumption) == 23
+
+def _degrade(env, restore_battery, n_episodes = 3):
+    battery = env.buildings['Building_1'].electrical_storage
+    for episode in range(n_episodes):
+        env.reset(start = 0, length = 168, restore_battery = restore_battery)
+        for action in random_actions(env, 167, seed = episode):
+            env.step(action)
+    return battery
+
+def test_battery_degradation_carries_over_by_default(make_env):
+    battery = _degrade(make_env(), restore_battery = False)
+    capacity = battery.capacity
+    assert capacity < battery.c0
+    
+    battery.reset()
+    assert battery.capacity == capacity
+
+def test_restore_battery_starts_every_episode_from_the_nominal_battery(make_env):
+    env = make_env()
+    battery = _degrade(env, restore_battery = False)
+    assert battery.capacity < battery.c0
+    
+    env.reset(restore_battery = True, initial_soc = {'electrical_storage': 0.5})
+    assert battery.capacity == battery.c0 and battery.efficiency == battery.efficiency0
+    assert battery._soc == 0.5*battery.c0
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from citylearn import FORECAST_SERIES
+from conftest import random_actions
+
+def _expected(env, horizon):
+    data_time_steps = env._get_data_time_steps(np.arange(env.time_step, env.time_step + horizon))
+    return np.array([[np.array(building.sim_results[series])[data_time_steps] for series in FORECAST_SERIES] for building in env.buildings.values()], dtype=np.float32).transpose(0, 2, 1)
+
+def test_forecast_is_a_read_only_view_of_the_upcoming_data(make_env):
+    env = make_env()
+    env.reset()
+    for action in random_actions(env, 24):
+        forecast = env.get_forecast(horizon = 12)
+        assert forecast.shape == (env.n_buildings, 12, len(FORECAST_SERIES))
+        assert np.array_equal(forecast, _expected(env, 12))
+        assert not forecast.flags.writeable and not forecast.flags.owndata
+        env.step(action)
+
+def test_forecast_wraps_around_the_data(make_env):
+    env = make_env(simulation_period = (8760*4 - 24, 8760*4 + 23))
+    env.reset()
+    assert np.array_equal(env.get_forecast(horizon = 48), _expected(env, 48))
+
+def test_forecast_across_the_years_of_year_order(make_env):
+    env = make_env(simulation_period = (8760 - 12, 8760 + 11), year_order = [2, 0])
+    env.reset()
+    forecast = env.get_forecast(horizon = 24)
+    assert np.array_equal(forecast, _expected(env, 24)) and not forecast.flags.writeable
+
+def test_forecast_noise_grows_with_the_lead_time(make_env):
+    env = make_env(forecast_noise = 0.05)
+    env.seed(0)
+    env.reset()
+    forecast, exact = env.get_forecast(horizon = 24), _expected(env, 24)
+    assert not forecast.flags.writeable
+    assert np.array_equal(forecast[:, 0], exact[:, 0]) and not np.array_equal(forecast, exact)
+    
+    env = make_env(forecast_noise = lambda forecast, np_random: forecast + 1)
+    env.reset()
+    assert np.array_equal(env.get_forecast(horizon = 6), _expected(env, 6) + 1)
@@ -0,0 +1,58 @@
+import copy
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+gym = pytest.importorskip('gym')
+
+from common.rl import GroupedPolicyNetwork, GroupedSoftQNetwork, PolicyNetwork, SoftQNetwork
+
+N_NETWORKS, BATCH_SIZE, STATE_DIM, ACTION_DIM = 3, 32, 6, 2
+
+def _inputs(seed = 0):
+    generator = torch.Generator().manual_seed(seed)
+    state = torch.rand((N_NETWORKS, BATCH_SIZE, STATE_DIM), generator = generator)
+    action = 2*torch.rand((N_NETWORKS, BATCH_SIZE, ACTION_DIM), generator = generator) - 1
+    target = torch.randn((N_NETWORKS, BATCH_SIZE, 1), generator = generator)
+    return state, action, target
+
+def test_grouped_networks_match_every_network():
+    torch.manual_seed(0)
+    critics = [SoftQNetwork(STATE_DIM, ACTION_DIM, [16, 16]) for _ in range(N_NETWORKS)]
+    policies = [PolicyNetwork(STATE_DIM, ACTION_DIM, gym.spaces.Box(-1, 1, (ACTION_DIM,)), 0.5, [16, 16]) for _ in range(N_NETWORKS)]
+    critic, policy = GroupedSoftQNetwork(critics), GroupedPolicyNetwork(policies)
+    state, action, _ = _inputs()
+    with torch.no_grad():
+        q, (mean, log_std) = critic(state, action), policy(state)
+        for i in range(N_NETWORKS):
+            assert torch.allclose(q[i], critics[i](state[i], action[i]), atol = 1e-6)
+            assert torch.allclose(mean[i], policies[i](state[i])[0], atol = 1e-6) and torch.allclose(log_std[i], policies[i](state[i])[1], atol = 1e-6)
+            assert torch.allclose(policy.act(state, deterministic = True)[i], policies[i].act(state[i], deterministic = True), atol = 1e-6)
+
+def test_grouped_update_matches_the_update_of_every_network():
+    # Same Adam updates of the critics as in SAC.update_group (sum of the mean losses of the networks) and as in the update of every building on its own
+    torch.manual_seed(0)
+    critics = [SoftQNetwork(STATE_DIM, ACTION_DIM, [16, 16]) for _ in range(N_NETWORKS)]
+    copies = copy.deepcopy(critics)
+    critic = GroupedSoftQNetwork(critics)
+    optimizer = torch.optim.Adam(critic.parameters(), lr = 3e-4)
+    optimizers = [torch.optim.Adam(network.parameters(), lr = 3e-4) for network in copies]
+    criterion = torch.nn.SmoothL1Loss()
+    
+    for step in range(10):
+        state, action, target = _inputs(step)
+        loss = criterion(critic(state, action), target)*N_NETWORKS
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        for i, network in enumerate(copies):
+            loss = criterion(network(state[i], action[i]), target[i])
+            optimizers[i].zero_grad()
+            loss.backward()
+            optimizers[i].step()
+    
+    # The networks of the group are views of the weights of the group
+    for grouped, single in zip(critics, copies):
+        for x, y in zip(grouped.parameters(), single.parameters()):
+            assert torch.allclose(x, y, rtol = 0, atol = 2e-7)
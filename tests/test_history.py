@@ -0,0 +1,43 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from conftest import random_actions
+
+def test_history_holds_the_last_padded_states(make_env):
+    envs = [make_env(observation_mode = 'padded'), make_env(observation_mode = 'padded', history_length = 4)]
+    state, history = [env.reset() for env in envs]
+    # After a reset the history is filled with the initial states
+    expected = deque([state.copy()]*4, maxlen = 4)
+    for action in random_actions(envs[0], 30):
+        assert history.shape == (envs[1].n_buildings, 4) + envs[1].observation_mask.shape[1:]
+        assert np.array_equal(history, np.stack(expected, axis = 1))
+        assert not history.flags.writeable and not history.flags.owndata
+        (state, _, _, _), (history, _, _, _) = [env.step(action) for env in envs]
+        expected.append(state.copy())
+
+def test_history_of_step_n_and_step_into(make_env):
+    envs = [make_env(observation_mode = 'padded', history_length = 3) for _ in range(3)]
+    for env in envs:
+        env.reset()
+    actions = random_actions(envs[0], 12)
+    for action in actions:
+        history, _, _, _ = envs[0].step(action)
+        
+    # The time-steps skipped by step_n(last_only=True) are still pushed into the history
+    states, _, _, _ = envs[1].step_n(actions[:6])
+    assert np.array_equal(states[-1], envs[1].get_history())
+    last, _, _, _ = envs[1].step_n(actions[6:], last_only = True)
+    assert np.array_equal(last, history)
+    
+    obs_out, reward_out = np.zeros(envs[2].observation_mask.shape, dtype=np.float32), np.zeros(envs[2].n_buildings, dtype=np.float32)
+    for action in actions:
+        envs[2].step_into(action, obs_out, reward_out)
+    assert np.array_equal(obs_out, history[:, -1]) and np.array_equal(envs[2].get_history(), history)
+
+def test_history_requires_history_length(make_env):
+    env = make_env(observation_mode = 'padded')
+    env.reset()
+    with pytest.raises(AssertionError):
+        env.get_history()
@@ -0,0 +1,67 @@
+import numpy as np
+
+from conftest import random_actions
+
+def _padded(env, object_states):
+    padded = np.zeros(env.observation_mask.shape, dtype=np.float32)
+    for i, state in enumerate(object_states):
+        padded[i, :len(state)] = state
+    return padded
+
+def test_padded_states_match_the_object_states(make_env):
+    envs = [make_env(observation_mode = mode) for mode in ['object', 'padded']]
+    object_states, padded_states = [env.reset() for env in envs]
+    for action in random_actions(envs[0], 167):
+        assert padded_states.dtype == np.float32 and padded_states.shape == envs[1].observation_mask.shape
+        assert np.array_equal(padded_states, _padded(envs[1], object_states))
+        assert np.all(padded_states[~envs[1].observation_mask] == 0)
+        (object_states, _, _, _), (padded_states, _, terminal, _) = [env.step(action) for env in envs]
+    assert terminal
+    assert envs[0].cost() == envs[1].cost()
+
+def test_padded_actions_match_the_actions_of_every_building(make_env):
+    envs = [make_env(observation_mode = 'padded') for _ in range(2)]
+    for env in envs:
+        env.reset()
+    for action in random_actions(envs[0], 48):
+        # The actions are float32 in both layouts, so that they are the same
+        action = [building_action.astype(np.float32) for building_action in action]
+        padded_action = np.zeros(envs[0].action_mask.shape, dtype=np.float32)
+        for i, building_action in enumerate(action):
+            padded_action[i, :len(building_action)] = building_action
+        (s0, r0, _, _), (s1, r1, _, _) = envs[0].step(action), envs[1].step(padded_action)
+        assert np.array_equal(s0, s1) and np.array_equal(r0, r1)
+
+def test_names_of_the_padded_states(make_env):
+    env = make_env(observation_mode = 'padded')
+    for i, uid in enumerate(env.building_ids):
+        state_names = [state_name for state_name, value in env.buildings_states_actions[uid]['states'].items() if value]
+        assert list(env.observation_names[i, env.observation_mask[i]]) == state_names
+
+def test_shared_states_match_the_other_layouts(make_env):
+    envs = [make_env(observation_mode = mode) for mode in ['object', 'padded', 'shared']]
+    object_states, padded_states, (exogenous, endogenous) = [env.reset() for env in envs]
+    shared = envs[2]
+    assert len(exogenous) == len(shared.exogenous_names) and endogenous.shape == (shared.n_buildings, len(shared.endogenous_names))
+    for action in random_actions(envs[0], 167):
+        assert np.array_equal(shared.broadcast_state(exogenous, endogenous, layout = 'padded'), padded_states)
+        # The object states computed by step() are float64, and the shared states float32
+        assert all(np.array_equal(x, np.float32(y)) for x, y in zip(shared.broadcast_state(exogenous, endogenous), object_states))
+        (object_states, _, _, _), (padded_states, _, _, _), ((exogenous, endogenous), _, terminal, _) = [env.step(action) for env in envs]
+    assert terminal
+    assert envs[0].cost() == envs[2].cost()
+
+def test_shared_states_are_not_repeated(make_env):
+    env = make_env(observation_mode = 'shared')
+    for names in [['month', 'hour', 't_out', 'carbon_intensity'], ['non_shiftable_load', 'electrical_storage_soc', 'non_shiftable_load_lag_24h']]:
+        assert all((name in env.exogenous_names) == (names[0] == 'month') for name in names)
+    assert not set(env.exogenous_names) & set(env.endogenous_names)
+
+def test_batches_of_shared_states_are_broadcast(make_env):
+    env = make_env(observation_mode = 'shared')
+    env.reset()
+    states, _, _, _ = env.step_n(random_actions(env, 5))
+    exogenous, endogenous = states
+    padded = env.broadcast_state(exogenous, endogenous, layout = 'padded')
+    assert padded.shape == (5,) + env.observation_mask.shape
+    assert np.array_equal(padded[2], env.broadcast_state(exogenous[2], endogenous[2], layout = 'padded'))
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from conftest import random_actions
+from offline_evaluation import OfflineEvaluator
+
+def _schedule(env, n_steps, seed = 0):
+    # Random actions of every time-step with the layout of action_mask
+    schedule = np.zeros((n_steps,) + env.action_mask.shape)
+    for t, action in enumerate(random_actions(env, n_steps, seed)):
+        for i, building_action in enumerate(action):
+            schedule[t, i, :len(building_action)] = building_action
+    return schedule
+
+def _step(env, schedule, **reset_kwargs):
+    env.reset(restore_battery = True, **reset_kwargs)
+    for action in schedule:
+        _, _, terminal, _ = env.step(action)
+    assert terminal
+    return env
+
+def test_evaluation_matches_step(make_env):
+    env = make_env(observation_mode = 'padded')
+    schedule = _schedule(env, 167)
+    results = OfflineEvaluator(env).evaluate(schedule, start = 0)
+    _step(env, schedule)
+    for name in ['net_electric_consumption', 'carbon_emissions', 'electric_consumption_electric_storage', 'electric_consumption_cooling_storage', 'electric_consumption_dhw_storage', 'net_electric_consumption_no_storage']:
+        assert np.allclose(results[name], getattr(env, name), rtol = 1e-6, atol = 1e-6), name
+    cost = env.cost()
+    for name, value in results['cost_normalized'].items():
+        assert value == pytest.approx(cost[name], rel = 1e-6), name
+
+def test_evaluation_matches_step_from_a_state_of_charge(make_env):
+    env = make_env(simulation_period = (0, 8759), observation_mode = 'padded')
+    schedule = _schedule(env, 47, seed = 1)
+    results = OfflineEvaluator(env).evaluate(schedule, start = 1000, initial_soc = 0.5)
+    _step(env, schedule, start = 1000, length = 48, initial_soc = 0.5)
+    assert np.allclose(results['net_electric_consumption'], env.net_electric_consumption, rtol = 1e-6, atol = 1e-6)
+
+def test_batch_of_schedules_matches_every_schedule(make_env):
+    env = make_env()
+    evaluator = OfflineEvaluator(env)
+    schedules = np.stack([_schedule(env, 48, seed) for seed in range(3)])
+    batch = evaluator.evaluate(schedules, start = 0)
+    for k, schedule in enumerate(schedules):
+        single = evaluator.evaluate(schedule, start = 0)
+        assert np.array_equal(batch['net_electric_consumption'][k], single['net_electric_consumption'])
+        assert all(batch['cost'][name][k] == pytest.approx(value) for name, value in single['cost'].items())
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from common.rl import ReplayBuffer
+
+def _filled(n = 100, state_dim = 4, **kwargs):
+    buffer = ReplayBuffer(n, **kwargs)
+    for i in range(n):
+        buffer.push(np.full(state_dim, i/n), [i], i, np.full(state_dim, (i + 1)/n), False)
+    return buffer
+
+def test_push_wraps_around_the_capacity():
+    buffer = ReplayBuffer(10)
+    for i in range(25):
+        buffer.push([i, i], [i], i, [i + 1, i + 1], False)
+    assert len(buffer) == 10 and buffer.position == 5
+    assert sorted(buffer.reward) == list(range(15, 25))
+
+def test_batches_are_drawn_without_replacement():
+    buffer = _filled(seed = 0)
+    for _ in range(20):
+        _, _, reward, _, _ = buffer.sample(100)
+        assert len(np.unique(reward)) == 100
+    with pytest.raises(ValueError):
+        buffer.sample(101)
+
+def test_batches_can_be_drawn_with_replacement():
+    _, _, reward, _, _ = _filled(replace = True, seed = 0).sample(1000)
+    assert len(reward) == 1000 and len(np.unique(reward)) <= 100
+
+def test_batches_depend_only_on_the_seed_of_the_buffer():
+    np.random.seed(0)
+    batch = _filled(seed = (3, 1)).sample(32)
+    np.random.seed(1)
+    assert all(np.array_equal(x, y) for x, y in zip(batch, _filled(seed = (3, 1)).sample(32)))
+    assert not np.array_equal(batch[2], _filled(seed = (3, 2)).sample(32)[2])
+
+def test_sampled_transitions_are_consistent():
+    state, action, reward, next_state, done = _filled(seed = 0).sample(32)
+    assert state.dtype == next_state.dtype == np.float32
+    assert np.allclose(state[:, 0], reward/100) and np.allclose(next_state[:, 0], (reward + 1)/100) and np.array_equal(action[:, 0], reward)
+
+def _trajectory(buffer, n = 50, state_dim = 3, seed = 0):
+    # Transitions of episodes of 10 time-steps, whose next states are the states of the following transitions within an episode
+    states = np.random.default_rng(seed).uniform(0, 1, (n + 1, state_dim))
+    for i in range(n):
+        next_state = states[i + 1] if (i + 1) % 10 else np.random.default_rng(i).uniform(0, 1, state_dim)
+        buffer.push(states[i], [0.], i, next_state, False)
+    return buffer
+
+@pytest.mark.parametrize('state_dtype', [np.float32, np.float16, np.uint8])
+def test_shared_next_states_are_stored_like_the_states(state_dtype):
+    buffers = [_trajectory(ReplayBuffer(50, state_dtype = state_dtype, share_next_state = share, seed = 0)) for share in [False, True]]
+    batches = [buffer.sample(50) for buffer in buffers]
+    for x, y in zip(*batches):
+        assert np.array_equal(x, y)
+    # The next states of the ends of the episodes, and of the last transition, are kept apart
+    assert sorted(buffers[1]._next_states) == [9, 19, 29, 39, 49]
+    assert all(state.dtype == np.dtype(state_dtype) for state in buffers[1]._next_states.values())
+
+def test_memory_mapped_buffer_matches_the_buffer_in_memory(tmp_path):
+    batches = [_trajectory(ReplayBuffer(50, seed = 0, path = path)).sample(20) for path in [None, str(tmp_path)]]
+    for x, y in zip(*batches):
+        assert np.array_equal(x, y)
+
+def test_transforms_are_applied_when_the_batches_are_sampled():
+    buffers = [_filled(seed = 0), _filled(seed = 0)]
+    stored = buffers[1].state.copy()
+    buffers[1].set_transform(lambda states: 2*states[:, :2] - 1, lambda rewards: rewards/10)
+    (state, action, reward, next_state, _), (t_state, t_action, t_reward, t_next_state, _) = [buffer.sample(32) for buffer in buffers]
+    assert np.allclose(t_state, 2*state[:, :2] - 1) and np.allclose(t_next_state, 2*next_state[:, :2] - 1)
+    assert np.allclose(t_reward, reward/10) and np.array_equal(t_action, action)
+    assert t_state.dtype == t_reward.dtype == np.float32
+    # The stored transitions are never modified
+    assert np.array_equal(buffers[1].state, stored)
+
+def test_prefetched_batch_follows_the_last_transform():
+    buffer = _filled(seed = 0, prefetch = True)
+    device = torch.device('cpu')
+    buffer.sample_tensors(16, device)
+    buffer.set_transform(state_transform = lambda states: states*0)
+    for _ in range(3):
+        state, _, _, next_state, _ = buffer.sample_tensors(16, device)
+        assert torch.all(state == 0) and torch.all(next_state == 0)
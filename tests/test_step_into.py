@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from conftest import random_actions
+
+def test_district_results_are_read_only_float64(make_env):
+    env = make_env()
+    env.reset()
+    for action in random_actions(env, 10):
+        env.step(action)
+    assert env.net_electric_consumption.dtype == env.carbon_emissions.dtype == np.float64
+    assert len(env.net_electric_consumption) == 10
+    with pytest.raises(ValueError):
+        env.net_electric_consumption[0] = 0
+
+def test_padded_step_returns_the_rewards_as_an_array(make_env):
+    envs = [make_env(observation_mode = mode) for mode in ['object', 'padded']]
+    for env in envs:
+        env.reset()
+    for action in random_actions(envs[0], 24):
+        (_, object_rewards, _, _), (_, padded_rewards, _, _) = [env.step(action) for env in envs]
+        assert isinstance(padded_rewards, np.ndarray) and padded_rewards.dtype == np.float32
+        assert np.allclose(padded_rewards, object_rewards, rtol = 1e-6)
+
+def test_step_into_matches_step(make_env):
+    envs = [make_env(observation_mode = 'padded') for _ in range(2)]
+    obs_out, reward_out = np.zeros(envs[1].observation_mask.shape, dtype=np.float32), np.zeros(envs[1].n_buildings, dtype=np.float32)
+    states = envs[0].reset()
+    assert np.array_equal(envs[1].reset_into(obs_out), states)
+    for action in random_actions(envs[0], 167):
+        states, rewards, terminal, _ = envs[0].step(action)
+        assert envs[1].step_into(action, obs_out, reward_out) == terminal
+        assert np.array_equal(obs_out, states) and np.array_equal(reward_out, rewards)
+    assert terminal
+    assert np.array_equal(envs[0].net_electric_consumption, envs[1].net_electric_consumption)
+    assert envs[0].cost() == envs[1].cost()
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from citylearn import resample
+
+SERIES = ['non_shiftable_load', 'cooling_demand', 'dhw_demand', 'solar_gen']
+
+@pytest.mark.parametrize('time_resolution', [2, 3])
+def test_resampling_preserves_the_energy_totals(make_env, time_resolution):
+    hourly, resampled = make_env(), make_env(time_resolution = time_resolution)
+    for uid in hourly.building_ids:
+        for series in SERIES:
+            assert np.isclose(np.sum(hourly.buildings[uid].sim_results[series]), np.sum(resampled.buildings[uid].sim_results[series]), rtol = 1e-9)
+        # The intensive variables are averaged
+        assert np.isclose(np.mean(hourly.buildings[uid].sim_results['t_out']), np.mean(resampled.buildings[uid].sim_results['t_out']), rtol = 1e-9)
+
+def test_episode_consumes_the_same_energy_at_any_resolution(make_env):
+    totals = []
+    for time_resolution in [1, 3]:
+        env = make_env(time_resolution = time_resolution, simulation_period = (0, 8759))
+        env.reset(start = 0, length = 72)
+        actions = [np.zeros(space.shape) for space in env.action_spaces]
+        terminal = False
+        while not terminal:
+            _, _, terminal, _ = env.step(actions)
+        assert len(env.net_electric_consumption) == 72//time_resolution - 1
+        # The last time-step of an episode is not simulated, so both episodes are compared over the 69 hours simulated with the resolution of 3 hours
+        totals.append([env.electric_consumption_appliances[:69//time_resolution].sum(), env.electric_generation[:69//time_resolution].sum()])
+    assert np.allclose(totals[0], totals[1], rtol = 1e-9)
+
+def test_resample_sums_averages_and_keeps_the_calendar():
+    data = {'energy': np.arange(7.), 'temperature': np.arange(7.), 'hour': np.arange(1., 8.)}
+    resampled = resample(data, 3, sum_columns = ['energy'], first_columns = ['hour'])
+    assert np.array_equal(resampled['energy'], [3., 12.]) and np.array_equal(resampled['temperature'], [1., 4.]) and np.array_equal(resampled['hour'], [1., 4.])
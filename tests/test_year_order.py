@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from citylearn import RBC_Agent
+
+def _run_rbc(env, **reset_kwargs):
+    # Same controller as the baseline of cost(), whose normalized costs are then all 1
+    _, action_spaces = env.get_state_action_spaces()
+    agent = RBC_Agent(action_spaces)
+    env.reset(**reset_kwargs)
+    done = False
+    while not done:
+        _, _, done, _ = env.step(agent.select_action([env.buildings['Building_1'].sim_results['hour'][env.data_time_step]]))
+    return env.cost()
+
+def test_year_order_maps_the_simulation_onto_the_given_year(make_env):
+    env = make_env(year_order = [1])
+    env.reset()
+    assert env.episode_years == [1] and env.episode_data_time_steps[0] == 8760
+    
+    # Same costs as the simulation of the second year of the data without year_order
+    costs = [_run_rbc(make_env(year_order = [1])), _run_rbc(make_env(simulation_period = (8760, 8760 + 167)))]
+    assert costs[0] == pytest.approx(costs[1])
+
+def test_costs_are_normalized_by_the_baseline_of_the_same_years(make_env):
+    env = make_env(simulation_period = (0, 2*8760 - 1), year_order = 'shuffle')
+    env.seed(0)
+    seen_years = set()
+    for _ in range(3):
+        # The baseline starts from nominal batteries, as the episodes with restore_battery
+        costs = _run_rbc(env, length = 48, restore_battery = True)
+        seen_years.add(tuple(env.episode_years))
+        assert env.cost_rbc_key == (env.episode_period, tuple(env.episode_years))
+        assert all(value == pytest.approx(1) for value in costs.values())
+    assert len(seen_years) > 1
+
+def test_year_order_repeats_over_long_periods(make_env):
+    env = make_env(simulation_period = (0, 3*8760 - 1), year_order = [2, 0])
+    env.reset()
+    assert env.episode_years == [2, 0, 2]
+    data_time_steps = np.array(env.episode_data_time_steps)
+    assert data_time_steps[0] == 2*8760 and data_time_steps[8760] == 0 and data_time_steps[2*8760] == 2*8760
+
+def test_invalid_year_order_is_rejected(make_env):
+    with pytest.raises(AssertionError):
+        make_env(year_order = 'random')
+    with pytest.raises(AssertionError):
+        make_env(year_order = [4])